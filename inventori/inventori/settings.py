@@ -101,10 +101,51 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the shared in-memory database, whose table locks fail
+        # concurrent writers at once instead of letting them wait (inventory.tests)
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# Shared across workers in production, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# and CACHE_LOCATION=redis://127.0.0.1:6379/1
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='inventori'),
+    }
+}
+
+# Seconds a cached stock quantity is kept (entries are also invalidated on every stock change)
+STOCK_CACHE_TIMEOUT = 300
+
+# SKU lookups for scans: seconds kept in the shared cache, and size / seconds of each process' own LRU
+SKU_CACHE_TIMEOUT = 3600
+SKU_LRU_SIZE = 10000
+SKU_LRU_TTL = 30
+
+# Inventory valuation method: 'AVERAGE' (weighted average) or 'FIFO'
+INVENTORY_VALUATION_METHOD = config('INVENTORY_VALUATION_METHOD', default='AVERAGE')
+
+# Maintain stock.qty with database triggers on stock_move inserts (SQLite/PostgreSQL);
+# install them with `migrate` or `manage.py stock_triggers install` after switching on
+INVENTORY_STOCK_TRIGGERS = config('INVENTORY_STOCK_TRIGGERS', default=False, cast=bool)
+
+# Where open POS carts live: 'database' (DRAFT sales with stock reservations) or
+# 'cache' (per-cashier cart in the cache, written to the database only at checkout)
+POS_CART_STORE = config('POS_CART_STORE', default='database')
+
+# Seconds an untouched cache cart is kept before it expires
+POS_CART_TIMEOUT = config('POS_CART_TIMEOUT', default=8 * 60 * 60, cast=int)
+
+# Seconds without cart changes after which a DRAFT sale counts as abandoned; `manage.py expire_draft_sales`
+# cancels such drafts and releases the stock they reserved
+POS_DRAFT_TIMEOUT = config('POS_DRAFT_TIMEOUT', default=8 * 60 * 60, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,144 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Stock, StockReservation
+
+STOCK_CACHE_TIMEOUT = getattr(settings, 'STOCK_CACHE_TIMEOUT', 300)
+
+# Cached quantity kinds and the table each one is loaded from
+SOURCES = {
+    'stock': Stock,
+    'reserved': StockReservation,
+}
+
+
+def _version_key(product_id, warehouse_id, kind='stock'):
+    return f'{kind}:version:{product_id}:{warehouse_id}'
+
+
+def _key(product_id, warehouse_id, kind, version):
+    return f'{kind}:{product_id}:{warehouse_id}:{version}'
+
+
+def _versions(version_keys):
+    """
+    Current version of each quantity; pairs without one get a fresh version
+    """
+    versions = cache.get_many(version_keys)
+    missing = {key: uuid.uuid4().hex for key in version_keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def _get_many(kinds, product_ids, warehouse_id):
+    """
+    Cached quantities of the given kinds as {kind: {product_id: qty}}.
+    Two cache round trips (versions, then values), plus one query per kind
+    for what was not cached.
+    
+    Values are stored under the version read before the database query, so
+    a reader that loads a quantity just before another transaction commits
+    writes it under a version that the commit has already replaced, and
+    nobody reads it again.
+    """
+    product_ids = list(product_ids)
+    pairs = [(kind, product_id) for kind in kinds for product_id in product_ids]
+    version_keys = {(kind, product_id): _version_key(product_id, warehouse_id, kind) for kind, product_id in pairs}
+    versions = _versions(list(version_keys.values()))
+    keys = {
+        _key(product_id, warehouse_id, kind, versions[version_keys[(kind, product_id)]]): (kind, product_id)
+        for kind, product_id in pairs
+    }
+    cached = cache.get_many(keys.keys())
+    result = {kind: {} for kind in kinds}
+    for key, qty in cached.items():
+        kind, product_id = keys[key]
+        result[kind][product_id] = qty
+
+    for kind in kinds:
+        missing = [product_id for product_id in product_ids if product_id not in result[kind]]
+        if not missing:
+            continue
+        loaded = dict.fromkeys(missing, 0)
+        loaded.update(SOURCES[kind].objects.filter(
+            product_id__in=missing,
+            warehouse_id=warehouse_id
+        ).values_list('product_id', 'qty'))
+        cache.set_many(
+            {
+                _key(product_id, warehouse_id, kind, versions[version_keys[(kind, product_id)]]): qty
+                for product_id, qty in loaded.items()
+            },
+            STOCK_CACHE_TIMEOUT
+        )
+        result[kind].update(loaded)
+
+    return result
+
+
+def get_stock_qty(product_id, warehouse_id):
+    """
+    Stock quantity for one product in one warehouse, served from the cache
+    """
+    return get_stock_qtys([product_id], warehouse_id)[product_id]
+
+
+def get_stock_qtys(product_ids, warehouse_id):
+    """
+    Stock quantities for many products in one warehouse as {product_id: qty}.
+    One cache round trip, plus one query for the products that were not cached.
+    """
+    return _get_many(['stock'], product_ids, warehouse_id)['stock']
+
+
+def get_available_qtys(product_ids, warehouse_id):
+    """
+    Stock, reserved and available-to-promise quantities for many products in
+    one warehouse as {product_id: (stock, reserved, available)}, from one
+    cache round trip (the reservations are maintained by the POS, so nothing
+    is summed at request time)
+    """
+    quantities = _get_many(['stock', 'reserved'], product_ids, warehouse_id)
+    return {
+        product_id: (
+            quantities['stock'][product_id],
+            quantities['reserved'][product_id],
+            max(quantities['stock'][product_id] - quantities['reserved'][product_id], 0)
+        )
+        for product_id in product_ids
+    }
+
+
+def get_available_qty(product_id, warehouse_id):
+    """
+    (stock, reserved, available) for one product in one warehouse
+    """
+    return get_available_qtys([product_id], warehouse_id)[product_id]
+
+
+def _invalidate_on_commit(pairs, kind):
+    version_keys = [_version_key(product_id, warehouse_id, kind) for product_id, warehouse_id in pairs]
+    if version_keys:
+        transaction.on_commit(lambda: cache.set_many({key: uuid.uuid4().hex for key in version_keys}, None))
+
+
+def invalidate_stock_on_commit(pairs):
+    """
+    Move cached quantities for (product_id, warehouse_id) pairs to a new
+    version once the transaction commits. A value loaded before the commit
+    was stored under the old version, so it is never served again even if
+    it is written back after the commit.
+    Call this after bulk_update()/update(), which do not send model signals.
+    """
+    _invalidate_on_commit(pairs, 'stock')
+
+
+def invalidate_reserved_on_commit(pairs):
+    """
+    Same as invalidate_stock_on_commit() for the reserved quantities
+    """
+    _invalidate_on_commit(pairs, 'reserved')
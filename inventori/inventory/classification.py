@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from sales.models import SaleItem
+from .models import Stock, ItemClass
+
+# Cumulative revenue share limits for the A and B classes
+ABC_LIMITS = (0.80, 0.95)
+# Coefficient of variation limits for the X and Y classes
+XYZ_LIMITS = (0.5, 1.0)
+
+
+def load_sales(days=365):
+    """
+    Weekly sold quantity and revenue per (product, warehouse) of paid sales
+    in the last `days` days (whole weeks, the current week excluded), from one
+    aggregated SaleItem query.
+    Returns (keys, weekly quantity matrix, revenue vector).
+    """
+    today = timezone.localdate()
+    weeks = max(days // 7, 1)
+    first_week = today - timedelta(days=today.weekday() + 7 * weeks)
+    since = timezone.make_aware(datetime.combine(first_week, datetime.min.time()))
+    until = since + timedelta(weeks=weeks)
+
+    index = {}
+    rows, cols, qtys, revenues = [], [], [], []
+    weekly = SaleItem.objects.filter(
+        sale__status='PAID', sale__sold_at__gte=since, sale__sold_at__lt=until
+    ).values(
+        'product_id', 'sale__warehouse_id', week=TruncWeek('sale__sold_at')
+    ).annotate(
+        sold_qty=Sum('qty'), revenue=Sum(F('qty') * F('price'))
+    ).order_by()
+    for row in weekly:
+        key = (row['product_id'], row['sale__warehouse_id'])
+        rows.append(index.setdefault(key, len(index)))
+        cols.append((timezone.localtime(row['week']).date() - first_week).days // 7)
+        qtys.append(row['sold_qty'])
+        revenues.append(float(row['revenue'] or 0))
+
+    rows = np.array(rows, dtype=int)
+    qty = np.zeros((len(index), weeks))
+    np.add.at(qty, (rows, np.array(cols, dtype=int)), np.array(qtys, dtype=float))
+    revenue = np.bincount(rows, weights=np.array(revenues), minlength=len(index)) if len(index) else np.zeros(0)
+    return list(index), qty, revenue
+
+
+def abc_classes(revenue, groups):
+    """
+    ABC class per item from its revenue share within its group (warehouse):
+    items making up the first 80% of the group's revenue are A, the next 15% B,
+    the rest C
+    """
+    n = len(revenue)
+    classes = np.full(n, 'C')
+    if not n:
+        return classes
+    order = np.lexsort((-revenue, groups))
+    sorted_groups = groups[order]
+    sorted_revenue = revenue[order]
+    cumulative = np.cumsum(sorted_revenue)
+    # Restart the running total at every group boundary
+    boundaries = np.r_[0, np.flatnonzero(np.diff(sorted_groups)) + 1]
+    group_start = np.repeat(boundaries, np.diff(np.r_[boundaries, n]))
+    before_group = np.where(group_start > 0, cumulative[group_start - 1], 0.0)
+    group_total = np.add.reduceat(sorted_revenue, boundaries)[np.searchsorted(boundaries, group_start)]
+    # Share of the group revenue reached *before* this item, so the top seller is always A
+    share_before = np.divide(
+        cumulative - sorted_revenue - before_group, group_total,
+        out=np.ones(n), where=group_total > 0
+    )
+    sorted_classes = np.where(
+        sorted_revenue <= 0, 'C',
+        np.where(share_before < ABC_LIMITS[0], 'A', np.where(share_before < ABC_LIMITS[1], 'B', 'C'))
+    )
+    classes[order] = sorted_classes
+    return classes
+
+
+def xyz_classes(weekly_qty):
+    """
+    XYZ class per item from the coefficient of variation of its weekly
+    demand since its first sale: X up to 0.5 (steady), Y up to 1.0, Z above
+    (erratic or no sales).
+    Returns (classes, cv) with cv NaN for items without sales.
+    """
+    first_sale = np.argmax(weekly_qty > 0, axis=1)
+    active = np.arange(weekly_qty.shape[1]) >= first_sale[:, None]
+    weeks = np.maximum(active.sum(axis=1), 1)
+    mean = weekly_qty.sum(axis=1) / weeks
+    std = np.sqrt((np.where(active, weekly_qty - mean[:, None], 0.0) ** 2).sum(axis=1) / weeks)
+    cv = np.divide(std, mean, out=np.full(len(mean), np.nan), where=mean > 0)
+    classes = np.where(
+        np.isnan(cv), 'Z',
+        np.where(cv <= XYZ_LIMITS[0], 'X', np.where(cv <= XYZ_LIMITS[1], 'Y', 'Z'))
+    )
+    return classes, cv
+
+
+def classify_items(days=365):
+    """
+    Recompute the ABC/XYZ class of every product and warehouse that has a
+    stock row or sales in the last `days` days, replacing the item_class table.
+    Stock rows without sales are CZ.
+    Returns the number of classified items.
+    """
+    keys, weekly_qty, revenue = load_sales(days)
+    sold = set(keys)
+    unsold = [
+        key for key in Stock.objects.values_list('product_id', 'warehouse_id').iterator(chunk_size=5000)
+        if key not in sold
+    ]
+    keys += unsold
+    weekly_qty = np.vstack([weekly_qty, np.zeros((len(unsold), weekly_qty.shape[1]))])
+    revenue = np.concatenate([revenue, np.zeros(len(unsold))])
+
+    abc = abc_classes(revenue, np.array([k[1] for k in keys], dtype=int))
+    xyz, cv = xyz_classes(weekly_qty)
+
+    items = [
+        ItemClass(
+            product_id=key[0],
+            warehouse_id=key[1],
+            abc_class=abc[i],
+            xyz_class=xyz[i],
+            revenue=Decimal(str(round(revenue[i], 2))),
+            demand_cv=None if np.isnan(cv[i]) else round(float(cv[i]), 4)
+        )
+        for i, key in enumerate(keys)
+    ]
+    with transaction.atomic():
+        ItemClass.objects.all().delete()
+        ItemClass.objects.bulk_create(items, batch_size=1000)
+    return len(items)
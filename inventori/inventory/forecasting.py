@@ -0,0 +1,307 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from statistics import NormalDist
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import StockMove, StockMoveArchive, ReorderPolicy
+
+# Weekly seasonality of daily sales
+SEASON = 7
+
+# Smoothing parameters tried for every series at once; the best fit per series wins
+SES_ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5, 0.7])
+HW_GRID = np.array([
+    (alpha, beta, gamma)
+    for alpha in (0.05, 0.2, 0.4)
+    for beta in (0.0, 0.05)
+    for gamma in (0.05, 0.2)
+])
+
+
+def load_demand(days=365, end=None):
+    """
+    Load daily SALE quantities per (product, warehouse) for the `days` days
+    before `end` (default: today) into a matrix.
+    Returns (keys, matrix) where matrix[i, d] is the demand of keys[i] on day d.
+    Raises ValueError when the window reaches into months archived to an
+    export file, whose daily sales are no longer in the database.
+    """
+    end = end or timezone.localdate()
+    first_day = end - timedelta(days=days)
+    exported = StockMoveArchive.last_exported_period()
+    if exported and first_day.replace(day=1) <= exported:
+        raise ValueError(
+            f'Detail pergerakan stok sampai {exported:%Y-%m} diarsipkan ke file export; '
+            'perpendek periode histori penjualan'
+        )
+    since = timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+    until = timezone.make_aware(datetime.combine(end, datetime.min.time()))
+
+    index = {}
+    rows, cols, qtys = [], [], []
+    # Older movements may already have been moved to the archive table
+    for model in (StockMoveArchive, StockMove):
+        daily = model.objects.filter(
+            ref_type='SALE', moved_at__gte=since, moved_at__lt=until
+        ).annotate(day=TruncDate('moved_at')).values(
+            'product_id', 'warehouse_id', 'day'
+        ).annotate(qty=Sum(F('qty_out') - F('qty_in'))).order_by()
+        for row in daily:
+            key = (row['product_id'], row['warehouse_id'])
+            rows.append(index.setdefault(key, len(index)))
+            cols.append((row['day'] - first_day).days)
+            qtys.append(row['qty'])
+
+    matrix = np.zeros((len(index), days))
+    np.add.at(matrix, (np.array(rows, dtype=int), np.array(cols, dtype=int)), np.array(qtys, dtype=float))
+    return list(index), matrix
+
+
+def _first_sale(y):
+    # Days before a product was first sold are not demand history
+    return np.argmax(y > 0, axis=1)
+
+
+def _initial_state(y, start):
+    """
+    Initial level (mean of the first week of history) and weekly seasonal
+    indices, indexed by day number modulo SEASON
+    """
+    n, length = y.shape
+    rows = np.arange(n)[:, None]
+    offsets = start[:, None] + np.arange(SEASON)
+    valid = offsets < length
+    first_week = np.where(valid, y[rows, np.minimum(offsets, length - 1)], 0.0)
+    level = first_week.sum(axis=1) / np.maximum(valid.sum(axis=1), 1)
+    season = np.zeros((n, SEASON))
+    season[rows, offsets % SEASON] = np.where(valid, first_week - level[:, None], 0.0)
+    return level, season
+
+
+def fit_ses(y, start):
+    """
+    Simple exponential smoothing over all series at once.
+    Every alpha in SES_ALPHAS is run side by side and the one with the lowest
+    one-step-ahead squared error is kept per series.
+    """
+    n, length = y.shape
+    level0, _ = _initial_state(y, start)
+    alpha = SES_ALPHAS[:, None]
+    level = np.tile(level0, (len(SES_ALPHAS), 1))
+    sse = np.zeros_like(level)
+    for t in range(int(start.min()) + SEASON, length):
+        live = t >= start + SEASON
+        error = y[:, t] - level
+        sse += np.where(live, error ** 2, 0.0)
+        level = np.where(live, level + alpha * error, level)
+
+    best = sse.argmin(axis=0)
+    cols = np.arange(n)
+    return {'level': level[best, cols], 'sse': sse[best, cols], 'alpha': SES_ALPHAS[best]}
+
+
+def fit_holt_winters(y, start):
+    """
+    Additive Holt-Winters (level, trend, weekly season) over all series at
+    once, with the same per-series grid search as fit_ses()
+    """
+    n, length = y.shape
+    level0, season0 = _initial_state(y, start)
+    alpha, beta, gamma = (HW_GRID[:, i][:, None] for i in range(3))
+    level = np.tile(level0, (len(HW_GRID), 1))
+    trend = np.zeros_like(level)
+    season = np.tile(season0, (len(HW_GRID), 1, 1))
+    sse = np.zeros_like(level)
+    for t in range(int(start.min()) + SEASON, length):
+        live = t >= start + SEASON
+        seasonal = season[:, :, t % SEASON]
+        error = y[:, t] - (level + trend + seasonal)
+        sse += np.where(live, error ** 2, 0.0)
+        new_level = alpha * (y[:, t] - seasonal) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        new_seasonal = gamma * (y[:, t] - new_level) + (1 - gamma) * seasonal
+        season[:, :, t % SEASON] = np.where(live, new_seasonal, seasonal)
+        trend = np.where(live, new_trend, trend)
+        level = np.where(live, new_level, level)
+
+    best = sse.argmin(axis=0)
+    cols = np.arange(n)
+    return {
+        'level': level[best, cols],
+        'trend': trend[best, cols],
+        'season': season[best, cols],
+        'sse': sse[best, cols],
+    }
+
+
+def forecast(y, horizon, start=None):
+    """
+    Fit both models, pick one per series by AIC and forecast `horizon` days
+    past the end of `y`.
+    Returns a dict with the daily 'forecast' matrix (n x horizon), the
+    per-series residual 'sigma', the chosen 'method' and the forecasts of
+    both models ('ses', 'holt_winters') for the backtest.
+    """
+    n, length = y.shape
+    start = _first_sale(y) if start is None else start
+    nobs = np.maximum(length - start - SEASON, 0)
+
+    ses = fit_ses(y, start)
+    hw = fit_holt_winters(y, start)
+
+    steps = np.arange(1, horizon + 1)
+    ses_forecast = np.repeat(ses['level'][:, None], horizon, axis=1)
+    hw_forecast = (
+        hw['level'][:, None]
+        + steps * hw['trend'][:, None]
+        + hw['season'][:, (length - 1 + steps) % SEASON]
+    )
+
+    # AIC with 2 parameters for SES and 3 + 2 + SEASON for Holt-Winters;
+    # Holt-Winters needs at least two full seasons of history
+    safe_nobs = np.maximum(nobs, 1)
+    ses_aic = safe_nobs * np.log(ses['sse'] / safe_nobs + 1e-9) + 2 * 2
+    hw_aic = safe_nobs * np.log(hw['sse'] / safe_nobs + 1e-9) + 2 * (5 + SEASON)
+    use_hw = (nobs >= 2 * SEASON) & (hw_aic < ses_aic)
+
+    chosen = np.where(use_hw[:, None], hw_forecast, ses_forecast)
+    sse = np.where(use_hw, hw['sse'], ses['sse'])
+    return {
+        'forecast': np.maximum(chosen, 0.0),
+        'sigma': np.sqrt(sse / safe_nobs),
+        'method': np.where(use_hw, 'HW', 'SES'),
+        'ses': np.maximum(ses_forecast, 0.0),
+        'holt_winters': np.maximum(hw_forecast, 0.0),
+    }
+
+
+def _errors(predicted, actual):
+    error = predicted - actual
+    total = actual.sum()
+    return {
+        'mae': float(np.abs(error).mean()),
+        'rmse': float(np.sqrt((error ** 2).mean())),
+        'wape': float(np.abs(error).sum() / total) if total else None,
+        'bias': float(error.sum() / total) if total else None,
+    }
+
+
+def backtest(y, holdout=28):
+    """
+    Fit on all but the last `holdout` days and compare the forecasts with
+    what was actually sold, next to the static average-demand baseline
+    (mean daily sales since the first sale).
+    Returns {method: {'mae', 'rmse', 'wape', 'bias'}} plus the series count.
+    """
+    train, actual = y[:, :-holdout], y[:, -holdout:]
+    # Only series with at least one week of history before the holdout
+    eligible = (train > 0).any(axis=1)
+    start = _first_sale(train)
+    eligible &= start + SEASON <= train.shape[1]
+    train, actual, start = train[eligible], actual[eligible], start[eligible]
+    if not len(train):
+        return {'series': 0}
+
+    result = forecast(train, holdout, start=start)
+    history = np.maximum(train.shape[1] - start, 1)
+    average = np.repeat((train.sum(axis=1) / history)[:, None], holdout, axis=1)
+    return {
+        'series': int(len(train)),
+        'baseline': _errors(average, actual),
+        'ses': _errors(result['ses'], actual),
+        'holt_winters': _errors(result['holt_winters'], actual),
+        'selected': _errors(result['forecast'], actual),
+    }
+
+
+def safety_factors(service_levels):
+    """
+    Normal z-score for each service level percentage (clamped to 50-99.99%)
+    """
+    z_scores = {sl: NormalDist().inv_cdf(min(max(sl, 50.0), 99.99) / 100) for sl in set(service_levels)}
+    return np.array([z_scores[sl] for sl in service_levels])
+
+
+def _decimal(value):
+    return Decimal(str(round(float(value), 2)))
+
+
+def update_reorder_policies(days=365, default_lead_time=7, cover_days=14, default_service_level=95, dry_run=False):
+    """
+    Forecast the demand of every (product, warehouse) that sold in the last
+    `days` days and write forecast-driven reorder policies:
+
+    - avg_daily_demand: mean forecast daily demand over the lead time
+    - demand_std: standard deviation of the one-step forecast errors
+    - safety_stock: z(service level) * demand_std * sqrt(lead time)
+    - rop: forecast lead-time demand + safety stock
+    - reorder_qty: forecast demand over the next `cover_days` days
+
+    Existing policies keep their lead time and service level (policies with
+    no lead time use `default_lead_time`); missing policies are created.
+    Returns (updated, created, forecast result).
+    """
+    keys, y = load_demand(days)
+    if not keys:
+        return 0, 0, None
+
+    key_set = set(keys)
+    policies = {
+        (p.product_id, p.warehouse_id): p
+        for p in ReorderPolicy.objects.filter(product_id__in={k[0] for k in keys})
+        if (p.product_id, p.warehouse_id) in key_set
+    }
+    lead_time = np.array([
+        float(policies[k].lead_time_days) if k in policies and policies[k].lead_time_days > 0 else default_lead_time
+        for k in keys
+    ])
+    service_level = [
+        float(policies[k].service_level) if k in policies else default_service_level
+        for k in keys
+    ]
+    z = safety_factors(service_level)
+
+    lead_days = np.ceil(lead_time).astype(int)
+    horizon = int(max(lead_days.max(), cover_days))
+    result = forecast(y, horizon)
+    steps = np.arange(1, horizon + 1)
+    lead_demand = (result['forecast'] * (steps <= lead_days[:, None])).sum(axis=1)
+    cover_demand = result['forecast'][:, :cover_days].sum(axis=1)
+    safety_stock = np.ceil(z * result['sigma'] * np.sqrt(lead_time))
+    rop = np.ceil(lead_demand + safety_stock)
+    reorder_qty = np.ceil(cover_demand)
+    daily = lead_demand / np.maximum(lead_days, 1)
+
+    to_update, to_create = [], []
+    for i, key in enumerate(keys):
+        policy = policies.get(key)
+        if policy is None:
+            policy = ReorderPolicy(
+                product_id=key[0],
+                warehouse_id=key[1],
+                lead_time_days=_decimal(lead_time[i]),
+                service_level=_decimal(service_level[i]),
+            )
+            to_create.append(policy)
+        else:
+            to_update.append(policy)
+        policy.avg_daily_demand = _decimal(daily[i])
+        policy.demand_std = _decimal(result['sigma'][i])
+        policy.safety_stock = int(safety_stock[i])
+        policy.rop = int(rop[i])
+        policy.reorder_qty = int(reorder_qty[i])
+
+    if not dry_run:
+        with transaction.atomic():
+            ReorderPolicy.objects.bulk_update(
+                to_update,
+                ['avg_daily_demand', 'demand_std', 'safety_stock', 'rop', 'reorder_qty'],
+                batch_size=500
+            )
+            ReorderPolicy.objects.bulk_create(to_create, batch_size=500)
+    return len(to_update), len(to_create), result
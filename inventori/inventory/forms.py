@@ -1,6 +1,7 @@
 from django import forms
-from .models import Warehouse, Stock, StockMove, ReorderPolicy
-from master.models import Product
+from .models import Warehouse, Stock, StockMove, ReorderPolicy, StockTransfer, CountSession
+from master.models import Product, Category
+from .sequences import validate_manual_number
 
 
 class WarehouseForm(forms.ModelForm):
@@ -54,4 +55,86 @@ class ReorderPolicyForm(forms.ModelForm):
             'rop': forms.NumberInput(attrs={'class': 'form-control'}),
             'safety_stock': forms.NumberInput(attrs={'class': 'form-control'}),
             'reorder_qty': forms.NumberInput(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+
+
+class StockTransferForm(forms.ModelForm):
+    class Meta:
+        model = StockTransfer
+        fields = ['transfer_number', 'source_warehouse', 'destination_warehouse', 'note']
+        widgets = {
+            'transfer_number': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Otomatis'}),
+            'source_warehouse': forms.Select(attrs={'class': 'form-control'}),
+            'destination_warehouse': forms.Select(attrs={'class': 'form-control'}),
+            'note': forms.TextInput(attrs={'class': 'form-control'}),
+        }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Left empty, the number is assigned from its sequence when the document is saved
+        self.fields['transfer_number'].required = False
+    
+    def clean_transfer_number(self):
+        return validate_manual_number('TRF', self.cleaned_data['transfer_number'])
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('source_warehouse') and cleaned_data.get('source_warehouse') == cleaned_data.get('destination_warehouse'):
+            raise forms.ValidationError('Gudang asal dan tujuan harus berbeda')
+        return cleaned_data
+
+
+class StockTransferItemForm(forms.Form):
+    product_sku = forms.CharField(max_length=50, label='SKU Produk', widget=forms.TextInput(attrs={
+        'class': 'form-control',
+        'placeholder': 'Masukkan SKU produk',
+        'id': 'product_sku'
+    }))
+    qty = forms.IntegerField(min_value=1, initial=1, widget=forms.NumberInput(attrs={
+        'class': 'form-control',
+        'min': '1'
+    }))
+
+
+class CSVUploadForm(forms.Form):
+    file = forms.FileField(label='File CSV', widget=forms.ClearableFileInput(attrs={
+        'class': 'form-control',
+        'accept': '.csv'
+    }))
+
+
+class StockImportForm(forms.Form):
+    file = forms.FileField(label='File CSV / XLSX', widget=forms.ClearableFileInput(attrs={
+        'class': 'form-control',
+        'accept': '.csv,.xlsx'
+    }))
+    note = forms.CharField(max_length=255, required=False, label='Catatan', widget=forms.TextInput(attrs={
+        'class': 'form-control',
+        'placeholder': 'Contoh: Stock opname Oktober'
+    }))
+
+
+class CountSessionForm(forms.ModelForm):
+    category = forms.ModelChoiceField(
+        queryset=Category.objects.all(),
+        required=False,
+        empty_label='Semua Kategori',
+        label='Kategori',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    
+    class Meta:
+        model = CountSession
+        fields = ['session_number', 'warehouse', 'note']
+        widgets = {
+            'session_number': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Otomatis'}),
+            'warehouse': forms.Select(attrs={'class': 'form-control'}),
+            'note': forms.TextInput(attrs={'class': 'form-control'}),
+        }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['session_number'].required = False
+    
+    def clean_session_number(self):
+        return validate_manual_number('CNT', self.cleaned_data['session_number'])
@@ -0,0 +1,195 @@
+import csv
+import io
+import os
+import zipfile
+from itertools import islice
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from django.db import transaction
+from master.models import Product
+from .models import Warehouse
+from .services import add_transfer_lines, apply_stock_changes
+
+# Largest quantity a stock row or movement can hold
+MAX_QTY = 2 ** 31 - 1
+
+
+class ImportFileError(ValueError):
+    """
+    Raised when the rest of an uploaded file cannot be read
+    """
+
+
+def iter_csv_rows(uploaded_file):
+    """
+    Stream an uploaded CSV file as (line number, dict) pairs with lower-cased
+    header names
+    """
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    try:
+        for row in reader:
+            yield reader.line_num, {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+    except UnicodeDecodeError:
+        # The file is decoded in blocks, so the bad byte can be a few lines further down
+        raise ImportFileError(f'Baris {reader.line_num + 1} dan seterusnya tidak diproses: file bukan teks UTF-8')
+    except csv.Error as e:
+        raise ImportFileError(f'Baris {reader.line_num + 1} dan seterusnya tidak diproses: format CSV tidak valid ({e})')
+
+
+def iter_xlsx_rows(uploaded_file):
+    """
+    Stream the first sheet of an XLSX file (openpyxl read-only mode) as
+    (row number, dict) pairs
+    """
+    try:
+        workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        raise ImportFileError('File XLSX tidak valid atau rusak')
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell or '').strip().lower() for cell in next(rows, [])]
+        for row_number, values in enumerate(rows, start=2):
+            if not any(value not in (None, '') for value in values):
+                continue
+            yield row_number, {
+                key: '' if value is None else str(value).strip()
+                for key, value in zip(header, values)
+            }
+    finally:
+        workbook.close()
+
+
+def iter_rows(uploaded_file, filename=None):
+    """
+    Stream rows from a CSV or XLSX file, chosen by file extension
+    """
+    extension = os.path.splitext(filename or uploaded_file.name)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        return iter_xlsx_rows(uploaded_file)
+    if extension == '.csv':
+        return iter_csv_rows(uploaded_file)
+    raise ValueError('Format file harus CSV atau XLSX')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_rows(numbered_rows, errors):
+    """
+    Pass rows through until the file cannot be read any further; the reason
+    is added to errors, so the rows read so far are still imported
+    """
+    try:
+        yield from numbered_rows
+    except ImportFileError as e:
+        errors.append(str(e))
+
+
+def resolve_skus(skus):
+    """
+    Map SKUs to active product IDs with a single query
+    """
+    return dict(Product.objects.filter(sku__in=set(skus), is_active=True).values_list('sku', 'id'))
+
+
+def _parse_qty(value):
+    # XLSX numeric cells arrive as '12.0'; 'inf' and '1e400' overflow int()
+    try:
+        qty = float(value)
+        if qty != int(qty):
+            raise ValueError
+    except OverflowError:
+        raise ValueError
+    if abs(qty) > MAX_QTY:
+        raise ValueError
+    return int(qty)
+
+
+def import_transfer_csv(transfer, uploaded_file, chunk_size=1000):
+    """
+    Add lines to a transfer from a CSV file with 'sku' and 'qty' columns.
+    Returns (number of rows imported, list of per-row error messages).
+    """
+    added = 0
+    errors = []
+    numbered_rows = read_rows(iter_csv_rows(uploaded_file), errors)
+    for chunk in chunked(numbered_rows, chunk_size):
+        product_ids = resolve_skus(row.get('sku', '') for _, row in chunk)
+        lines = []
+        for row_number, row in chunk:
+            sku = row.get('sku', '')
+            try:
+                qty = _parse_qty(row.get('qty', ''))
+            except ValueError:
+                errors.append(f'Baris {row_number}: qty tidak valid')
+                continue
+            if qty <= 0:
+                errors.append(f'Baris {row_number}: qty harus lebih dari 0')
+            elif sku not in product_ids:
+                errors.append(f'Baris {row_number}: produk dengan SKU {sku} tidak ditemukan')
+            else:
+                lines.append((product_ids[sku], qty))
+        try:
+            add_transfer_lines(transfer, lines)
+        except ValueError as e:
+            # Posted or cancelled while the file was being read; nothing more can be added
+            errors.append(f'{e}; sisa baris tidak diproses')
+            break
+        added += len(lines)
+    return added, errors
+
+
+def import_stock_adjustments(uploaded_file, filename=None, chunk_size=1000, note=''):
+    """
+    Apply stock adjustments from a CSV/XLSX file with columns sku, warehouse
+    (code), qty and optional type ('in'/'out', otherwise qty is signed) and note.
+    
+    Each chunk resolves its SKUs and warehouse codes with one query each and
+    is applied in its own transaction with batched stock updates. Invalid rows
+    are reported and skipped without aborting the file.
+    Returns (number of rows applied, list of per-row error messages).
+    """
+    applied = 0
+    errors = []
+    numbered_rows = read_rows(iter_rows(uploaded_file, filename), errors)
+    for chunk in chunked(numbered_rows, chunk_size):
+        product_ids = resolve_skus(row.get('sku', '') for _, row in chunk)
+        warehouse_ids = dict(Warehouse.objects.filter(
+            code__in={row.get('warehouse', '') for _, row in chunk}
+        ).values_list('code', 'id'))
+        
+        changes = []
+        for row_number, row in chunk:
+            sku = row.get('sku', '')
+            code = row.get('warehouse', '')
+            adjustment_type = row.get('type', '').lower()
+            try:
+                qty = _parse_qty(row.get('qty', ''))
+            except ValueError:
+                errors.append(f'Baris {row_number}: qty tidak valid')
+                continue
+            if sku not in product_ids:
+                errors.append(f'Baris {row_number}: produk dengan SKU {sku} tidak ditemukan')
+            elif code not in warehouse_ids:
+                errors.append(f'Baris {row_number}: gudang dengan kode {code} tidak ditemukan')
+            elif adjustment_type not in ('', 'in', 'out'):
+                errors.append(f"Baris {row_number}: type harus 'in' atau 'out'")
+            elif adjustment_type and qty <= 0:
+                errors.append(f'Baris {row_number}: qty harus lebih dari 0')
+            elif qty == 0:
+                errors.append(f'Baris {row_number}: qty tidak boleh 0')
+            else:
+                qty_change = -qty if adjustment_type == 'out' else qty
+                changes.append((product_ids[sku], warehouse_ids[code], qty_change, row.get('note', '')))
+        
+        with transaction.atomic():
+            apply_stock_changes(changes, ref_type='ADJUST', note=note or 'Import adjustment stok')
+        applied += len(changes)
+    return applied, errors
@@ -0,0 +1,64 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from inventory.models import StockMove
+from inventory.services import archive_stock_moves
+
+
+class Command(BaseCommand):
+    help = 'Roll closed periods of stock_move into monthly totals and archive the detail rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before',
+            help='Archive movements before this month (YYYY-MM). Defaults to --keep-months ago.'
+        )
+        parser.add_argument(
+            '--keep-months', type=int, default=12,
+            help='Number of recent months to keep in stock_move (default: 12)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Rows per transaction (default: 5000)'
+        )
+        parser.add_argument(
+            '--export',
+            help='Write detail rows to this gzip CSV file instead of the stock_move_archive table'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report how many rows would be archived'
+        )
+
+    def handle(self, *args, **options):
+        current_month = timezone.localtime().date().replace(day=1)
+
+        if options['before']:
+            try:
+                cutoff_month = datetime.strptime(options['before'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--before harus berformat YYYY-MM')
+        else:
+            months = current_month.year * 12 + current_month.month - 1 - options['keep_months']
+            cutoff_month = current_month.replace(year=months // 12, month=months % 12 + 1)
+
+        # Only closed periods can be archived
+        if cutoff_month > current_month:
+            raise CommandError('Periode yang belum ditutup tidak dapat diarsipkan')
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size harus lebih dari 0')
+
+        before = timezone.make_aware(datetime.combine(cutoff_month, datetime.min.time()))
+
+        if options['dry_run']:
+            count = StockMove.objects.filter(moved_at__lt=before).count()
+            self.stdout.write(f'{count} pergerakan stok sebelum {cutoff_month:%Y-%m} akan diarsipkan')
+            return
+
+        self.stdout.write(f'Mengarsipkan pergerakan stok sebelum {cutoff_month:%Y-%m}...')
+        archived = archive_stock_moves(
+            before,
+            batch_size=options['batch_size'],
+            export_path=options['export']
+        )
+        self.stdout.write(self.style.SUCCESS(f'{archived} pergerakan stok berhasil diarsipkan'))
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from inventory.classification import classify_items
+from inventory.models import ItemClass
+
+
+class Command(BaseCommand):
+    help = 'Compute ABC (revenue share) and XYZ (demand variability) classes per product and warehouse'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Days of paid sales to classify on (default: 365)'
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 14:
+            raise CommandError('--days minimal 14')
+
+        started = time.monotonic()
+        count = classify_items(days=options['days'])
+        summary = ', '.join(
+            f"{abc}: {ItemClass.objects.filter(abc_class=abc).count()}" for abc, _ in ItemClass.ABC_CHOICES
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{count} item diklasifikasikan ({summary}) dalam {time.monotonic() - started:.1f} detik'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.services import expire_draft_sales
+
+
+class Command(BaseCommand):
+    help = 'Cancel abandoned DRAFT sales and release the stock they reserved'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float,
+            help='Hours without cart changes after which a draft is abandoned (default: POS_DRAFT_TIMEOUT)'
+        )
+
+    def handle(self, *args, **options):
+        max_age = None
+        if options['hours'] is not None:
+            if options['hours'] <= 0:
+                raise CommandError('--hours harus lebih dari 0')
+            max_age = options['hours'] * 60 * 60
+        count = expire_draft_sales(max_age)
+        self.stdout.write(self.style.SUCCESS(f'{count} transaksi draft kedaluwarsa dibatalkan dan reservasinya dilepas'))
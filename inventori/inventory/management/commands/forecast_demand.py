@@ -0,0 +1,80 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from inventory.forecasting import load_demand, backtest, update_reorder_policies
+
+
+class Command(BaseCommand):
+    help = 'Forecast daily demand (SES / Holt-Winters) and update ROP and reorder quantities'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Days of sales history to fit on (default: 365)'
+        )
+        parser.add_argument(
+            '--lead-time', type=float, default=7,
+            help='Lead time in days for policies without one (default: 7)'
+        )
+        parser.add_argument(
+            '--cover-days', type=int, default=14,
+            help='Days of forecast demand covered by one reorder (default: 14)'
+        )
+        parser.add_argument(
+            '--backtest', type=int, metavar='DAYS', nargs='?', const=28,
+            help='Only report forecast accuracy on the last DAYS days held out (default: 28)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Compute the policies without saving them'
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 28 or options['cover_days'] <= 0 or options['lead_time'] <= 0:
+            raise CommandError('--days minimal 28, --cover-days dan --lead-time harus lebih dari 0')
+
+        started = time.monotonic()
+        if options['backtest'] is not None:
+            holdout = options['backtest']
+            if not 0 < holdout < options['days'] - 14:
+                raise CommandError('--backtest harus lebih kecil dari --days')
+            try:
+                keys, y = load_demand(options['days'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            report = backtest(y, holdout=holdout)
+            self.stdout.write(f"Backtest {holdout} hari terakhir atas {report['series']} seri:")
+            for method in ('baseline', 'ses', 'holt_winters', 'selected'):
+                if method not in report:
+                    continue
+                m = report[method]
+                wape = f"{m['wape']:.1%}" if m['wape'] is not None else '-'
+                bias = f"{m['bias']:+.1%}" if m['bias'] is not None else '-'
+                self.stdout.write(
+                    f"  {method:<13} MAE {m['mae']:.3f}  RMSE {m['rmse']:.3f}  WAPE {wape}  bias {bias}"
+                )
+            self.stdout.write(f'Selesai dalam {time.monotonic() - started:.1f} detik')
+            return
+
+        try:
+            updated, created, result = update_reorder_policies(
+                days=options['days'],
+                default_lead_time=options['lead_time'],
+                cover_days=options['cover_days'],
+                dry_run=options['dry_run']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        if result is None:
+            self.stdout.write('Tidak ada data penjualan pada periode ini')
+            return
+
+        hw_count = int((result['method'] == 'HW').sum())
+        self.stdout.write(
+            f'{len(result["method"])} seri diramalkan: {hw_count} Holt-Winters, '
+            f'{len(result["method"]) - hw_count} SES'
+        )
+        action = 'akan diperbarui' if options['dry_run'] else 'diperbarui'
+        self.stdout.write(self.style.SUCCESS(
+            f'{updated} kebijakan reorder {action}, {created} baru '
+            f'({time.monotonic() - started:.1f} detik)'
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.imports import import_stock_adjustments
+
+
+class Command(BaseCommand):
+    help = 'Apply stock adjustments from a CSV or XLSX file (columns: sku, warehouse, qty, type, note)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file')
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Rows per lookup query and transaction (default: 1000)'
+        )
+        parser.add_argument('--note', default='', help='Default note for the stock movements')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size harus lebih dari 0')
+
+        try:
+            with open(options['path'], 'rb') as fh:
+                applied, errors = import_stock_adjustments(
+                    fh,
+                    filename=options['path'],
+                    chunk_size=options['chunk_size'],
+                    note=options['note']
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(f'{applied} adjustment stok diproses, {len(errors)} baris gagal'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from inventory.services import rebuild_reservations
+
+
+class Command(BaseCommand):
+    help = 'Recompute stock reservations from the open DRAFT sale lines'
+
+    def handle(self, *args, **options):
+        count = rebuild_reservations()
+        self.stdout.write(self.style.SUCCESS(f'{count} reservasi stok dihitung ulang dari transaksi draft'))
@@ -0,0 +1,86 @@
+import csv
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from master.models import Product
+from inventory.services import reconcile_chunk, repair_discrepancies
+
+
+def _close_connections():
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Compare Stock.qty with the stock movement ledger and report (or repair) discrepancies'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Products per grouped ledger query (default: 1000)'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes (default: 1, no pool)'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the discrepancy report to this CSV file'
+        )
+        parser.add_argument(
+            '--repair', choices=['stock', 'ledger'],
+            help="Repair discrepancies: 'stock' sets Stock.qty from the ledger, "
+                 "'ledger' posts ADJUST movements to match Stock.qty"
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        if chunk_size <= 0 or workers <= 0:
+            raise CommandError('--chunk-size dan --workers harus lebih dari 0')
+
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        chunks = [product_ids[i:i + chunk_size] for i in range(0, len(product_ids), chunk_size)]
+        self.stdout.write(f'Rekonsiliasi {len(product_ids)} produk dalam {len(chunks)} chunk...')
+
+        discrepancies = []
+        if workers > 1 and len(chunks) > 1:
+            _close_connections()
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_close_connections
+            ) as pool:
+                for result in pool.map(reconcile_chunk, chunks):
+                    discrepancies.extend(result)
+        else:
+            for chunk in chunks:
+                discrepancies.extend(reconcile_chunk(chunk))
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as fh:
+                writer = csv.writer(fh)
+                writer.writerow(['product_id', 'warehouse_id', 'stock_qty', 'ledger_qty', 'difference'])
+                for d in discrepancies:
+                    writer.writerow([
+                        d['product_id'], d['warehouse_id'], d['stock_qty'], d['ledger_qty'],
+                        d['stock_qty'] - d['ledger_qty']
+                    ])
+        else:
+            for d in discrepancies[:50]:
+                self.stdout.write(
+                    f"produk {d['product_id']} gudang {d['warehouse_id']}: "
+                    f"stok {d['stock_qty']}, ledger {d['ledger_qty']}"
+                )
+            if len(discrepancies) > 50:
+                self.stdout.write(f'... dan {len(discrepancies) - 50} lainnya (gunakan --output)')
+
+        if not discrepancies:
+            self.stdout.write(self.style.SUCCESS('Stok dan ledger sudah sesuai'))
+            return
+
+        self.stdout.write(self.style.WARNING(f'{len(discrepancies)} selisih ditemukan'))
+        if options['repair']:
+            repaired = repair_discrepancies(discrepancies, mode=options['repair'])
+            self.stdout.write(self.style.SUCCESS(f'{repaired} selisih diperbaiki ({options["repair"]})'))
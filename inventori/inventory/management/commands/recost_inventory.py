@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.valuation import recost, fifo_enabled
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the inventory valuation (average cost / FIFO layers) from the stock movement history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help='Movements fetched per database round trip (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size harus lebih dari 0')
+
+        method = 'FIFO' if fifo_enabled() else 'rata-rata tertimbang'
+        self.stdout.write(f'Menghitung ulang nilai persediaan ({method})...')
+        try:
+            replayed = recost(chunk_size=options['chunk_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'{replayed} pergerakan stok diproses'))
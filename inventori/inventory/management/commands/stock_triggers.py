@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from inventory.triggers import install_stock_triggers, remove_stock_triggers, stock_triggers_installed, triggers_enabled
+
+
+class Command(BaseCommand):
+    help = 'Install, remove or inspect the database triggers that maintain stock from stock_move'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['install', 'remove', 'status'])
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'status':
+            installed = stock_triggers_installed()
+            self.stdout.write(
+                f"Trigger stok: {'terpasang' if installed else 'tidak terpasang'}, "
+                f"INVENTORY_STOCK_TRIGGERS={triggers_enabled()}"
+            )
+            if installed != triggers_enabled():
+                self.stdout.write(self.style.WARNING(
+                    'Trigger dan INVENTORY_STOCK_TRIGGERS tidak sesuai: stok akan dihitung ganda atau tidak diperbarui'
+                ))
+            return
+
+        # A mismatch would double count (or stop counting) every stock change
+        if action == 'install' and not triggers_enabled():
+            raise CommandError('Set INVENTORY_STOCK_TRIGGERS=True sebelum memasang trigger')
+        if action == 'remove' and triggers_enabled():
+            raise CommandError('Set INVENTORY_STOCK_TRIGGERS=False sebelum melepas trigger')
+
+        try:
+            if action == 'install':
+                install_stock_triggers(connection)
+            else:
+                remove_stock_triggers(connection)
+        except NotImplementedError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            'Trigger stok terpasang' if action == 'install' else 'Trigger stok dilepas'
+        ))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        ('master', '0002_delete_supplier'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockmove',
+            index=models.Index(fields=['moved_at', 'id'], name='idx_sm_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmove',
+            index=models.Index(fields=['warehouse', 'moved_at', 'id'], name='idx_sm_wh_date'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmove',
+            index=models.Index(fields=['ref_type', 'moved_at', 'id'], name='idx_sm_type_date'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_stockmove_keyset_indexes'),
+        ('master', '0002_delete_supplier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMoveArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('ref_type', models.CharField(choices=[('SALE', 'Sale'), ('GRN', 'Goods Receipt'), ('ADJUST', 'Adjustment'), ('TRANSFER', 'Transfer')], max_length=20)),
+                ('ref_id', models.BigIntegerField(blank=True, null=True)),
+                ('qty_in', models.IntegerField(default=0)),
+                ('qty_out', models.IntegerField(default=0)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('moved_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='master.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'db_table': 'stock_move_archive',
+                'indexes': [models.Index(fields=['product', 'moved_at'], name='idx_sma_product_date')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMoveMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ref_type', models.CharField(choices=[('SALE', 'Sale'), ('GRN', 'Goods Receipt'), ('ADJUST', 'Adjustment'), ('TRANSFER', 'Transfer')], max_length=20)),
+                ('period', models.DateField()),
+                ('qty_in', models.BigIntegerField(default=0)),
+                ('qty_out', models.BigIntegerField(default=0)),
+                ('move_count', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='master.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'db_table': 'stock_move_monthly',
+                'indexes': [models.Index(fields=['period'], name='idx_smm_period')],
+                'unique_together': {('product', 'warehouse', 'ref_type', 'period')},
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_stock_transfer'),
+        ('master', '0002_delete_supplier'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_number', models.CharField(max_length=40, unique=True)),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('POSTED', 'Posted'), ('CANCELLED', 'Cancelled')], default='OPEN', max_length=20)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('posted_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'db_table': 'count_session',
+            },
+        ),
+        migrations.CreateModel(
+            name='CountLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expected_qty', models.IntegerField(default=0)),
+                ('counted_qty', models.IntegerField(blank=True, null=True)),
+                ('counted_at', models.DateTimeField(blank=True, null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='master.product')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='inventory.countsession')),
+            ],
+            options={
+                'db_table': 'count_line',
+                'unique_together': {('session', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_count_session'),
+        ('master', '0002_delete_supplier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmove',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='stockmovearchive',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True),
+        ),
+        migrations.CreateModel(
+            name='CostLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('move_id', models.BigIntegerField(blank=True, null=True)),
+                ('received_at', models.DateTimeField()),
+                ('qty_remaining', models.IntegerField()),
+                ('unit_cost', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='master.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'db_table': 'cost_layer',
+                'indexes': [models.Index(fields=['product', 'warehouse', 'received_at'], name='idx_cl_product_wh_date')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('qty', models.IntegerField(default=0)),
+                ('avg_cost', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('total_cost', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('fifo_cost', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='master.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'db_table': 'stock_valuation',
+                'unique_together': {('product', 'warehouse')},
+            },
+        ),
+    ]
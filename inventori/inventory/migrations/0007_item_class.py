@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_stock_valuation'),
+        ('master', '0002_delete_supplier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemClass',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('abc_class', models.CharField(choices=[('A', 'A'), ('B', 'B'), ('C', 'C')], max_length=1)),
+                ('xyz_class', models.CharField(choices=[('X', 'X'), ('Y', 'Y'), ('Z', 'Z')], max_length=1)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('demand_cv', models.FloatField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='master.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'db_table': 'item_class',
+                'indexes': [models.Index(fields=['warehouse', 'abc_class', 'xyz_class'], name='idx_ic_wh_class')],
+                'unique_together': {('product', 'warehouse')},
+            },
+        ),
+    ]
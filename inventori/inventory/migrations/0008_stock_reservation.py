@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def reserve_open_drafts(apps, schema_editor):
+    # Seed the reservations from the DRAFT sales that are already open
+    SaleItem = apps.get_model('sales', 'SaleItem')
+    StockReservation = apps.get_model('inventory', 'StockReservation')
+    StockReservation.objects.bulk_create([
+        StockReservation(product_id=row['product_id'], warehouse_id=row['sale__warehouse_id'], qty=row['total'])
+        for row in SaleItem.objects.filter(sale__status='DRAFT').values(
+            'product_id', 'sale__warehouse_id'
+        ).annotate(total=Sum('qty')).order_by()
+        if row['total'] > 0
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_item_class'),
+        ('master', '0002_delete_supplier'),
+        ('sales', '0002_sale_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('qty', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='master.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'db_table': 'stock_reservation',
+                'unique_together': {('product', 'warehouse')},
+            },
+        ),
+        migrations.RunPython(reserve_open_drafts, migrations.RunPython.noop),
+    ]
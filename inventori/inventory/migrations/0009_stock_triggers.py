@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from inventory.triggers import install_stock_triggers, remove_stock_triggers, triggers_enabled
+
+
+def install(apps, schema_editor):
+    # Only in ledger mode; otherwise the application keeps writing stock itself
+    if triggers_enabled():
+        install_stock_triggers(schema_editor.connection)
+
+
+def remove(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        remove_stock_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, remove),
+    ]
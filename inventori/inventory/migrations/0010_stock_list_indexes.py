@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_stock_triggers'),
+        ('master', '0003_product_name_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['qty', 'id'], name='idx_stock_qty'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['warehouse', 'qty', 'id'], name='idx_stock_wh_qty'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:17
+
+from django.db import migrations, models
+
+# Document number fields per sequence prefix
+NUMBERED = [
+    ('INV', 'sales', 'Sale', 'invoice_number'),
+    ('PO', 'purchases', 'PurchaseOrder', 'po_number'),
+    ('GRN', 'purchases', 'GoodsReceipt', 'grn_number'),
+    ('TRF', 'inventory', 'StockTransfer', 'transfer_number'),
+    ('CNT', 'inventory', 'CountSession', 'session_number'),
+]
+
+
+def seed_sequences(apps, schema_editor):
+    # Continue after the highest existing number in the PREFIX-000001 format;
+    # older timestamp invoice numbers (INV-20250101120000) are not part of the sequence
+    DocumentSequence = apps.get_model('inventory', 'DocumentSequence')
+    for prefix, app_label, model_name, field in NUMBERED:
+        numbers = apps.get_model(app_label, model_name).objects.filter(
+            **{f'{field}__regex': rf'^{prefix}-[0-9]{{1,9}}$'}
+        ).values_list(field, flat=True)
+        last_value = max((int(number.split('-', 1)[1]) for number in numbers.iterator(chunk_size=5000)), default=0)
+        DocumentSequence.objects.create(prefix=prefix, last_value=last_value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_stock_list_indexes'),
+        ('purchases', '0002_remove_purchaseorder_supplier'),
+        ('sales', '0002_sale_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=10, unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'document_sequence',
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.conf import settings
 from master.models import Product
 
 
@@ -29,6 +32,11 @@ class Stock(models.Model):
     class Meta:
         db_table = 'stock'
         unique_together = ('product', 'warehouse')
+        indexes = [
+            # Stock list sorted by quantity, over all or one warehouse
+            models.Index(fields=['qty', 'id'], name='idx_stock_qty'),
+            models.Index(fields=['warehouse', 'qty', 'id'], name='idx_stock_wh_qty'),
+        ]
     
     def __str__(self):
         return f"{self.product.name} - {self.warehouse.name}: {self.qty}"
@@ -51,6 +59,7 @@ class StockMove(models.Model):
     ref_id = models.BigIntegerField(null=True, blank=True)  # ID of the reference (e.g., Sale ID, GRN ID)
     qty_in = models.IntegerField(default=0)
     qty_out = models.IntegerField(default=0)
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)  # Purchase cost of inbound moves (e.g., POItem price)
     note = models.CharField(max_length=255, blank=True)
     moved_at = models.DateTimeField(auto_now_add=True)
     
@@ -59,10 +68,140 @@ class StockMove(models.Model):
         indexes = [
             models.Index(fields=['ref_type', 'ref_id'], name='idx_sm_ref'),
             models.Index(fields=['product', 'moved_at'], name='idx_sm_product_date'),
+            # Keyset pagination of the movement browser on (moved_at, id) and its filters
+            models.Index(fields=['moved_at', 'id'], name='idx_sm_date_id'),
+            models.Index(fields=['warehouse', 'moved_at', 'id'], name='idx_sm_wh_date'),
+            models.Index(fields=['ref_type', 'moved_at', 'id'], name='idx_sm_type_date'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.ref_type} - {self.moved_at}"
+
+
+class StockMoveMonthly(models.Model):
+    """
+    Monthly rollup of archived stock movements per product, warehouse and type
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    ref_type = models.CharField(max_length=20, choices=StockMove.REF_TYPE_CHOICES)
+    period = models.DateField()  # First day of the month
+    qty_in = models.BigIntegerField(default=0)
+    qty_out = models.BigIntegerField(default=0)
+    move_count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'stock_move_monthly'
+        unique_together = ('product', 'warehouse', 'ref_type', 'period')
+        indexes = [
+            models.Index(fields=['period'], name='idx_smm_period'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.ref_type} - {self.period:%Y-%m}"
+
+
+class StockMoveArchive(models.Model):
+    """
+    Archived stock movement detail (rows moved out of stock_move)
+    """
+    id = models.BigIntegerField(primary_key=True)  # Original StockMove ID
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    ref_type = models.CharField(max_length=20, choices=StockMove.REF_TYPE_CHOICES)
+    ref_id = models.BigIntegerField(null=True, blank=True)
+    qty_in = models.IntegerField(default=0)
+    qty_out = models.IntegerField(default=0)
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
+    note = models.CharField(max_length=255, blank=True)
+    moved_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'stock_move_archive'
+        indexes = [
+            models.Index(fields=['product', 'moved_at'], name='idx_sma_product_date'),
         ]
     
     def __str__(self):
         return f"{self.product.name} - {self.ref_type} - {self.moved_at}"
+    
+    @classmethod
+    def last_exported_period(cls):
+        """
+        Latest archived month whose detail rows went to an export file
+        (archive_stock_moves --export) instead of this table, or None.
+        Such months only survive as monthly totals in stock_move_monthly.
+        """
+        archived = dict(
+            cls.objects.annotate(period=TruncMonth('moved_at', output_field=models.DateField()))
+            .values('period').annotate(moves=Count('id')).values_list('period', 'moves').order_by()
+        )
+        rolled_up = StockMoveMonthly.objects.values('period').annotate(moves=Sum('move_count')).values_list('period', 'moves').order_by('-period')
+        for period, moves in rolled_up:
+            if moves > archived.get(period, 0):
+                return period
+        return None
+
+
+class StockValuation(models.Model):
+    """
+    Maintained inventory value per product per warehouse (weighted-average cost,
+    plus the FIFO layer total when FIFO costing is enabled)
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    qty = models.IntegerField(default=0)
+    avg_cost = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    total_cost = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    fifo_cost = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'stock_valuation'
+        unique_together = ('product', 'warehouse')
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.warehouse.name}: {self.total_cost}"
+
+
+class CostLayer(models.Model):
+    """
+    FIFO cost layer (remaining quantity of one receipt at its unit cost)
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    move_id = models.BigIntegerField(null=True, blank=True)  # StockMove that created the layer
+    received_at = models.DateTimeField()
+    qty_remaining = models.IntegerField()
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4)
+    
+    class Meta:
+        db_table = 'cost_layer'
+        indexes = [
+            models.Index(fields=['product', 'warehouse', 'received_at'], name='idx_cl_product_wh_date'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.qty_remaining} @ {self.unit_cost}"
+
+
+class StockReservation(models.Model):
+    """
+    Quantity held by DRAFT sale lines per product and warehouse
+    (available to promise = Stock.qty - qty)
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    qty = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'stock_reservation'
+        unique_together = ('product', 'warehouse')
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.warehouse.name} - {self.qty}"
 
 
 class ReorderPolicy(models.Model):
@@ -84,4 +223,142 @@ class ReorderPolicy(models.Model):
         unique_together = ('product', 'warehouse')
     
     def __str__(self):
-        return f"{self.product.name} - {self.warehouse.name} - ROP: {self.rop}"
\ No newline at end of file
+        return f"{self.product.name} - {self.warehouse.name} - ROP: {self.rop}"
+
+
+class StockTransfer(models.Model):
+    """
+    Inter-warehouse stock transfer document (header)
+    """
+    STATUS_CHOICES = [
+        ('DRAFT', 'Draft'),
+        ('POSTED', 'Posted'),
+        ('CANCELLED', 'Cancelled'),
+    ]
+    
+    transfer_number = models.CharField(max_length=40, unique=True)
+    source_warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='transfers_out')
+    destination_warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='transfers_in')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='DRAFT')
+    note = models.CharField(max_length=255, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    posted_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'stock_transfer'
+    
+    def __str__(self):
+        return f"{self.transfer_number} - {self.status}"
+
+
+class StockTransferItem(models.Model):
+    """
+    Stock transfer line
+    """
+    transfer = models.ForeignKey(StockTransfer, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    qty = models.IntegerField()
+    
+    class Meta:
+        db_table = 'stock_transfer_item'
+        unique_together = ('transfer', 'product')
+    
+    def __str__(self):
+        return f"{self.transfer.transfer_number} - {self.product.name}"
+
+
+class CountSession(models.Model):
+    """
+    Cycle count (stock opname) session with expected quantities frozen at start
+    """
+    STATUS_CHOICES = [
+        ('OPEN', 'Open'),
+        ('POSTED', 'Posted'),
+        ('CANCELLED', 'Cancelled'),
+    ]
+    
+    session_number = models.CharField(max_length=40, unique=True)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='OPEN')
+    note = models.CharField(max_length=255, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    posted_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'count_session'
+    
+    def __str__(self):
+        return f"{self.session_number} - {self.status}"
+
+
+class CountLine(models.Model):
+    """
+    Count session line: frozen expected quantity and the counted quantity
+    """
+    session = models.ForeignKey(CountSession, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    expected_qty = models.IntegerField(default=0)
+    counted_qty = models.IntegerField(null=True, blank=True)
+    counted_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'count_line'
+        unique_together = ('session', 'product')
+    
+    def __str__(self):
+        return f"{self.session.session_number} - {self.product.name}"
+    
+    def get_variance(self):
+        if self.counted_qty is None:
+            return None
+        return self.counted_qty - self.expected_qty
+
+
+class ItemClass(models.Model):
+    """
+    ABC (revenue share) and XYZ (demand variability) class per product and warehouse
+    """
+    ABC_CHOICES = [
+        ('A', 'A'),
+        ('B', 'B'),
+        ('C', 'C'),
+    ]
+    XYZ_CHOICES = [
+        ('X', 'X'),
+        ('Y', 'Y'),
+        ('Z', 'Z'),
+    ]
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    abc_class = models.CharField(max_length=1, choices=ABC_CHOICES)
+    xyz_class = models.CharField(max_length=1, choices=XYZ_CHOICES)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    demand_cv = models.FloatField(null=True, blank=True)  # coefficient of variation of weekly demand
+    computed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'item_class'
+        unique_together = ('product', 'warehouse')
+        indexes = [
+            models.Index(fields=['warehouse', 'abc_class', 'xyz_class'], name='idx_ic_wh_class'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.warehouse.name} - {self.abc_class}{self.xyz_class}"
+
+
+class DocumentSequence(models.Model):
+    """
+    Counter per document number prefix (INV, PO, GRN, TRF, CNT)
+    """
+    prefix = models.CharField(max_length=10, unique=True)
+    last_value = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'document_sequence'
+    
+    def __str__(self):
+        return f"{self.prefix}: {self.last_value}"
@@ -0,0 +1,123 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    """
+    Encode the sort-key values of a row into an opaque URL-safe cursor
+    """
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _ordering_field(model, path):
+    for part in path.split('__'):
+        field = model._meta.get_field(part)
+        model = field.related_model or model
+    return field
+
+
+def decode_cursor(cursor, model, ordering):
+    """
+    Decode a cursor produced by encode_cursor into values of the ordering
+    fields of model, returns None if it is invalid or has been tampered with
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(ordering):
+        return None
+    try:
+        values = [
+            _ordering_field(model, field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (ValidationError, ValueError, TypeError, AttributeError):
+        return None
+    return None if None in values else values
+
+
+def _row_value(row, field):
+    for part in field.split('__'):
+        row = getattr(row, part)
+    return row
+
+
+def _seek_filter(ordering, values, forward):
+    """
+    Build the lexicographic "row comes after the cursor" condition.
+
+    For ordering (a, -b, id) and cursor (va, vb, vid) going forward this is
+    a > va OR (a = va AND b < vb) OR (a = va AND b = vb AND id > vid).
+    """
+    clauses = []
+    for i, field in enumerate(ordering):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        conditions = {f.lstrip('-'): v for f, v in zip(ordering[:i], values[:i])}
+        conditions[f'{name}__{lookup}'] = values[i]
+        clauses.append(Q(**conditions))
+    return reduce(or_, clauses)
+
+
+def _reverse(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset
+    """
+
+    def __init__(self, rows, ordering, has_next, has_previous):
+        self.rows = rows
+        self.has_next = has_next
+        self.has_previous = has_previous
+        fields = [f.lstrip('-') for f in ordering]
+        self.next_cursor = encode_cursor([_row_value(rows[-1], f) for f in fields]) if rows and has_next else None
+        self.previous_cursor = encode_cursor([_row_value(rows[0], f) for f in fields]) if rows and has_previous else None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def keyset_paginate(queryset, ordering, after=None, before=None, limit=50):
+    """
+    Return a KeysetPage of `queryset` sorted by `ordering`.
+
+    The last ordering field must be unique (usually 'id') so every row has a
+    distinct position. `after`/`before` are cursors from a previous page;
+    each page is a single index range scan no matter how deep it is.
+    """
+    ordering = list(ordering)
+    after_values = decode_cursor(after, queryset.model, ordering)
+    before_values = decode_cursor(before, queryset.model, ordering)
+
+    if before_values is not None:
+        qs = queryset.filter(_seek_filter(ordering, before_values, forward=False))
+        qs = qs.order_by(*[_reverse(f) for f in ordering])
+        rows = list(qs[:limit + 1])
+        has_previous = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        return KeysetPage(rows, ordering, has_next=True, has_previous=has_previous)
+
+    qs = queryset
+    if after_values is not None:
+        qs = qs.filter(_seek_filter(ordering, after_values, forward=True))
+    rows = list(qs.order_by(*ordering)[:limit + 1])
+    has_next = len(rows) > limit
+    return KeysetPage(rows[:limit], ordering, has_next=has_next, has_previous=after_values is not None)
@@ -0,0 +1,138 @@
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+
+from master.models import Product
+from .models import Stock, ReorderPolicy, StockTransfer, StockTransferItem, StockReservation
+from .services import add_transfer_lines, next_transfer_number
+
+# One suggested transfer line
+Suggestion = namedtuple('Suggestion', ['product_id', 'source_warehouse_id', 'destination_warehouse_id', 'qty'])
+
+
+def _stock_levels(warehouse_ids=None):
+    """
+    Stock position and reorder levels per (product, warehouse) from five bulk
+    queries: stock, reorder policies, product minimum stock, open draft
+    transfer lines (counted as already on their way) and stock reserved for
+    draft POS sales (counted as already sold).
+    Returns {key: (shippable, position, reorder_point, order_up_to)} where
+    shippable is the stock not yet promised to a draft transfer or sale.
+    """
+    stocks = Stock.objects.all()
+    policies = ReorderPolicy.objects.all()
+    drafts = StockTransferItem.objects.filter(transfer__status='DRAFT')
+    reservations = StockReservation.objects.filter(qty__gt=0)
+    if warehouse_ids:
+        stocks = stocks.filter(warehouse_id__in=warehouse_ids)
+        policies = policies.filter(warehouse_id__in=warehouse_ids)
+        reservations = reservations.filter(warehouse_id__in=warehouse_ids)
+
+    on_hand = {
+        (product_id, warehouse_id): qty
+        for product_id, warehouse_id, qty in stocks.values_list('product_id', 'warehouse_id', 'qty').iterator(chunk_size=5000)
+    }
+    policy_levels = {
+        (product_id, warehouse_id): (rop, reorder_qty)
+        for product_id, warehouse_id, rop, reorder_qty in policies.values_list(
+            'product_id', 'warehouse_id', 'rop', 'reorder_qty'
+        ).iterator(chunk_size=5000)
+    }
+    incoming = defaultdict(int)
+    outgoing = defaultdict(int)
+    for product_id, source_id, destination_id, qty in drafts.values_list(
+        'product_id', 'transfer__source_warehouse_id', 'transfer__destination_warehouse_id', 'qty'
+    ).iterator(chunk_size=5000):
+        outgoing[(product_id, source_id)] += qty
+        incoming[(product_id, destination_id)] += qty
+    for product_id, warehouse_id, qty in reservations.values_list(
+        'product_id', 'warehouse_id', 'qty'
+    ).iterator(chunk_size=5000):
+        outgoing[(product_id, warehouse_id)] += qty
+
+    keys = set(on_hand) | set(policy_levels)
+    min_stock = dict(Product.objects.filter(
+        is_active=True, id__in={k[0] for k in keys}
+    ).values_list('id', 'min_stock'))
+
+    levels = {}
+    for key in keys:
+        if key[0] not in min_stock:
+            continue
+        qty = on_hand.get(key, 0)
+        if key in policy_levels:
+            rop, reorder_qty = policy_levels[key]
+            order_up_to = rop + reorder_qty
+        else:
+            rop = order_up_to = min_stock[key[0]]
+        shippable = qty - outgoing.get(key, 0)
+        levels[key] = (shippable, shippable + incoming.get(key, 0), rop, order_up_to)
+    return levels
+
+
+def plan_rebalancing(warehouse_ids=None):
+    """
+    Suggest transfers that move excess stock to warehouses at or below their
+    reorder point, before anyone raises a purchase order for them.
+
+    A warehouse needs stock when its position (stock plus open draft
+    transfers) is at or below its ROP and is topped up to ROP + reorder qty;
+    it can give away what it holds above its own ROP + reorder qty, so a
+    transfer never pushes the source below its reorder level. Per product,
+    the largest needs are served first from the largest surpluses (greedy),
+    which keeps the number of transfer lines low.
+    Returns a list of Suggestion.
+    """
+    needs = defaultdict(list)
+    surpluses = defaultdict(list)
+    for (product_id, warehouse_id), (shippable, position, rop, order_up_to) in _stock_levels(warehouse_ids).items():
+        if position <= rop and order_up_to > 0:
+            needs[product_id].append([max(order_up_to - position, rop - position + 1), warehouse_id])
+        elif position > order_up_to:
+            # Incoming draft stock is not on the shelf yet, so it cannot be sent on
+            excess = min(position - order_up_to, shippable)
+            if excess > 0:
+                surpluses[product_id].append([excess, warehouse_id])
+
+    suggestions = []
+    for product_id in sorted(needs.keys() & surpluses.keys()):
+        receivers = sorted(needs[product_id], reverse=True)
+        donors = sorted(surpluses[product_id], reverse=True)
+        d = 0
+        for need, destination_id in receivers:
+            while need > 0 and d < len(donors):
+                qty = min(need, donors[d][0])
+                suggestions.append(Suggestion(product_id, donors[d][1], destination_id, qty))
+                need -= qty
+                donors[d][0] -= qty
+                if donors[d][0] == 0:
+                    d += 1
+            if d == len(donors):
+                break
+    return suggestions
+
+
+def create_transfer_drafts(suggestions, user=None):
+    """
+    Turn suggestions into DRAFT transfers, one per source and destination
+    pair. Returns the created transfers.
+    """
+    lines = defaultdict(list)
+    for suggestion in suggestions:
+        lines[(suggestion.source_warehouse_id, suggestion.destination_warehouse_id)].append(
+            (suggestion.product_id, suggestion.qty)
+        )
+
+    transfers = []
+    with transaction.atomic():
+        for (source_id, destination_id), pair_lines in sorted(lines.items()):
+            transfer = StockTransfer.objects.create(
+                transfer_number=next_transfer_number(),
+                source_warehouse_id=source_id,
+                destination_warehouse_id=destination_id,
+                note='Saran rebalancing stok',
+                user=user
+            )
+            add_transfer_lines(transfer, pair_lines)
+            transfers.append(transfer)
+    return transfers
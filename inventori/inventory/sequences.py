@@ -0,0 +1,82 @@
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from .models import DocumentSequence
+
+# Digits of the numeric part, e.g. PO-000042
+NUMBER_WIDTH = 6
+
+# Increment-or-create in one statement; the row lock it takes is held until
+# the surrounding transaction ends, so a rolled back document gives its number back
+UPSERT_SQL = (
+    'INSERT INTO document_sequence (prefix, last_value) VALUES (%s, %s) '
+    'ON CONFLICT (prefix) DO UPDATE SET last_value = document_sequence.last_value + excluded.last_value '
+    'RETURNING last_value'
+)
+
+
+def _supports_upsert():
+    if connection.vendor == 'postgresql':
+        return True
+    # RETURNING needs SQLite 3.35
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def allocate(prefix, count=1):
+    """
+    Reserve `count` consecutive numbers of a sequence in one round trip.
+    Returns the first one. Call inside the transaction that saves the
+    documents, so the sequence stays gap-free when it rolls back.
+    """
+    if _supports_upsert():
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_SQL, [prefix, count])
+            last_value = cursor.fetchone()[0]
+    else:
+        with transaction.atomic():
+            sequence, _ = DocumentSequence.objects.select_for_update().get_or_create(prefix=prefix)
+            sequence.last_value += count
+            sequence.save(update_fields=['last_value'])
+            last_value = sequence.last_value
+    return last_value - count + 1
+
+
+def format_number(prefix, value):
+    return f'{prefix}-{value:0{NUMBER_WIDTH}d}'
+
+
+def next_number(prefix):
+    """
+    Next document number of a sequence, e.g. next_number('PO') -> 'PO-000042'
+    """
+    return format_number(prefix, allocate(prefix))
+
+
+def next_numbers(prefix, count):
+    """
+    `count` consecutive document numbers of a sequence from one round trip
+    """
+    first = allocate(prefix, count)
+    return [format_number(prefix, value) for value in range(first, first + count)]
+
+
+def is_sequence_number(prefix, number):
+    """
+    Whether a number has the sequence's own format (PO-000042), so that the
+    sequence could hand the same number out later
+    """
+    return re.fullmatch(rf'{re.escape(prefix)}-\d{{{NUMBER_WIDTH},}}', number) is not None
+
+
+def validate_manual_number(prefix, number):
+    """
+    Reject a typed document number in the sequence's format; returns it otherwise
+    """
+    if number and is_sequence_number(prefix, number):
+        raise ValidationError(
+            f'Nomor berformat {format_number(prefix, 1)} diberikan otomatis. '
+            'Kosongkan untuk nomor otomatis atau gunakan format lain.'
+        )
+    return number
@@ -1,10 +1,45 @@
-from .models import Stock, StockMove
+import csv
+import glob
+import gzip
+import os
+import shutil
+from collections import defaultdict, namedtuple
+from datetime import time, timedelta
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Stock, StockMove, StockMoveMonthly, StockMoveArchive, StockTransfer, StockTransferItem, CountSession, CountLine, StockReservation
+from .cache import invalidate_stock_on_commit, invalidate_reserved_on_commit
+from .triggers import triggers_enabled
+from .sequences import next_number
+from . import valuation
 
 
-def update_stock(product_id, warehouse_id, qty_change, ref_type, ref_id):
+def update_stock(product_id, warehouse_id, qty_change, ref_type, ref_id, unit_cost=None, note=None):
     """
-    Update stock quantity and create a stock movement record
+    Update stock quantity and create a stock movement record.
+    
+    With INVENTORY_STOCK_TRIGGERS the database applies the movement to the
+    stock row, so only the movement is written and None is returned.
     """
+    if triggers_enabled():
+        move = StockMove.objects.create(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            ref_type=ref_type,
+            ref_id=ref_id,
+            qty_in=max(qty_change, 0),
+            qty_out=max(-qty_change, 0),
+            unit_cost=unit_cost,
+            note=note or f'Stock update via {ref_type}'
+        )
+        valuation.apply_moves([move])
+        invalidate_stock_on_commit([(product_id, warehouse_id)])
+        return None
+    
     # Get or create the stock record
     stock, created = Stock.objects.get_or_create(
         product_id=product_id,
@@ -29,14 +64,787 @@ def update_stock(product_id, warehouse_id, qty_change, ref_type, ref_id):
         qty_in = 0
         qty_out = abs(qty_change)
     
-    StockMove.objects.create(
+    move = StockMove.objects.create(
         product_id=product_id,
         warehouse_id=warehouse_id,
         ref_type=ref_type,
         ref_id=ref_id,
         qty_in=qty_in,
         qty_out=qty_out,
-        note=f'Stock update via {ref_type}'
+        unit_cost=unit_cost,
+        note=note or f'Stock update via {ref_type}'
     )
     
-    return stock
\ No newline at end of file
+    # Keep the inventory valuation in step with the ledger
+    valuation.apply_moves([move])
+    
+    return stock
+
+
+
+class InsufficientStockError(ValueError):
+    """
+    Raised when a strict stock change would take stock below zero
+    """
+    
+    def __init__(self, shortages):
+        self.shortages = shortages  # {(product_id, warehouse_id): (available, requested)}
+        super().__init__(f'Stok tidak mencukupi untuk {len(shortages)} item')
+
+
+# One stock change for apply_stock_changes; plain (product_id, warehouse_id, qty_change) tuples work too.
+# ref_id overrides the batch ref_id for changes that belong to different documents.
+StockChange = namedtuple('StockChange', ['product_id', 'warehouse_id', 'qty_change', 'note', 'unit_cost', 'ref_id'], defaults=['', None, None])
+
+
+def apply_stock_changes(changes, ref_type, ref_id=None, note='', strict=False):
+    """
+    Batched version of update_stock for many StockChange(product_id,
+    warehouse_id, qty_change[, note, unit_cost, ref_id]) tuples: one query per 500
+    products to load the affected Stock rows, then bulk updates/inserts for
+    the stock rows and the movement records.
+    
+    Like update_stock, stock never goes below zero; with strict=True an
+    InsufficientStockError is raised instead. With INVENTORY_STOCK_TRIGGERS
+    only the movements are written (stock rows are read only for the strict
+    check) and stock is not clamped, so it always equals the ledger.
+    Call inside a transaction. Returns the number of movement records created.
+    """
+    changes = [StockChange(*c) for c in changes if c[2]]
+    if not changes:
+        return 0
+    
+    net = defaultdict(int)
+    for change in changes:
+        net[(change.product_id, change.warehouse_id)] += change.qty_change
+    
+    product_ids = sorted({k[0] for k in net})
+    warehouse_ids = {k[1] for k in net}
+    by_trigger = triggers_enabled()
+    stocks = {}
+    if strict or not by_trigger:
+        for start in range(0, len(product_ids), 500):
+            for stock in Stock.objects.select_for_update().filter(
+                product_id__in=product_ids[start:start + 500],
+                warehouse_id__in=warehouse_ids,
+            ):
+                stocks[(stock.product_id, stock.warehouse_id)] = stock
+    
+    if strict:
+        shortages = {}
+        for key, qty_change in net.items():
+            available = stocks[key].qty if key in stocks else 0
+            if available + qty_change < 0:
+                shortages[key] = (available, -qty_change)
+        if shortages:
+            raise InsufficientStockError(shortages)
+    
+    if not by_trigger:
+        to_update = []
+        to_create = []
+        for key, qty_change in net.items():
+            stock = stocks.get(key)
+            if stock:
+                stock.qty = max(0, stock.qty + qty_change)
+                to_update.append(stock)
+            else:
+                to_create.append(Stock(product_id=key[0], warehouse_id=key[1], qty=max(0, qty_change)))
+        
+        Stock.objects.bulk_update(to_update, ['qty'], batch_size=500)
+        Stock.objects.bulk_create(to_create, batch_size=500)
+    
+    moves = [
+        StockMove(
+            product_id=change.product_id,
+            warehouse_id=change.warehouse_id,
+            ref_type=ref_type,
+            ref_id=ref_id if change.ref_id is None else change.ref_id,
+            qty_in=max(change.qty_change, 0),
+            qty_out=max(-change.qty_change, 0),
+            unit_cost=change.unit_cost,
+            note=change.note or note or f'Stock update via {ref_type}'
+        )
+        for change in changes
+    ]
+    StockMove.objects.bulk_create(moves, batch_size=500)
+    valuation.apply_moves(moves)
+    
+    invalidate_stock_on_commit(net.keys())
+    return len(moves)
+
+
+def reserve_stock(product_id, warehouse_id, qty):
+    """
+    Reserve qty for a DRAFT sale line after checking it is available to
+    promise (stock minus what other drafts already hold). The stock and
+    reservation rows are locked, so two cashiers cannot both take the last
+    unit. Raises InsufficientStockError when not enough is available.
+    """
+    if qty <= 0:
+        raise ValueError('Jumlah harus lebih dari 0')
+    with transaction.atomic():
+        stock_qty = Stock.objects.select_for_update().filter(
+            product_id=product_id, warehouse_id=warehouse_id
+        ).values_list('qty', flat=True).first() or 0
+        reservation, _ = StockReservation.objects.select_for_update().get_or_create(
+            product_id=product_id, warehouse_id=warehouse_id
+        )
+        available = stock_qty - reservation.qty
+        if qty > available:
+            raise InsufficientStockError({(product_id, warehouse_id): (max(available, 0), qty)})
+        
+        reservation.qty += qty
+        reservation.save(update_fields=['qty', 'updated_at'])
+        invalidate_reserved_on_commit([(product_id, warehouse_id)])
+    return reservation
+
+
+def reserve_stocks(warehouse_id, quantities):
+    """
+    Batched reserve_stock for {product_id: qty} in one warehouse: the stock
+    and reservation rows are locked with one query each. Either everything
+    is reserved or InsufficientStockError lists every shortage.
+    """
+    quantities = {product_id: qty for product_id, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    if any(qty < 0 for qty in quantities.values()):
+        raise ValueError('Jumlah harus lebih dari 0')
+    with transaction.atomic():
+        stock_qtys = dict(Stock.objects.select_for_update().filter(
+            product_id__in=quantities, warehouse_id=warehouse_id
+        ).values_list('product_id', 'qty'))
+        reservations = {
+            reservation.product_id: reservation
+            for reservation in StockReservation.objects.select_for_update().filter(
+                product_id__in=quantities, warehouse_id=warehouse_id
+            )
+        }
+        
+        shortages = {}
+        for product_id, qty in quantities.items():
+            reserved = reservations[product_id].qty if product_id in reservations else 0
+            available = stock_qtys.get(product_id, 0) - reserved
+            if qty > available:
+                shortages[(product_id, warehouse_id)] = (max(available, 0), qty)
+        if shortages:
+            raise InsufficientStockError(shortages)
+        
+        now = timezone.now()
+        to_create = []
+        for product_id, qty in quantities.items():
+            if product_id in reservations:
+                reservations[product_id].qty += qty
+                reservations[product_id].updated_at = now
+            else:
+                to_create.append(StockReservation(product_id=product_id, warehouse_id=warehouse_id, qty=qty))
+        StockReservation.objects.bulk_update(reservations.values(), ['qty', 'updated_at'])
+        StockReservation.objects.bulk_create(to_create)
+        invalidate_reserved_on_commit((product_id, warehouse_id) for product_id in quantities)
+
+
+def check_available(warehouse_id, quantities):
+    """
+    Lock the stock rows of {product_id: qty} in one warehouse and raise
+    InsufficientStockError unless every qty fits in the stock that draft
+    sales have not reserved. Call inside the transaction that takes the
+    stock out; reserve_stock locks the same rows first, so no reservation
+    can slip in between.
+    """
+    stock_qtys = dict(Stock.objects.select_for_update().filter(
+        product_id__in=quantities, warehouse_id=warehouse_id
+    ).values_list('product_id', 'qty'))
+    reserved = dict(StockReservation.objects.filter(
+        product_id__in=quantities, warehouse_id=warehouse_id
+    ).values_list('product_id', 'qty'))
+    shortages = {}
+    for product_id, qty in quantities.items():
+        available = stock_qtys.get(product_id, 0) - reserved.get(product_id, 0)
+        if qty > available:
+            shortages[(product_id, warehouse_id)] = (max(available, 0), qty)
+    if shortages:
+        raise InsufficientStockError(shortages)
+
+
+def release_stock(changes):
+    """
+    Release reserved quantities for (product_id, warehouse_id, qty) tuples,
+    e.g. when a draft line is removed. Never goes below zero.
+    """
+    released = defaultdict(int)
+    for product_id, warehouse_id, qty in changes:
+        released[(product_id, warehouse_id)] += qty
+    
+    for (product_id, warehouse_id), qty in released.items():
+        if qty:
+            StockReservation.objects.filter(product_id=product_id, warehouse_id=warehouse_id).update(
+                qty=Greatest(F('qty') - qty, 0), updated_at=timezone.now()
+            )
+    invalidate_reserved_on_commit(released.keys())
+
+
+def release_sale_reservations(sale):
+    """
+    Release everything a DRAFT sale holds; call it before the sale is paid
+    (its stock then leaves through update_stock) or deleted
+    """
+    if sale.status != 'DRAFT':
+        return
+    release_stock(
+        (product_id, sale.warehouse_id, qty)
+        for product_id, qty in sale.items.values('product_id').annotate(total=Sum('qty')).values_list('product_id', 'total').order_by()
+    )
+
+
+def rebuild_reservations():
+    """
+    Recompute every reservation from the open DRAFT sale lines, to repair
+    drift (e.g. drafts deleted outside the POS). Returns the number of rows.
+    """
+    from sales.models import SaleItem
+    
+    totals = {
+        (row['product_id'], row['sale__warehouse_id']): row['total']
+        for row in SaleItem.objects.filter(sale__status='DRAFT').values(
+            'product_id', 'sale__warehouse_id'
+        ).annotate(total=Sum('qty')).order_by()
+    }
+    with transaction.atomic():
+        existing = list(StockReservation.objects.select_for_update().values_list('product_id', 'warehouse_id'))
+        StockReservation.objects.all().delete()
+        StockReservation.objects.bulk_create([
+            StockReservation(product_id=product_id, warehouse_id=warehouse_id, qty=qty)
+            for (product_id, warehouse_id), qty in totals.items()
+            if qty > 0
+        ], batch_size=500)
+        invalidate_reserved_on_commit(set(existing) | set(totals))
+    return len(totals)
+
+
+def expire_draft_sales(max_age=None):
+    """
+    Cancel DRAFT sales whose cart has not changed for max_age seconds
+    (POS_DRAFT_TIMEOUT by default) and release the stock they reserved, so
+    an abandoned draft does not hold stock for good. Returns the number of
+    sales cancelled.
+    """
+    from sales.models import Sale, SaleItem
+    
+    if max_age is None:
+        max_age = getattr(settings, 'POS_DRAFT_TIMEOUT', 8 * 60 * 60)
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    with transaction.atomic():
+        # Locking the sales keeps a cart change from landing in a draft being cancelled
+        sale_ids = list(Sale.objects.select_for_update().filter(
+            status='DRAFT', updated_at__lt=cutoff
+        ).values_list('id', flat=True))
+        if not sale_ids:
+            return 0
+        release_stock(
+            SaleItem.objects.filter(sale_id__in=sale_ids).values('product_id', 'sale__warehouse_id')
+            .annotate(total=Sum('qty')).values_list('product_id', 'sale__warehouse_id', 'total').order_by()
+        )
+        Sale.objects.filter(id__in=sale_ids).update(status='CANCELLED')
+    return len(sale_ids)
+
+
+def next_transfer_number():
+    """
+    Next transfer number in the TRF-000001 series; call inside the
+    transaction that saves the transfer
+    """
+    return next_number('TRF')
+
+
+def post_transfer(transfer):
+    """
+    Post a DRAFT transfer: take the stock out of the source warehouse and put
+    it into the destination warehouse in one transaction, with a paired
+    TRANSFER movement per line.
+    """
+    with transaction.atomic():
+        transfer = StockTransfer.objects.select_for_update().get(pk=transfer.pk)
+        if transfer.status != 'DRAFT':
+            raise ValueError(f'Transfer {transfer.transfer_number} sudah {transfer.get_status_display()}')
+        
+        items = list(transfer.items.values_list('product_id', 'qty'))
+        if not items:
+            raise ValueError('Transfer tidak memiliki item')
+        
+        # Stock arrives at the destination at the source's average cost
+        source_costs = valuation.average_costs(
+            (product_id, transfer.source_warehouse_id) for product_id, _ in items
+        )
+        changes = []
+        for product_id, qty in items:
+            changes.append(StockChange(product_id, transfer.source_warehouse_id, -qty))
+            changes.append(StockChange(
+                product_id, transfer.destination_warehouse_id, qty,
+                unit_cost=source_costs.get((product_id, transfer.source_warehouse_id))
+            ))
+        
+        apply_stock_changes(
+            changes,
+            ref_type='TRANSFER',
+            ref_id=transfer.id,
+            note=f'Transfer {transfer.transfer_number}',
+            strict=True
+        )
+        
+        transfer.status = 'POSTED'
+        transfer.posted_at = timezone.now()
+        transfer.save(update_fields=['status', 'posted_at'])
+    
+    return transfer
+
+
+def add_transfer_lines(transfer, lines):
+    """
+    Add (product_id, qty) lines to a transfer, merging into existing lines
+    for the same product. One read, one bulk update and one bulk insert.
+    The transfer row is locked like post_transfer does, so lines cannot land
+    in a transfer being posted; raises ValueError when it is no longer a draft.
+    """
+    qty_by_product = defaultdict(int)
+    for product_id, qty in lines:
+        qty_by_product[product_id] += qty
+    if not qty_by_product:
+        return 0
+    
+    with transaction.atomic():
+        locked = StockTransfer.objects.select_for_update().get(pk=transfer.pk)
+        if locked.status != 'DRAFT':
+            raise ValueError(f'Transfer {locked.transfer_number} sudah {locked.get_status_display()}')
+        
+        existing = {
+            item.product_id: item
+            for item in StockTransferItem.objects.filter(
+                transfer=transfer,
+                product_id__in=list(qty_by_product)
+            )
+        }
+        
+        to_update = []
+        to_create = []
+        for product_id, qty in qty_by_product.items():
+            item = existing.get(product_id)
+            if item:
+                item.qty += qty
+                to_update.append(item)
+            else:
+                to_create.append(StockTransferItem(transfer=transfer, product_id=product_id, qty=qty))
+        
+        StockTransferItem.objects.bulk_update(to_update, ['qty'])
+        StockTransferItem.objects.bulk_create(to_create)
+    return len(qty_by_product)
+
+
+def freeze_count_session(session, category_id=None):
+    """
+    Snapshot the expected quantities of the session's warehouse (optionally
+    only one product category) into count lines with one bulk insert
+    """
+    stocks = Stock.objects.filter(warehouse_id=session.warehouse_id)
+    if category_id:
+        stocks = stocks.filter(product__category_id=category_id)
+    
+    lines = (
+        CountLine(session=session, product_id=product_id, expected_qty=qty)
+        for product_id, qty in stocks.values_list('product_id', 'qty').iterator(chunk_size=2000)
+    )
+    created = 0
+    with transaction.atomic():
+        while True:
+            batch = list(islice(lines, 1000))
+            if not batch:
+                break
+            CountLine.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+def submit_counts(session, counts, mode='add'):
+    """
+    Record a batch of counts given as {product_id: qty}.
+    mode='add' adds to the counted quantity (one scan per unit),
+    mode='set' replaces it. Products outside the frozen snapshot get a new
+    line with expected quantity 0. Returns the number of lines touched.
+    
+    The session row is locked like in post_count_session, so a batch never
+    lands in a session that is being posted. Raises ValueError when the
+    session is no longer OPEN or a count would become negative.
+    """
+    if not counts:
+        return 0
+    if mode == 'set' and any(qty < 0 for qty in counts.values()):
+        raise ValueError('Jumlah hitung tidak boleh negatif')
+    now = timezone.now()
+    with transaction.atomic():
+        session = CountSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'OPEN':
+            raise ValueError(f'Sesi {session.session_number} sudah {session.get_status_display()}')
+        
+        lines = {
+            line.product_id: line
+            for line in CountLine.objects.select_for_update().filter(
+                session=session,
+                product_id__in=list(counts)
+            )
+        }
+        to_update = []
+        to_create = []
+        for product_id, qty in counts.items():
+            line = lines.get(product_id)
+            if line:
+                if mode == 'add':
+                    line.counted_qty = (line.counted_qty or 0) + qty
+                else:
+                    line.counted_qty = qty
+                line.counted_at = now
+                to_update.append(line)
+            else:
+                line = CountLine(
+                    session=session,
+                    product_id=product_id,
+                    expected_qty=0,
+                    counted_qty=qty,
+                    counted_at=now
+                )
+                to_create.append(line)
+            if line.counted_qty < 0:
+                raise ValueError('Jumlah hitung tidak boleh negatif')
+        CountLine.objects.bulk_update(to_update, ['counted_qty', 'counted_at'])
+        CountLine.objects.bulk_create(to_create)
+    return len(counts)
+
+
+def post_count_session(session, zero_uncounted=False):
+    """
+    Post an OPEN count session: every counted line whose quantity differs
+    from the frozen expectation becomes an ADJUST movement, all in one
+    transaction. The variance is applied as a delta, so sales and receipts
+    that happened during the count are preserved.
+    """
+    with transaction.atomic():
+        session = CountSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'OPEN':
+            raise ValueError(f'Sesi {session.session_number} sudah {session.get_status_display()}')
+        
+        lines = session.lines.all()
+        if not zero_uncounted:
+            lines = lines.filter(counted_qty__isnull=False)
+        
+        changes = []
+        for product_id, expected_qty, counted_qty in lines.values_list(
+            'product_id', 'expected_qty', 'counted_qty'
+        ).iterator(chunk_size=2000):
+            variance = (counted_qty or 0) - expected_qty
+            if variance:
+                changes.append((product_id, session.warehouse_id, variance))
+        
+        adjusted = apply_stock_changes(
+            changes,
+            ref_type='ADJUST',
+            ref_id=session.id,
+            note=f'Stock opname {session.session_number}'
+        )
+        
+        session.status = 'POSTED'
+        session.posted_at = timezone.now()
+        session.save(update_fields=['status', 'posted_at'])
+    
+    return adjusted
+
+
+ARCHIVE_FIELDS = ['id', 'product_id', 'warehouse_id', 'ref_type', 'ref_id', 'qty_in', 'qty_out', 'unit_cost', 'note', 'moved_at']
+
+
+def _month_start(moved_at):
+    return timezone.localtime(moved_at).date().replace(day=1)
+
+
+def _rollup_batch(rows):
+    """
+    Add a batch of movement rows to the monthly rollup table
+    """
+    totals = defaultdict(lambda: [0, 0, 0])
+    for row in rows:
+        key = (row['product_id'], row['warehouse_id'], row['ref_type'], _month_start(row['moved_at']))
+        totals[key][0] += row['qty_in']
+        totals[key][1] += row['qty_out']
+        totals[key][2] += 1
+    
+    existing = {
+        (r.product_id, r.warehouse_id, r.ref_type, r.period): r
+        for r in StockMoveMonthly.objects.filter(
+            period__in={k[3] for k in totals},
+            product_id__in={k[0] for k in totals},
+            warehouse_id__in={k[1] for k in totals},
+        )
+    }
+    
+    to_update = []
+    to_create = []
+    for key, (qty_in, qty_out, count) in totals.items():
+        rollup = existing.get(key)
+        if rollup:
+            rollup.qty_in += qty_in
+            rollup.qty_out += qty_out
+            rollup.move_count += count
+            to_update.append(rollup)
+        else:
+            to_create.append(StockMoveMonthly(
+                product_id=key[0],
+                warehouse_id=key[1],
+                ref_type=key[2],
+                period=key[3],
+                qty_in=qty_in,
+                qty_out=qty_out,
+                move_count=count
+            ))
+    
+    if to_update:
+        StockMoveMonthly.objects.bulk_update(to_update, ['qty_in', 'qty_out', 'move_count'])
+    if to_create:
+        StockMoveMonthly.objects.bulk_create(to_create)
+
+
+def _part_path(export_path, rows):
+    # The id range names the batch, so a leftover part can be matched to its rows
+    return f"{export_path}.{rows[0]['id']}-{rows[-1]['id']}.part"
+
+
+def _write_part(rows, part_path):
+    """
+    Write a batch of movement rows to a part file holding one gzip member
+    """
+    with gzip.open(part_path, 'wt', newline='') as fh:
+        writer = csv.writer(fh)
+        for row in rows:
+            writer.writerow([row[f].isoformat() if f == 'moved_at' else row[f] for f in ARCHIVE_FIELDS])
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def _append_part(part_path, export_path):
+    """
+    Append a part file to the gzip CSV export (gzip members concatenate into
+    one valid file) and remove it
+    """
+    if not os.path.exists(export_path):
+        with gzip.open(export_path, 'wt', newline='') as fh:
+            csv.writer(fh).writerow(ARCHIVE_FIELDS)
+    with open(part_path, 'rb') as src, open(export_path, 'ab') as dst:
+        shutil.copyfileobj(src, dst)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.remove(part_path)
+
+
+def _recover_parts(export_path):
+    """
+    Finish the part files left behind by an interrupted export: a part whose
+    rows were deleted from stock_move belongs to a committed batch and is
+    appended, otherwise the batch rolled back and the part is discarded
+    """
+    parts = []
+    for part_path in glob.glob(f'{glob.escape(export_path)}.*-*.part'):
+        first_id = part_path[len(export_path) + 1:-len('.part')].split('-')[0]
+        if first_id.isdigit():
+            parts.append((int(first_id), part_path))
+    for first_id, part_path in sorted(parts):
+        if StockMove.objects.filter(id=first_id).exists():
+            os.remove(part_path)
+        else:
+            _append_part(part_path, export_path)
+
+
+def archive_stock_moves(before, batch_size=5000, export_path=None):
+    """
+    Roll stock movements older than `before` into monthly aggregates and move
+    the detail rows out of stock_move (into stock_move_archive, or into a
+    gzip CSV file when `export_path` is given).
+    
+    Each batch is its own short transaction so SQLite never holds the write
+    lock for long. An exported batch is written to a part file first and only
+    appended to the export once its transaction commits, so a rolled back
+    batch never reaches the file and a rerun does not export rows twice.
+    Returns the number of archived rows.
+    """
+    if export_path:
+        _recover_parts(export_path)
+    
+    archived = 0
+    last_id = 0
+    while True:
+        rows = list(
+            StockMove.objects.filter(moved_at__lt=before, id__gt=last_id)
+            .order_by('id')
+            .values(*ARCHIVE_FIELDS)[:batch_size]
+        )
+        if not rows:
+            break
+        
+        part_path = None
+        if export_path:
+            part_path = _part_path(export_path, rows)
+            _write_part(rows, part_path)
+        try:
+            with transaction.atomic():
+                _rollup_batch(rows)
+                if part_path:
+                    transaction.on_commit(lambda part_path=part_path: _append_part(part_path, export_path))
+                else:
+                    StockMoveArchive.objects.bulk_create([StockMoveArchive(**row) for row in rows])
+                StockMove.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        except Exception:
+            if part_path and os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        
+        archived += len(rows)
+        last_id = rows[-1]['id']
+    
+    return archived
+
+
+def ledger_balances(product_ids=None, warehouse_id=None, as_of=None):
+    """
+    Stock balance per (product_id, warehouse_id) from the movement ledger,
+    combining monthly rollups of archived periods with live stock_move rows.
+    
+    Archived periods only keep monthly totals, so a snapshot taken inside an
+    archived month reports that month's closing balance.
+    """
+    balances = defaultdict(int)
+    
+    live = StockMove.objects.all()
+    rollups = StockMoveMonthly.objects.all()
+    if product_ids is not None:
+        live = live.filter(product_id__in=product_ids)
+        rollups = rollups.filter(product_id__in=product_ids)
+    if warehouse_id:
+        live = live.filter(warehouse_id=warehouse_id)
+        rollups = rollups.filter(warehouse_id=warehouse_id)
+    if as_of is not None:
+        live = live.filter(moved_at__lt=as_of)
+        local_as_of = timezone.localtime(as_of)
+        if local_as_of.time() == time.min:
+            rollups = rollups.filter(period__lt=local_as_of.date())
+        else:
+            rollups = rollups.filter(period__lte=local_as_of.date())
+    
+    for qs in (rollups, live):
+        totals = qs.values('product_id', 'warehouse_id').annotate(
+            balance=Sum(F('qty_in') - F('qty_out'))
+        )
+        for row in totals:
+            balances[(row['product_id'], row['warehouse_id'])] += row['balance'] or 0
+    
+    return dict(balances)
+
+
+def reconcile_chunk(product_ids):
+    """
+    Compare Stock.qty with the ledger balance for a chunk of products.
+    Returns a list of discrepancies (product_id, warehouse_id, stock_qty, ledger_qty).
+    """
+    ledger = ledger_balances(product_ids=product_ids)
+    stocks = {
+        (product_id, warehouse_id): qty
+        for product_id, warehouse_id, qty in Stock.objects.filter(
+            product_id__in=product_ids
+        ).values_list('product_id', 'warehouse_id', 'qty')
+    }
+    
+    discrepancies = []
+    for key in sorted(set(ledger) | set(stocks)):
+        stock_qty = stocks.get(key, 0)
+        ledger_qty = ledger.get(key, 0)
+        if stock_qty != ledger_qty:
+            discrepancies.append({
+                'product_id': key[0],
+                'warehouse_id': key[1],
+                'stock_qty': stock_qty,
+                'ledger_qty': ledger_qty,
+                'has_stock_row': key in stocks,
+            })
+    return discrepancies
+
+
+def repair_discrepancies(discrepancies, mode='stock'):
+    """
+    Fix discrepancies found by reconcile_chunk.
+    
+    mode='stock' sets Stock.qty to the ledger balance, mode='ledger' posts
+    ADJUST movements so the ledger matches Stock.qty. Run one of them before
+    switching INVENTORY_STOCK_TRIGGERS on: the triggers apply every movement
+    to the current quantity, so an existing difference would stay.
+    
+    The scan ran without locks, so each batch locks its stock rows and
+    compares stock and ledger again before writing; movements posted since
+    the scan are kept. Returns the number of discrepancies repaired.
+    """
+    repaired = 0
+    for start in range(0, len(discrepancies), 500):
+        repaired += _repair_batch(discrepancies[start:start + 500], mode)
+    return repaired
+
+
+def _repair_batch(discrepancies, mode):
+    keys = {(d['product_id'], d['warehouse_id']) for d in discrepancies}
+    product_ids = {product_id for product_id, _ in keys}
+    with transaction.atomic():
+        # Stock writers lock these rows too, so the ledger read below is complete
+        stocks = {
+            (stock.product_id, stock.warehouse_id): stock
+            for stock in Stock.objects.select_for_update().filter(
+                product_id__in=product_ids,
+                warehouse_id__in={warehouse_id for _, warehouse_id in keys},
+            )
+            if (stock.product_id, stock.warehouse_id) in keys
+        }
+        ledger = ledger_balances(product_ids=product_ids)
+        current = [
+            (key, stocks[key].qty if key in stocks else 0, ledger.get(key, 0))
+            for key in sorted(keys)
+        ]
+        current = [(key, stock_qty, ledger_qty) for key, stock_qty, ledger_qty in current if stock_qty != ledger_qty]
+        
+        if mode == 'stock':
+            to_update = []
+            for key, _, ledger_qty in current:
+                if key in stocks:
+                    stocks[key].qty = ledger_qty
+                    to_update.append(stocks[key])
+            Stock.objects.bulk_update(to_update, ['qty'])
+            # A row created since the lock was taken has been written by a stock
+            # change, which keeps it in step with the ledger
+            Stock.objects.bulk_create([
+                Stock(product_id=key[0], warehouse_id=key[1], qty=ledger_qty)
+                for key, _, ledger_qty in current if key not in stocks
+            ], ignore_conflicts=True)
+        else:
+            StockMove.objects.bulk_create([
+                StockMove(
+                    product_id=key[0],
+                    warehouse_id=key[1],
+                    ref_type='ADJUST',
+                    qty_in=max(stock_qty - ledger_qty, 0),
+                    qty_out=max(ledger_qty - stock_qty, 0),
+                    note='Rekonsiliasi ledger stok'
+                )
+                for key, stock_qty, ledger_qty in current
+            ])
+            if triggers_enabled():
+                # The trigger applied the adjustments to stock as well; put it back
+                stock_qty = {key: qty for key, qty, _ in current}
+                restored = list(Stock.objects.filter(
+                    product_id__in={key[0] for key in stock_qty},
+                    warehouse_id__in={key[1] for key in stock_qty},
+                ))
+                for stock in restored:
+                    stock.qty = stock_qty.get((stock.product_id, stock.warehouse_id), stock.qty)
+                Stock.objects.bulk_update(restored, ['qty'])
+        invalidate_stock_on_commit([key for key, _, _ in current])
+    return len(current)
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Stock
+from .cache import invalidate_stock_on_commit
+
+
+@receiver(post_save, sender=Stock)
+def invalidate_stock_on_save(sender, instance, **kwargs):
+    invalidate_stock_on_commit([(instance.product_id, instance.warehouse_id)])
+
+
+@receiver(post_delete, sender=Stock)
+def invalidate_stock_on_delete(sender, instance, **kwargs):
+    invalidate_stock_on_commit([(instance.product_id, instance.warehouse_id)])
@@ -0,0 +1,201 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.db import connections
+
+from .forecasting import load_demand, safety_factors
+
+# Upper bound on policy x replication cells simulated per chunk, keeps the
+# order pipeline array around 100 MB for a 25-day lead time
+CHUNK_CELLS = 1_000_000
+
+
+def simulate_chunk(reorder_point, order_qty, lead_time, history, history_length,
+                   mean, std, replications=1000, days=180, warmup=30, seed=None):
+    """
+    Simulate (s, Q) inventory dynamics for a chunk of policies, every
+    replication of every policy at once.
+
+    Each day arriving orders are received, demand is drawn (bootstrapped from
+    the policy's daily sales history, or normal(mean, std) without history),
+    unmet demand is lost, and whenever the inventory position drops to s or
+    below enough multiples of Q are ordered to bring it back above s; they
+    arrive after the lead time. Stock starts at s + Q and the first `warmup`
+    days are not measured.
+
+    Returns a dict of per-policy arrays: fill_rate, stockout_rate (share of
+    days with lost sales), avg_stock and orders_per_month.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(reorder_point)
+    rows = np.arange(n)
+    s = reorder_point.astype(np.int32)[:, None]
+    q = np.maximum(order_qty, 1).astype(np.int32)[:, None]
+    # Orders placed today arrive tomorrow at the earliest
+    lead_time = np.maximum(lead_time.astype(np.int64), 1)
+    slots = int(lead_time.max()) + 1
+
+    has_history = (history_length > 0)[:, None]
+    any_history, all_history = has_history.any(), has_history.all()
+    # Bootstrap draws index the flattened history matrix directly
+    flat_history = history.astype(np.int32).ravel()
+    history_offset = (rows * history.shape[1])[:, None]
+    history_span = np.maximum(history_length, 1)[:, None].astype(np.uint32)
+
+    on_hand = np.repeat(s + q, replications, axis=1)
+    on_order = np.zeros_like(on_hand)
+    pipeline = np.zeros((slots, n * replications), dtype=np.int32)
+
+    total_demand = np.zeros(n)
+    total_sold = np.zeros(n)
+    stockout_days = np.zeros(n)
+    stock_days = np.zeros(n)
+    orders = np.zeros(n)
+
+    for t in range(warmup + days):
+        slot = t % slots
+        arriving = pipeline[slot].reshape(n, replications)
+        on_hand += arriving
+        on_order -= arriving
+        arriving[:] = 0
+
+        if any_history:
+            # 16-bit uniform draws scaled to each history length
+            draw = rng.integers(0, 1 << 16, (n, replications), dtype=np.uint16) * history_span >> 16
+            demand = flat_history[draw + history_offset]
+        if not all_history:
+            normal = np.maximum(np.rint(rng.normal(mean[:, None], std[:, None], (n, replications))), 0).astype(np.int32)
+            demand = np.where(has_history, demand, normal) if any_history else normal
+        sold = np.minimum(on_hand, demand)
+        on_hand -= sold
+
+        # Only a small share of replications reorders on any given day
+        shortfall = (s - (on_hand + on_order)).ravel()
+        cells = np.flatnonzero(shortfall >= 0)
+        i = cells // replications
+        order = (shortfall[cells] // q[i, 0] + 1) * q[i, 0]
+        pipeline[(t + lead_time[i]) % slots, cells] += order
+        on_order.ravel()[cells] += order
+
+        if t >= warmup:
+            total_demand += demand.sum(axis=1)
+            total_sold += sold.sum(axis=1)
+            stockout_days += (demand > sold).sum(axis=1)
+            stock_days += on_hand.sum(axis=1)
+            orders += np.bincount(i, minlength=n)
+
+    measured = days * replications
+    return {
+        'fill_rate': np.divide(total_sold, total_demand, out=np.ones(n), where=total_demand > 0),
+        'stockout_rate': stockout_days / measured,
+        'avg_stock': stock_days / measured,
+        'orders_per_month': orders / measured * 30,
+    }
+
+
+def _simulate_chunk(kwargs):
+    return simulate_chunk(**kwargs)
+
+
+def _close_connections():
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+def simulate_policies(policies, service_level=None, lead_time_days=None, replications=1000,
+                      days=180, warmup=30, history_days=365, workers=1, seed=None):
+    """
+    Run the Monte Carlo simulation for ReorderPolicy rows.
+
+    `service_level` / `lead_time_days` override the stored values; the
+    reorder point is then recomputed with the forecasting formula
+    (avg_daily_demand * L + z * demand_std * sqrt(L)). Demand is resampled
+    from the last `history_days` days of sales of each product and warehouse.
+    Returns a list of dicts, one per policy, with the simulated s, Q, lead time
+    and the metrics of simulate_chunk().
+    """
+    policies = list(policies.select_related('product', 'warehouse'))
+    if not policies:
+        return []
+
+    keys, matrix = load_demand(history_days)
+    index = {key: i for i, key in enumerate(keys)}
+
+    n = len(policies)
+    mean = np.array([float(p.avg_daily_demand) for p in policies])
+    std = np.array([float(p.demand_std) for p in policies])
+    lead_time = np.array([
+        float(lead_time_days if lead_time_days is not None else p.lead_time_days) for p in policies
+    ])
+    if service_level is None and lead_time_days is None:
+        reorder_point = np.array([p.rop for p in policies])
+    else:
+        z = safety_factors([
+            float(service_level if service_level is not None else p.service_level) for p in policies
+        ])
+        reorder_point = np.ceil(mean * lead_time + z * std * np.sqrt(lead_time)).astype(int)
+    order_qty = np.array([p.reorder_qty for p in policies])
+
+    # Demand history since the first sale, left-aligned per policy
+    history = np.zeros((n, max(matrix.shape[1], 1)), dtype=np.int64)
+    history_length = np.zeros(n, dtype=int)
+    for i, policy in enumerate(policies):
+        row = index.get((policy.product_id, policy.warehouse_id))
+        if row is None or not matrix[row].any():
+            continue
+        series = matrix[row, np.argmax(matrix[row] > 0):]
+        history[i, :len(series)] = series
+        history_length[i] = len(series)
+
+    lead_days = np.ceil(lead_time).astype(int)
+    # Similar lead times in one chunk keep the pipeline array small, and
+    # grouping policies with and without history avoids drawing both kinds of demand
+    order = np.lexsort((lead_days, history_length > 0))
+    chunk_size = max(1, CHUNK_CELLS // replications)
+    seeds = np.random.SeedSequence(seed).spawn(math.ceil(n / chunk_size))
+    chunks = []
+    for number, start in enumerate(range(0, n, chunk_size)):
+        part = order[start:start + chunk_size]
+        chunks.append((part, {
+            'reorder_point': reorder_point[part],
+            'order_qty': order_qty[part],
+            'lead_time': lead_days[part],
+            'history': history[part],
+            'history_length': history_length[part],
+            'mean': mean[part],
+            'std': std[part],
+            'replications': replications,
+            'days': days,
+            'warmup': warmup,
+            'seed': seeds[number],
+        }))
+
+    if workers > 1 and len(chunks) > 1:
+        _close_connections()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_close_connections
+        ) as pool:
+            results = list(pool.map(_simulate_chunk, [kwargs for _, kwargs in chunks]))
+    else:
+        results = [simulate_chunk(**kwargs) for _, kwargs in chunks]
+
+    metrics = {name: np.zeros(n) for name in results[0]}
+    for (part, _), result in zip(chunks, results):
+        for name, values in result.items():
+            metrics[name][part] = values
+
+    return [
+        {
+            'policy': policy,
+            'reorder_point': int(reorder_point[i]),
+            'order_qty': int(max(order_qty[i], 1)),
+            'lead_time': int(lead_days[i]),
+            'bootstrapped': bool(history_length[i]),
+            **{name: float(values[i]) for name, values in metrics.items()},
+        }
+        for i, policy in enumerate(policies)
+    ]
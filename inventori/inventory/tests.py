@@ -0,0 +1,76 @@
+import threading
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from .forms import StockTransferForm
+from .models import DocumentSequence
+from .sequences import is_sequence_number, next_number, next_numbers
+
+
+class NextNumberConcurrencyTest(TransactionTestCase):
+    """
+    Numbers allocated by concurrent transactions never repeat
+    """
+
+    THREADS = 8
+    PER_THREAD = 25
+
+    def test_concurrent_allocations_are_unique(self):
+        numbers = []
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(self.THREADS)
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.PER_THREAD):
+                    with transaction.atomic():
+                        number = next_number('TST')
+                    with lock:
+                        numbers.append(number)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        total = self.THREADS * self.PER_THREAD
+        self.assertEqual(len(numbers), total)
+        self.assertEqual(len(set(numbers)), total)
+        self.assertEqual(DocumentSequence.objects.get(prefix='TST').last_value, total)
+
+
+class NextNumberTest(TestCase):
+    def test_numbers_are_consecutive_and_padded(self):
+        self.assertEqual(next_number('TST'), 'TST-000001')
+        self.assertEqual(next_numbers('TST', 3), ['TST-000002', 'TST-000003', 'TST-000004'])
+
+    def test_rolled_back_number_is_reused(self):
+        try:
+            with transaction.atomic():
+                next_number('TST')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(next_number('TST'), 'TST-000001')
+
+    def test_sequence_format_is_recognised(self):
+        self.assertTrue(is_sequence_number('PO', 'PO-000010'))
+        self.assertTrue(is_sequence_number('PO', 'PO-1000000'))
+        self.assertFalse(is_sequence_number('PO', 'PO-10'))
+        self.assertFalse(is_sequence_number('PO', 'PO/2025/000010'))
+        self.assertFalse(is_sequence_number('PO', 'GRN-000010'))
+
+    def test_typed_number_in_sequence_format_is_rejected(self):
+        form = StockTransferForm(data={'transfer_number': 'TRF-000010'})
+        form.is_valid()
+        self.assertIn('transfer_number', form.errors)
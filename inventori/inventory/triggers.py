@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.db import connection as default_connection
+
+TRIGGER_NAME = 'stock_move_apply'
+
+# Every inserted movement adds qty_in - qty_out to its stock row, creating
+# the row on the first movement of a product in a warehouse
+SQLITE_INSTALL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TRIGGER_NAME} AFTER INSERT ON stock_move
+    BEGIN
+        INSERT INTO stock (product_id, warehouse_id, qty)
+        VALUES (NEW.product_id, NEW.warehouse_id, NEW.qty_in - NEW.qty_out)
+        ON CONFLICT (product_id, warehouse_id) DO UPDATE SET qty = qty + excluded.qty;
+    END
+    """,
+]
+SQLITE_REMOVE = [f'DROP TRIGGER IF EXISTS {TRIGGER_NAME}']
+
+POSTGRESQL_INSTALL = [
+    f"""
+    CREATE OR REPLACE FUNCTION {TRIGGER_NAME}() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO stock (product_id, warehouse_id, qty)
+        VALUES (NEW.product_id, NEW.warehouse_id, NEW.qty_in - NEW.qty_out)
+        ON CONFLICT (product_id, warehouse_id) DO UPDATE SET qty = stock.qty + EXCLUDED.qty;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    f'DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON stock_move',
+    f"""
+    CREATE TRIGGER {TRIGGER_NAME} AFTER INSERT ON stock_move
+    FOR EACH ROW EXECUTE FUNCTION {TRIGGER_NAME}()
+    """,
+]
+POSTGRESQL_REMOVE = [
+    f'DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON stock_move',
+    f'DROP FUNCTION IF EXISTS {TRIGGER_NAME}()',
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_INSTALL, SQLITE_REMOVE),
+    'postgresql': (POSTGRESQL_INSTALL, POSTGRESQL_REMOVE),
+}
+
+
+def triggers_enabled():
+    """
+    Whether stock is maintained by the database (INVENTORY_STOCK_TRIGGERS).
+    Application code then writes only stock_move rows.
+    """
+    return getattr(settings, 'INVENTORY_STOCK_TRIGGERS', False)
+
+
+def _statements(connection, index):
+    if connection.vendor not in STATEMENTS:
+        raise NotImplementedError(f'Trigger stok tidak didukung untuk database {connection.vendor}')
+    return STATEMENTS[connection.vendor][index]
+
+
+def install_stock_triggers(connection=None):
+    """
+    Install the stock_move insert trigger (SQLite or PostgreSQL)
+    """
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        for sql in _statements(connection, 0):
+            cursor.execute(sql)
+
+
+def remove_stock_triggers(connection=None):
+    """
+    Drop the stock_move insert trigger
+    """
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        for sql in _statements(connection, 1):
+            cursor.execute(sql)
+
+
+def stock_triggers_installed(connection=None):
+    """
+    Whether the stock_move insert trigger exists in the database
+    """
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = %s", [TRIGGER_NAME])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT 1 FROM pg_trigger WHERE tgname = %s AND tgrelid = 'stock_move'::regclass",
+                [TRIGGER_NAME]
+            )
+        else:
+            return False
+        return cursor.fetchone() is not None
@@ -12,11 +12,26 @@ urlpatterns = [
     
     # Stock URLs
     path('stocks/', views.stock_list, name='stock_list'),
+    path('stocks/api/', views.stock_list_api, name='stock_list_api'),
+    path('stocks/lookup/', views.stock_lookup, name='stock_lookup'),
     path('stocks/adjustment/', views.stock_adjustment, name='stock_adjustment'),
+    path('stocks/adjustment/import/', views.stock_adjustment_import, name='stock_adjustment_import'),
     
     # Stock Movement URLs
     path('movements/', views.stock_movement_list, name='stock_movement_list'),
     
+    # Stock Transfer URLs
+    path('transfers/', views.transfer_list, name='transfer_list'),
+    path('transfers/create/', views.transfer_create, name='transfer_create'),
+    path('transfers/<int:pk>/', views.transfer_detail, name='transfer_detail'),
+    path('transfers/rebalancing/', views.rebalancing_suggestions, name='rebalancing_suggestions'),
+    
+    # Cycle Count URLs
+    path('counts/', views.count_session_list, name='count_session_list'),
+    path('counts/create/', views.count_session_create, name='count_session_create'),
+    path('counts/<int:pk>/', views.count_session_detail, name='count_session_detail'),
+    path('counts/<int:pk>/submit/', views.count_session_submit, name='count_session_submit'),
+    
     # Reorder Policy URLs
     path('reorder-policies/', views.reorder_policy_list, name='reorder_policy_list'),
     path('reorder-policies/create/', views.reorder_policy_create, name='reorder_policy_create'),
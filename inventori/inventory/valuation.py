@@ -0,0 +1,310 @@
+from collections import defaultdict, deque, namedtuple
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, F, Min, Exists, OuterRef, Subquery
+from django.utils import timezone
+from master.models import Product
+from .models import Stock, StockMove, StockMoveArchive, StockValuation, CostLayer
+
+COST_PLACES = Decimal('0.0001')
+
+
+# Stock held before the first costed movement, received as one movement without an id
+Opening = namedtuple('Opening', ['id', 'moved_at', 'unit_cost'])
+
+
+def fifo_enabled():
+    return getattr(settings, 'INVENTORY_VALUATION_METHOD', 'AVERAGE') == 'FIFO'
+
+
+def fallback_costs(product_ids=None):
+    """
+    Unit cost for stock that has no costed receipt, as {product_id: cost}:
+    the price of the product's latest purchase order line, or its selling
+    price when it was never purchased. All products when product_ids is None.
+    """
+    from purchases.models import POItem
+
+    last_po_price = POItem.objects.filter(product=OuterRef('pk')).order_by(
+        '-purchase_order__ordered_at', '-id'
+    ).values('price')[:1]
+    products = Product.objects.annotate(po_price=Subquery(last_po_price))
+    chunks = [None] if product_ids is None else [
+        sorted(product_ids)[start:start + 500] for start in range(0, len(product_ids), 500)
+    ]
+    costs = {}
+    for chunk in chunks:
+        rows = products if chunk is None else products.filter(id__in=chunk)
+        for product_id, po_price, price in rows.values_list('id', 'po_price', 'price').iterator(chunk_size=2000):
+            costs[product_id] = Decimal(po_price if po_price is not None else price)
+    return costs
+
+
+class CostEngine:
+    """
+    Incremental cost engine over stock movements.
+
+    Keeps a StockValuation per (product, warehouse) with the weighted-average
+    cost and, when FIFO costing is enabled, the open cost layers. Inbound
+    moves without a unit_cost (adjustments, returns) come in at the current
+    average cost, so they change quantity but not the unit cost; without an
+    average cost yet they come in at fallback_costs().
+    """
+
+    def __init__(self, fifo=None):
+        self.fifo = fifo_enabled() if fifo is None else fifo
+        self.valuations = {}
+        self.layers = defaultdict(deque)
+        self.exhausted_layer_ids = []
+        self.fallback = {}
+
+    def fallback_cost(self, product_id):
+        if product_id not in self.fallback:
+            self.fallback.update(fallback_costs([product_id]))
+        return self.fallback.get(product_id, Decimal('0'))
+
+    def open(self, key, qty, received_at):
+        """
+        Receive an opening balance of qty at the fallback cost
+        """
+        opening = Opening(None, received_at, self.fallback_cost(key[0]))
+        self._receive(key, self._valuation(key), qty, opening)
+
+    def open_missing(self, moves):
+        """
+        Give (product, warehouse) pairs of these moves that have no valuation
+        row yet the stock they held before the moves as an opening balance.
+        Call after load(), with Stock already updated by the moves.
+        """
+        net = defaultdict(int)
+        for move in moves:
+            net[(move.product_id, move.warehouse_id)] += move.qty_in - move.qty_out
+        missing = [key for key in net if key not in self.valuations]
+        if not missing:
+            return
+        stock = {
+            (product_id, warehouse_id): qty
+            for product_id, warehouse_id, qty in Stock.objects.filter(
+                product_id__in={key[0] for key in missing},
+                warehouse_id__in={key[1] for key in missing},
+            ).values_list('product_id', 'warehouse_id', 'qty')
+        }
+        self.fallback.update(fallback_costs({key[0] for key in missing}))
+        received_at = min(move.moved_at for move in moves)
+        for key in missing:
+            opening = stock.get(key, 0) - net[key]
+            if opening > 0:
+                self.open(key, opening, received_at)
+
+    def load(self, keys):
+        """
+        Load the current state for (product_id, warehouse_id) keys, one query
+        per 500 products (plus one for the FIFO layers)
+        """
+        keys = set(keys) - set(self.valuations)
+        product_ids = sorted({k[0] for k in keys})
+        warehouse_ids = {k[1] for k in keys}
+        for start in range(0, len(product_ids), 500):
+            chunk = product_ids[start:start + 500]
+            for valuation in StockValuation.objects.select_for_update().filter(
+                product_id__in=chunk, warehouse_id__in=warehouse_ids
+            ):
+                key = (valuation.product_id, valuation.warehouse_id)
+                if key in keys:
+                    self.valuations[key] = valuation
+            if self.fifo:
+                for layer in CostLayer.objects.filter(
+                    product_id__in=chunk, warehouse_id__in=warehouse_ids, qty_remaining__gt=0
+                ).order_by('received_at', 'id'):
+                    key = (layer.product_id, layer.warehouse_id)
+                    if key in keys:
+                        self.layers[key].append(layer)
+
+    def _valuation(self, key):
+        valuation = self.valuations.get(key)
+        if valuation is None:
+            valuation = StockValuation(product_id=key[0], warehouse_id=key[1])
+            self.valuations[key] = valuation
+        return valuation
+
+    def apply(self, move):
+        """
+        Apply one movement (a StockMove or anything with the same attributes)
+        """
+        key = (move.product_id, move.warehouse_id)
+        valuation = self._valuation(key)
+        net = move.qty_in - move.qty_out
+        if net > 0:
+            self._receive(key, valuation, net, move)
+        elif net < 0:
+            self._issue(key, valuation, -net)
+
+    def _receive(self, key, valuation, qty, move):
+        if move.unit_cost is not None:
+            unit_cost = move.unit_cost
+        elif valuation.avg_cost:
+            unit_cost = valuation.avg_cost
+        else:
+            unit_cost = self.fallback_cost(key[0])
+        unit_cost = Decimal(unit_cost)
+        valuation.total_cost += unit_cost * qty
+        valuation.qty += qty
+        valuation.avg_cost = (valuation.total_cost / valuation.qty).quantize(COST_PLACES)
+        if self.fifo:
+            self.layers[key].append(CostLayer(
+                product_id=key[0],
+                warehouse_id=key[1],
+                move_id=move.id,
+                received_at=move.moved_at,
+                qty_remaining=qty,
+                unit_cost=unit_cost
+            ))
+            valuation.fifo_cost += unit_cost * qty
+
+    def _issue(self, key, valuation, qty):
+        # Stock never goes below zero, so neither does its value
+        if qty >= valuation.qty:
+            valuation.qty = 0
+            valuation.total_cost = Decimal('0')
+        else:
+            valuation.total_cost -= valuation.avg_cost * qty
+            valuation.qty -= qty
+
+        if self.fifo:
+            layers = self.layers[key]
+            while qty > 0 and layers:
+                layer = layers[0]
+                taken = min(qty, layer.qty_remaining)
+                layer.qty_remaining -= taken
+                valuation.fifo_cost -= layer.unit_cost * taken
+                qty -= taken
+                if layer.qty_remaining == 0:
+                    layers.popleft()
+                    if layer.pk:
+                        self.exhausted_layer_ids.append(layer.pk)
+            if not layers:
+                valuation.fifo_cost = Decimal('0')
+
+    def save(self):
+        """
+        Write the changed state back with bulk operations
+        """
+        valuations = list(self.valuations.values())
+        StockValuation.objects.bulk_update(
+            [v for v in valuations if v.pk], ['qty', 'avg_cost', 'total_cost', 'fifo_cost'], batch_size=500
+        )
+        StockValuation.objects.bulk_create([v for v in valuations if not v.pk], batch_size=500)
+
+        if self.fifo:
+            open_layers = [layer for layers in self.layers.values() for layer in layers]
+            CostLayer.objects.bulk_update([l for l in open_layers if l.pk], ['qty_remaining'], batch_size=500)
+            CostLayer.objects.bulk_create([l for l in open_layers if not l.pk], batch_size=500)
+            for start in range(0, len(self.exhausted_layer_ids), 500):
+                CostLayer.objects.filter(id__in=self.exhausted_layer_ids[start:start + 500]).delete()
+            self.exhausted_layer_ids = []
+
+
+def apply_moves(moves):
+    """
+    Feed newly created stock movements (in chronological order) into the
+    maintained valuation, ideally inside the transaction that created them.
+    """
+    moves = list(moves)
+    if not moves:
+        return
+    with transaction.atomic():
+        engine = CostEngine()
+        engine.load((m.product_id, m.warehouse_id) for m in moves)
+        engine.open_missing(moves)
+        for move in moves:
+            engine.apply(move)
+        engine.save()
+
+
+def average_costs(keys):
+    """
+    Current weighted-average unit cost for (product_id, warehouse_id) keys
+    """
+    keys = set(keys)
+    costs = {}
+    for product_id, warehouse_id, avg_cost in StockValuation.objects.filter(
+        product_id__in={k[0] for k in keys},
+        warehouse_id__in={k[1] for k in keys},
+    ).values_list('product_id', 'warehouse_id', 'avg_cost'):
+        if (product_id, warehouse_id) in keys:
+            costs[(product_id, warehouse_id)] = avg_cost
+    return costs
+
+
+def inventory_value(warehouse_id=None):
+    """
+    Total inventory value read from the maintained valuation table. Stock
+    without a valuation row yet (before the first recost) is valued at
+    qty * product price.
+    """
+    valuations = StockValuation.objects.all()
+    unvalued = Stock.objects.filter(~Exists(StockValuation.objects.filter(
+        product_id=OuterRef('product_id'), warehouse_id=OuterRef('warehouse_id')
+    )))
+    if warehouse_id:
+        valuations = valuations.filter(warehouse_id=warehouse_id)
+        unvalued = unvalued.filter(warehouse_id=warehouse_id)
+    field = 'fifo_cost' if fifo_enabled() else 'total_cost'
+    valued = valuations.aggregate(total=Sum(field))['total'] or 0
+    return valued + (unvalued.aggregate(total=Sum(F('qty') * F('product__price')))['total'] or 0)
+
+
+def recost(chunk_size=5000):
+    """
+    Rebuild the valuation from scratch with one streaming pass over the
+    archived and live stock movements in chronological order.
+    Returns the number of movements replayed.
+    
+    Raises ValueError when part of the history was archived to an export
+    file, since those movements can no longer be replayed.
+    """
+    exported = StockMoveArchive.last_exported_period()
+    if exported:
+        raise ValueError(
+            f'Detail pergerakan stok sampai {exported:%Y-%m} diarsipkan ke file export, '
+            'nilai persediaan tidak dapat dihitung ulang dari histori'
+        )
+    engine = CostEngine()
+    engine.fallback = fallback_costs()
+    replayed = 0
+    fields = ['id', 'product_id', 'warehouse_id', 'qty_in', 'qty_out', 'unit_cost', 'moved_at']
+
+    # Stock beyond what the movements account for (initial stock loaded
+    # without movements) is opened before the first movement
+    net = defaultdict(int)
+    first_moved = []
+    for model in (StockMoveArchive, StockMove):
+        for row in model.objects.values('product_id', 'warehouse_id').annotate(
+            net=Sum(F('qty_in') - F('qty_out')), first_moved=Min('moved_at')
+        ).order_by():
+            net[(row['product_id'], row['warehouse_id'])] += row['net']
+            first_moved.append(row['first_moved'])
+    received_at = min(first_moved, default=timezone.now())
+    for product_id, warehouse_id, qty in Stock.objects.values_list('product_id', 'warehouse_id', 'qty').iterator(chunk_size=chunk_size):
+        opening = qty - net[(product_id, warehouse_id)]
+        if opening > 0:
+            engine.open((product_id, warehouse_id), opening, received_at)
+
+    # Archived movements are all older than the live ones
+    for model in (StockMoveArchive, StockMove):
+        for move in model.objects.order_by('moved_at', 'id').only(*fields).iterator(chunk_size=chunk_size):
+            engine.apply(move)
+            replayed += 1
+
+    with transaction.atomic():
+        CostLayer.objects.all().delete()
+        StockValuation.objects.all().delete()
+        for valuation in engine.valuations.values():
+            valuation.pk = None
+        for layers in engine.layers.values():
+            for layer in layers:
+                layer.pk = None
+        engine.exhausted_layer_ids = []
+        engine.save()
+    return replayed
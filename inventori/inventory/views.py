@@ -1,11 +1,38 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from django.db import transaction
 from django.db.models import Q, F
 from django.core.exceptions import PermissionDenied
-from .models import Warehouse, Stock, StockMove, ReorderPolicy
-from .forms import WarehouseForm, StockForm, StockMoveForm, ReorderPolicyForm
+from django.utils import timezone
+from .models import Warehouse, Stock, StockMove, ReorderPolicy, StockTransfer, StockTransferItem, CountSession, ItemClass
+from .forms import WarehouseForm, StockForm, StockMoveForm, ReorderPolicyForm, StockTransferForm, StockTransferItemForm, CSVUploadForm, StockImportForm, CountSessionForm
+from .services import update_stock, next_transfer_number, post_transfer, add_transfer_lines, InsufficientStockError, freeze_count_session, submit_counts, post_count_session
+from .imports import import_transfer_csv, import_stock_adjustments, resolve_skus
+from .pagination import keyset_paginate
+from .rebalancing import plan_rebalancing, create_transfer_drafts
+from .sequences import next_number
 from master.models import Product
+from master.cache import get_product_by_sku
+from datetime import datetime, timedelta
+import json
+
+MOVEMENT_PAGE_SIZE = 50
+STOCK_PAGE_SIZE = 50
+STOCK_API_MAX_LIMIT = 500
+
+# Keyset orderings of the stock list; the last key is unique so every row has a position
+STOCK_SORTS = {
+    'product': ('product__name', 'id'),
+    '-product': ('-product__name', '-id'),
+    'warehouse': ('warehouse__name', 'product__name', 'id'),
+    '-warehouse': ('-warehouse__name', 'product__name', 'id'),
+    'qty': ('qty', 'id'),
+    '-qty': ('-qty', '-id'),
+}
 
 
 @login_required
@@ -55,6 +82,63 @@ def warehouse_delete(request, pk):
     return render(request, 'inventory/warehouse_confirm_delete.html', {'warehouse': warehouse})
 
 
+def _filter_item_class(stocks, abc_class=None, xyz_class=None):
+    """
+    Filter a Stock queryset on its ABC/XYZ class with a join on item_class,
+    so a warehouse + class filter can start from idx_ic_wh_class
+    """
+    conditions = {}
+    if abc_class:
+        conditions['product__itemclass__abc_class'] = abc_class
+    if xyz_class:
+        conditions['product__itemclass__xyz_class'] = xyz_class
+    if not conditions:
+        return stocks
+    # One filter() call, so every condition applies to the same item_class row
+    return stocks.filter(product__itemclass__warehouse=F('warehouse'), **conditions)
+
+
+def _attach_item_class(stocks):
+    """
+    Set abc_class/xyz_class on loaded Stock rows (a page) with one query
+    """
+    stocks = list(stocks)
+    classes = {}
+    if stocks:
+        classes = {
+            (product_id, warehouse_id): (abc_class, xyz_class)
+            for product_id, warehouse_id, abc_class, xyz_class in ItemClass.objects.filter(
+                product_id__in={stock.product_id for stock in stocks},
+                warehouse_id__in={stock.warehouse_id for stock in stocks}
+            ).values_list('product_id', 'warehouse_id', 'abc_class', 'xyz_class')
+        }
+    for stock in stocks:
+        stock.abc_class, stock.xyz_class = classes.get((stock.product_id, stock.warehouse_id), (None, None))
+    return stocks
+
+
+def _stock_filters(params):
+    """
+    Filtered and annotated Stock queryset plus the keyset ordering for the
+    stock list page and its JSON API
+    """
+    warehouse_id = params.get('warehouse', '')
+    product_id = params.get('product', '')
+    
+    # Ids that are not numbers are ignored rather than passed to the query
+    stocks = Stock.objects.select_related('product', 'warehouse')
+    if warehouse_id.isdigit():
+        stocks = stocks.filter(warehouse_id=warehouse_id)
+    if product_id.isdigit():
+        stocks = stocks.filter(product_id=product_id)
+    stocks = _filter_item_class(stocks, params.get('abc'), params.get('xyz'))
+    
+    sort = params.get('sort')
+    if sort not in STOCK_SORTS:
+        sort = 'product'
+    return stocks, sort
+
+
 @login_required
 def stock_list(request):
     # Check if user has permission to access stocks
@@ -64,28 +148,121 @@ def stock_list(request):
     # Get filter parameters
     warehouse_id = request.GET.get('warehouse')
     product_id = request.GET.get('product')
+    abc_class = request.GET.get('abc')
+    xyz_class = request.GET.get('xyz')
     
-    stocks = Stock.objects.select_related('product', 'warehouse').all()
+    stocks, sort = _stock_filters(request.GET)
+    page = keyset_paginate(
+        stocks,
+        ordering=STOCK_SORTS[sort],
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        limit=STOCK_PAGE_SIZE
+    )
+    _attach_item_class(page.rows)
     
-    # Apply filters
-    if warehouse_id:
-        stocks = stocks.filter(warehouse_id=warehouse_id)
-    if product_id:
-        stocks = stocks.filter(product_id=product_id)
+    # Keep the filters in the pagination and sort links
+    filter_query = request.GET.copy()
+    filter_query.pop('after', None)
+    filter_query.pop('before', None)
+    sort_query = filter_query.copy()
+    sort_query.pop('sort', None)
     
-    # Get all warehouses and products for filter dropdown
-    warehouses = Warehouse.objects.all()
-    products = Product.objects.filter(is_active=True)
+    # Only the selected filter values are loaded; other choices come from stock_lookup
+    selected_warehouse_obj = Warehouse.objects.filter(id=warehouse_id).first() if warehouse_id and warehouse_id.isdigit() else None
+    selected_product_obj = Product.objects.filter(id=product_id).first() if product_id and product_id.isdigit() else None
     
     return render(request, 'inventory/stock_list.html', {
-        'stocks': stocks,
-        'warehouses': warehouses,
-        'products': products,
+        'stocks': page,
+        'page': page,
+        'filter_query': filter_query.urlencode(),
+        'sort_query': sort_query.urlencode(),
+        'sort': sort,
         'selected_warehouse': warehouse_id,
-        'selected_product': product_id
+        'selected_product': product_id,
+        'selected_warehouse_obj': selected_warehouse_obj,
+        'selected_product_obj': selected_product_obj,
+        'abc_choices': ItemClass.ABC_CHOICES,
+        'xyz_choices': ItemClass.XYZ_CHOICES,
+        'selected_abc': abc_class,
+        'selected_xyz': xyz_class
+    })
+
+
+@login_required
+def stock_list_api(request):
+    """
+    Cursor-paginated stock list as JSON, with the filters and sort keys of
+    the stock list page (?warehouse=&product=&abc=&xyz=&sort=&after=&before=&limit=)
+    """
+    # Check if user has permission to access stocks
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', STOCK_PAGE_SIZE)), 1), STOCK_API_MAX_LIMIT)
+    except ValueError:
+        limit = STOCK_PAGE_SIZE
+    
+    stocks, sort = _stock_filters(request.GET)
+    page = keyset_paginate(
+        stocks,
+        ordering=STOCK_SORTS[sort],
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        limit=limit
+    )
+    _attach_item_class(page.rows)
+    
+    return JsonResponse({
+        'results': [
+            {
+                'id': stock.id,
+                'product_id': stock.product_id,
+                'product': stock.product.name,
+                'sku': stock.product.sku,
+                'warehouse_id': stock.warehouse_id,
+                'warehouse': stock.warehouse.name,
+                'qty': stock.qty,
+                'min_stock': stock.product.min_stock,
+                'abc_class': stock.abc_class,
+                'xyz_class': stock.xyz_class,
+            }
+            for stock in page
+        ],
+        'sort': sort,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
     })
 
 
+@login_required
+def stock_lookup(request):
+    """
+    AJAX lookup for the stock list filters: ?field=product|warehouse&q=
+    returns at most 10 matches
+    """
+    # Check if user has permission to access stocks
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+    
+    q = request.GET.get('q', '').strip()
+    if request.GET.get('field') == 'warehouse':
+        warehouses = Warehouse.objects.order_by('name')
+        if q:
+            warehouses = warehouses.filter(name__icontains=q)
+        results = [{'id': w.id, 'label': w.name} for w in warehouses[:10]]
+    else:
+        if len(q) < 2:
+            return JsonResponse({'results': []})
+        products = Product.objects.filter(
+            Q(name__icontains=q) | Q(sku__istartswith=q),
+            is_active=True
+        ).order_by('name')
+        results = [{'id': p.id, 'label': f'{p.name} ({p.sku})'} for p in products[:10]]
+    return JsonResponse({'results': results})
+
+
 @login_required
 def stock_adjustment(request):
     """
@@ -105,34 +282,11 @@ def stock_adjustment(request):
         product = get_object_or_404(Product, id=product_id)
         warehouse = get_object_or_404(Warehouse, id=warehouse_id)
         
-        # Get or create stock record
-        stock, created = Stock.objects.get_or_create(
-            product=product,
-            warehouse=warehouse,
-            defaults={'qty': 0}
-        )
-        
-        # Update quantity based on adjustment type
-        if adjustment_type == 'in':
-            stock.qty += qty
-            qty_in = qty
-            qty_out = 0
-        else:
-            stock.qty = max(0, stock.qty - qty)  # Prevent negative stock
-            qty_in = 0
-            qty_out = qty
-        
-        stock.save()
-        
-        # Create stock movement record
-        StockMove.objects.create(
-            product=product,
-            warehouse=warehouse,
-            ref_type='ADJUST',
-            qty_in=qty_in,
-            qty_out=qty_out,
-            note=note
-        )
+        # Stock and the ADJUST movement are written together (or only the
+        # movement when the database triggers maintain stock)
+        qty_change = qty if adjustment_type == 'in' else -qty
+        with transaction.atomic():
+            update_stock(product.id, warehouse.id, qty_change, 'ADJUST', None, note=note)
         
         messages.success(request, f'Stock adjustment for {product.name} completed successfully.')
         return redirect('inventory:stock_list')
@@ -147,14 +301,101 @@ def stock_adjustment(request):
     })
 
 
+@login_required
+def stock_adjustment_import(request):
+    """
+    Bulk stock adjustment from a CSV/XLSX file (e.g. after a stock take)
+    """
+    # Check if user has permission to access stock adjustment
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+    
+    applied = None
+    errors = []
+    if request.method == 'POST':
+        form = StockImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                applied, errors = import_stock_adjustments(
+                    form.cleaned_data['file'],
+                    note=form.cleaned_data['note']
+                )
+                messages.success(request, f'{applied} adjustment stok berhasil diproses')
+            except ValueError as e:
+                messages.error(request, str(e))
+    else:
+        form = StockImportForm()
+    
+    return render(request, 'inventory/stock_adjustment_import.html', {
+        'form': form,
+        'applied': applied,
+        'errors': errors,
+    })
+
+
 @login_required
 def stock_movement_list(request):
     # Check if user has permission to access stock movements
     if request.user.role not in ['warehouse', 'manager', 'admin']:
         raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
         
-    movements = StockMove.objects.select_related('product', 'warehouse').all().order_by('-moved_at')
-    return render(request, 'inventory/stock_movement_list.html', {'movements': movements})
+    # Get filter parameters
+    product_sku = request.GET.get('product_sku', '').strip()
+    warehouse_id = request.GET.get('warehouse', '')
+    if not warehouse_id.isdigit():
+        warehouse_id = ''
+    ref_type = request.GET.get('ref_type', '')
+    start_date_param = request.GET.get('start_date', '')
+    end_date_param = request.GET.get('end_date', '')
+
+    movements = StockMove.objects.select_related('product', 'warehouse')
+
+    # Apply filters (ranges on moved_at instead of __date so the indexes are used)
+    if product_sku:
+        product_id = Product.objects.filter(sku=product_sku).values_list('id', flat=True).first()
+        movements = movements.filter(product_id=product_id)
+    if warehouse_id:
+        movements = movements.filter(warehouse_id=warehouse_id)
+    if ref_type:
+        movements = movements.filter(ref_type=ref_type)
+    if start_date_param:
+        try:
+            start_date = datetime.strptime(start_date_param, "%Y-%m-%d")
+            movements = movements.filter(moved_at__gte=timezone.make_aware(start_date))
+        except ValueError:
+            start_date_param = ''
+    if end_date_param:
+        try:
+            end_date = datetime.strptime(end_date_param, "%Y-%m-%d") + timedelta(days=1)
+            movements = movements.filter(moved_at__lt=timezone.make_aware(end_date))
+        except ValueError:
+            end_date_param = ''
+
+    page = keyset_paginate(
+        movements,
+        ordering=('-moved_at', '-id'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        limit=MOVEMENT_PAGE_SIZE
+    )
+
+    # Keep the filters in the pagination links
+    filter_query = request.GET.copy()
+    filter_query.pop('after', None)
+    filter_query.pop('before', None)
+
+    return render(request, 'inventory/stock_movement_list.html', {
+        'movements': page,
+        'page': page,
+        'filter_query': filter_query.urlencode(),
+        'warehouses': Warehouse.objects.all(),
+        'ref_types': StockMove.REF_TYPE_CHOICES,
+        'product_sku': product_sku,
+        'selected_warehouse': warehouse_id,
+        'selected_ref_type': ref_type,
+        'start_date': start_date_param,
+        'end_date': end_date_param,
+    })
 
 
 @login_required
@@ -203,10 +444,14 @@ def low_stock_alerts(request):
     if request.user.role not in ['warehouse', 'manager', 'admin']:
         raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
         
+    abc_class = request.GET.get('abc')
+    xyz_class = request.GET.get('xyz')
+    
     # Get all stocks that are below the product's minimum stock level
     low_stocks = Stock.objects.select_related('product', 'warehouse').filter(
         Q(qty__lte=0) | Q(qty__lte=F('product__min_stock'))
     )
+    low_stocks = _attach_item_class(_filter_item_class(low_stocks, abc_class, xyz_class))
     
     # Also check against ROP (Reorder Point) if exists
     alert_items = []
@@ -240,4 +485,309 @@ def low_stock_alerts(request):
                     'alert_type': 'Low Stock'
                 })
     
-    return render(request, 'inventory/low_stock_alerts.html', {'alert_items': alert_items})
\ No newline at end of file
+    return render(request, 'inventory/low_stock_alerts.html', {
+        'alert_items': alert_items,
+        'abc_choices': ItemClass.ABC_CHOICES,
+        'xyz_choices': ItemClass.XYZ_CHOICES,
+        'selected_abc': abc_class,
+        'selected_xyz': xyz_class
+    })
+
+
+@login_required
+def transfer_list(request):
+    # Check if user has permission to access stock transfers
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+        
+    transfers = StockTransfer.objects.select_related(
+        'source_warehouse', 'destination_warehouse'
+    ).order_by('-created_at')
+    return render(request, 'inventory/transfer_list.html', {'transfers': transfers})
+
+
+@login_required
+def transfer_create(request):
+    # Check if user has permission to create stock transfers
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+        
+    if request.method == 'POST':
+        form = StockTransferForm(request.POST)
+        if form.is_valid():
+            with transaction.atomic():
+                transfer = form.save(commit=False)
+                transfer.transfer_number = transfer.transfer_number or next_transfer_number()
+                transfer.user = request.user
+                transfer.save()
+            messages.success(request, f'Transfer {transfer.transfer_number} berhasil dibuat')
+            return redirect('inventory:transfer_detail', pk=transfer.id)
+    else:
+        form = StockTransferForm()
+    
+    return render(request, 'inventory/transfer_form.html', {'form': form})
+
+
+@login_required
+def transfer_detail(request, pk):
+    """
+    Transfer document: add lines (one by one or by CSV upload), post or cancel
+    """
+    # Check if user has permission to access stock transfers
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+        
+    transfer = get_object_or_404(
+        StockTransfer.objects.select_related('source_warehouse', 'destination_warehouse'),
+        pk=pk
+    )
+    item_form = StockTransferItemForm()
+    upload_form = CSVUploadForm()
+    
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        
+        if transfer.status != 'DRAFT':
+            messages.error(request, f'Transfer {transfer.transfer_number} sudah {transfer.get_status_display()}')
+            return redirect('inventory:transfer_detail', pk=pk)
+        
+        if action == 'add_item':
+            item_form = StockTransferItemForm(request.POST)
+            if item_form.is_valid():
+                product_sku = item_form.cleaned_data['product_sku']
+                try:
+                    product = get_product_by_sku(product_sku)
+                except Product.DoesNotExist:
+                    messages.error(request, f'Produk dengan SKU {product_sku} tidak ditemukan')
+                    return redirect('inventory:transfer_detail', pk=pk)
+                
+                try:
+                    add_transfer_lines(transfer, [(product.id, item_form.cleaned_data['qty'])])
+                except ValueError as e:
+                    messages.error(request, str(e))
+                    return redirect('inventory:transfer_detail', pk=pk)
+                messages.success(request, f'{item_form.cleaned_data["qty"]} {product.name} ditambahkan ke transfer')
+                return redirect('inventory:transfer_detail', pk=pk)
+        
+        elif action == 'upload_csv':
+            upload_form = CSVUploadForm(request.POST, request.FILES)
+            if upload_form.is_valid():
+                imported, errors = import_transfer_csv(transfer, upload_form.cleaned_data['file'])
+                messages.success(request, f'{imported} baris berhasil diimpor')
+                for error in errors[:20]:
+                    messages.warning(request, error)
+                if len(errors) > 20:
+                    messages.warning(request, f'... dan {len(errors) - 20} kesalahan lainnya')
+                return redirect('inventory:transfer_detail', pk=pk)
+        
+        elif action == 'remove_item':
+            item = get_object_or_404(StockTransferItem, id=request.POST.get('item_id'), transfer=transfer)
+            item.delete()
+            messages.success(request, f'Item {item.product.name} dihapus dari transfer')
+            return redirect('inventory:transfer_detail', pk=pk)
+        
+        elif action == 'post_transfer':
+            try:
+                post_transfer(transfer)
+            except InsufficientStockError as e:
+                product_names = dict(Product.objects.filter(
+                    id__in=[key[0] for key in e.shortages]
+                ).values_list('id', 'name'))
+                for (product_id, _), (available, requested) in list(e.shortages.items())[:20]:
+                    messages.error(request, f'{product_names.get(product_id)}: stok {available}, diminta {requested}')
+                messages.error(request, str(e))
+                return redirect('inventory:transfer_detail', pk=pk)
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect('inventory:transfer_detail', pk=pk)
+            messages.success(request, f'Transfer {transfer.transfer_number} berhasil diposting')
+            return redirect('inventory:transfer_detail', pk=pk)
+        
+        elif action == 'cancel_transfer':
+            transfer.status = 'CANCELLED'
+            transfer.save(update_fields=['status'])
+            messages.success(request, f'Transfer {transfer.transfer_number} dibatalkan')
+            return redirect('inventory:transfer_list')
+    
+    transfer_items = transfer.items.select_related('product').order_by('product__name')
+    
+    return render(request, 'inventory/transfer_detail.html', {
+        'transfer': transfer,
+        'transfer_items': transfer_items,
+        'item_form': item_form,
+        'upload_form': upload_form,
+    })
+
+
+@login_required
+def rebalancing_suggestions(request):
+    """
+    Suggested transfers from warehouses with excess stock to warehouses
+    at or below ROP, and turning them into draft transfers
+    """
+    # Check if user has permission to access stock transfers
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+        
+    warehouse_ids = [int(w) for w in request.GET.getlist('warehouse') if w.isdigit()]
+    suggestions = plan_rebalancing(warehouse_ids or None)
+    
+    if request.method == 'POST':
+        if not suggestions:
+            messages.info(request, 'Tidak ada saran rebalancing')
+        else:
+            transfers = create_transfer_drafts(suggestions, user=request.user)
+            messages.success(
+                request,
+                f'{len(transfers)} draft transfer dibuat dengan {len(suggestions)} item'
+            )
+        return redirect('inventory:transfer_list')
+    
+    products = Product.objects.in_bulk({s.product_id for s in suggestions})
+    warehouses = Warehouse.objects.all()
+    warehouse_names = {w.id: w.name for w in warehouses}
+    rows = [
+        {
+            'product': products[s.product_id],
+            'source': warehouse_names[s.source_warehouse_id],
+            'destination': warehouse_names[s.destination_warehouse_id],
+            'qty': s.qty,
+        }
+        for s in suggestions
+    ]
+    
+    return render(request, 'inventory/rebalancing.html', {
+        'rows': rows,
+        'warehouses': warehouses,
+        'selected_warehouses': [str(w) for w in warehouse_ids],
+    })
+
+
+@login_required
+def count_session_list(request):
+    # Check if user has permission to access stock counts
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+        
+    sessions = CountSession.objects.select_related('warehouse').order_by('-created_at')
+    return render(request, 'inventory/count_session_list.html', {'sessions': sessions})
+
+
+@login_required
+def count_session_create(request):
+    """
+    Start a count session and freeze the expected quantities
+    """
+    # Check if user has permission to create stock counts
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+        
+    if request.method == 'POST':
+        form = CountSessionForm(request.POST)
+        if form.is_valid():
+            with transaction.atomic():
+                session = form.save(commit=False)
+                session.session_number = session.session_number or next_number('CNT')
+                session.user = request.user
+                session.save()
+                category = form.cleaned_data.get('category')
+                line_count = freeze_count_session(session, category_id=category.id if category else None)
+            messages.success(request, f'Sesi {session.session_number} dimulai dengan {line_count} item')
+            return redirect('inventory:count_session_detail', pk=session.id)
+    else:
+        form = CountSessionForm()
+    
+    return render(request, 'inventory/count_session_form.html', {'form': form})
+
+
+@login_required
+def count_session_detail(request, pk):
+    """
+    Count session lines with variances; post or cancel the session
+    """
+    # Check if user has permission to access stock counts
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+        
+    session = get_object_or_404(CountSession.objects.select_related('warehouse'), pk=pk)
+    
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        
+        if session.status != 'OPEN':
+            messages.error(request, f'Sesi {session.session_number} sudah {session.get_status_display()}')
+            return redirect('inventory:count_session_detail', pk=pk)
+        
+        if action == 'post_session':
+            try:
+                adjusted = post_count_session(session, zero_uncounted=request.POST.get('zero_uncounted') == 'on')
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect('inventory:count_session_detail', pk=pk)
+            messages.success(request, f'Sesi {session.session_number} diposting, {adjusted} item disesuaikan')
+            return redirect('inventory:count_session_detail', pk=pk)
+        
+        elif action == 'cancel_session':
+            session.status = 'CANCELLED'
+            session.save(update_fields=['status'])
+            messages.success(request, f'Sesi {session.session_number} dibatalkan')
+            return redirect('inventory:count_session_list')
+    
+    lines = session.lines.select_related('product').order_by('product__name', 'id')
+    if request.GET.get('show') == 'variance':
+        lines = lines.filter(counted_qty__isnull=False).exclude(counted_qty=F('expected_qty'))
+    elif request.GET.get('show') == 'uncounted':
+        lines = lines.filter(counted_qty__isnull=True)
+    paginator = Paginator(lines, 100)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    
+    return render(request, 'inventory/count_session_detail.html', {
+        'session': session,
+        'page_obj': page_obj,
+        'show': request.GET.get('show', ''),
+        'counted_count': session.lines.filter(counted_qty__isnull=False).count(),
+        'line_count': session.lines.count(),
+    })
+
+
+@login_required
+@require_POST
+def count_session_submit(request, pk):
+    """
+    JSON endpoint for batches of scanned counts:
+    {"mode": "add" | "set", "counts": [{"sku": "...", "qty": 1}, ...]}
+    """
+    # Check if user has permission to access stock counts
+    if request.user.role not in ['warehouse', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+        
+    session = get_object_or_404(CountSession, pk=pk)
+    if session.status != 'OPEN':
+        return JsonResponse({'success': False, 'error': f'Sesi {session.session_number} sudah {session.get_status_display()}'}, status=400)
+    
+    try:
+        payload = json.loads(request.body)
+        mode = payload.get('mode', 'add')
+        entries = [(str(entry['sku']).strip(), int(entry.get('qty', 1))) for entry in payload['counts']]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Format data tidak valid'}, status=400)
+    if mode not in ('add', 'set'):
+        return JsonResponse({'success': False, 'error': "mode harus 'add' atau 'set'"}, status=400)
+    
+    # Resolve every SKU in the batch with one query and merge repeated scans
+    product_ids = resolve_skus(sku for sku, _ in entries)
+    counts = {}
+    unknown = []
+    for sku, qty in entries:
+        if sku not in product_ids:
+            unknown.append(sku)
+        elif mode == 'add':
+            counts[product_ids[sku]] = counts.get(product_ids[sku], 0) + qty
+        else:
+            counts[product_ids[sku]] = qty
+    
+    try:
+        updated = submit_counts(session, counts, mode=mode)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'updated': updated, 'unknown': unknown})
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class MasterConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'master'
\ No newline at end of file
+    name = 'master'
+
+    def ready(self):
+        from . import signals  # noqa: F401
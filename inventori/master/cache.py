@@ -0,0 +1,147 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Product
+
+# Seconds an SKU lookup is kept in the shared cache (entries are also dropped on every product save/delete)
+SKU_CACHE_TIMEOUT = getattr(settings, 'SKU_CACHE_TIMEOUT', 3600)
+# Entries and seconds kept in each process' own LRU; other processes' saves reach it within the TTL
+SKU_LRU_SIZE = getattr(settings, 'SKU_LRU_SIZE', 10000)
+SKU_LRU_TTL = getattr(settings, 'SKU_LRU_TTL', 30)
+
+# The product fields a scan needs; the rest of the model is loaded on access
+FIELDS = ['id', 'sku', 'name', 'price', 'is_active']
+
+# Cached for SKUs that do not exist, so repeated bad scans stay off the database too
+UNKNOWN = 'unknown'
+
+GENERATION_KEY = 'sku:generation'
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU with a per-entry time to live
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = LRUCache(SKU_LRU_SIZE, SKU_LRU_TTL)
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+
+def _version_key(sku):
+    return f'sku:version:{sku}'
+
+
+def _key(sku, generation, version):
+    return f'sku:{generation}:{version}:{sku}'
+
+
+def _versions(sku):
+    # Generation and this SKU's version in one round trip; a missing version gets a fresh one
+    values = cache.get_many([GENERATION_KEY, _version_key(sku)])
+    version = values.get(_version_key(sku))
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(_version_key(sku), version, None)
+    return values.get(GENERATION_KEY, 0), version
+
+
+def _lookup(sku):
+    values = _local.get(sku)
+    if values is not None:
+        _stats['local_hits'] += 1
+        return values
+
+    # The row is stored under the version read before the query: when a save
+    # invalidates the SKU in between, the stale row lands under a version that
+    # is already retired and is never read
+    generation, version = _versions(sku)
+    values = cache.get(_key(sku, generation, version))
+    if values is not None:
+        _stats['shared_hits'] += 1
+    else:
+        _stats['misses'] += 1
+        values = Product.objects.filter(sku=sku).values_list(*FIELDS).first() or UNKNOWN
+        cache.set(_key(sku, generation, version), values, SKU_CACHE_TIMEOUT)
+        if _versions(sku) != (generation, version):
+            return values
+    _local.set(sku, values)
+    return values
+
+
+def get_product_by_sku(sku, active_only=True):
+    """
+    Product for a scanned SKU, served from this process' LRU, then the
+    shared cache, then the database. Only id, sku, name, price and
+    is_active are loaded; other fields are fetched on first access.
+    Raises Product.DoesNotExist like Product.objects.get(sku=...).
+    """
+    values = _lookup(sku)
+    if values == UNKNOWN or (active_only and not values[4]):
+        raise Product.DoesNotExist(f'Produk dengan SKU {sku} tidak ditemukan')
+    return Product.from_db('default', FIELDS, values)
+
+
+def invalidate_skus(skus=None):
+    """
+    Drop cached lookups for the given SKUs (by giving them a new version),
+    or for every SKU when skus is None. Product signals call this per save/delete; call it yourself after
+    bulk_create()/update() on products, which send no signals.
+    """
+    if skus is None:
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.set(GENERATION_KEY, 1, None)
+        _local.clear()
+        return
+    cache.set_many({_version_key(sku): uuid.uuid4().hex for sku in skus}, None)
+    for sku in skus:
+        _local.delete(sku)
+
+
+def sku_cache_stats():
+    """
+    Hit counters of this process' SKU lookups and the share served without
+    touching the product table
+    """
+    total = sum(_stats.values())
+    hits = _stats['local_hits'] + _stats['shared_hits']
+    return {**_stats, 'lookups': total, 'hit_rate': hits / total if total else 0.0}
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from master.search import install_search_index, invalidate_memory_index, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Recreate and refill the product search index (e.g. after a schema change to the product table)'
+
+    def handle(self, *args, **options):
+        install_search_index()
+        invalidate_memory_index()
+        self.stdout.write(self.style.SUCCESS(f'Indeks pencarian produk dibangun ulang (backend: {search_backend()})'))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('master', '0002_delete_supplier'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='idx_product_name'),
+        ),
+    ]
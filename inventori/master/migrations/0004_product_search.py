@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from master.search import install_search_index, remove_search_index
+
+
+def install(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def remove(apps, schema_editor):
+    remove_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('master', '0003_product_name_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, remove),
+    ]
@@ -34,6 +34,9 @@ class Product(models.Model):
     
     class Meta:
         db_table = 'product'
+        indexes = [
+            models.Index(fields=['name'], name='idx_product_name'),
+        ]
     
     def __str__(self):
         return f"{self.sku} - {self.name}"
@@ -0,0 +1,372 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import connection as default_connection, transaction, DatabaseError
+from django.db.models import Q
+
+from inventory.cache import get_available_qtys
+from .models import Product
+
+# Queries are split into terms; trigram indexes can only look up terms of
+# three characters or more, shorter ones are matched as name/SKU prefixes
+MIN_TERM_LENGTH = 3
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+        name, sku, content='product', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_search (rowid, name, sku) VALUES (NEW.id, NEW.name, NEW.sku);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN
+        INSERT INTO product_search (product_search, rowid, name, sku) VALUES ('delete', OLD.id, OLD.name, OLD.sku);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name, sku ON product BEGIN
+        INSERT INTO product_search (product_search, rowid, name, sku) VALUES ('delete', OLD.id, OLD.name, OLD.sku);
+        INSERT INTO product_search (rowid, name, sku) VALUES (NEW.id, NEW.name, NEW.sku);
+    END
+    """,
+    "INSERT INTO product_search (product_search) VALUES ('rebuild')",
+]
+SQLITE_REMOVE = [
+    'DROP TRIGGER IF EXISTS product_search_insert',
+    'DROP TRIGGER IF EXISTS product_search_delete',
+    'DROP TRIGGER IF EXISTS product_search_update',
+    'DROP TABLE IF EXISTS product_search',
+]
+
+POSTGRESQL_INSTALL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS idx_product_name_trgm ON product USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS idx_product_sku_trgm ON product USING gin (sku gin_trgm_ops)',
+]
+POSTGRESQL_REMOVE = [
+    'DROP INDEX IF EXISTS idx_product_name_trgm',
+    'DROP INDEX IF EXISTS idx_product_sku_trgm',
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_INSTALL, SQLITE_REMOVE),
+    'postgresql': (POSTGRESQL_INSTALL, POSTGRESQL_REMOVE),
+}
+
+# Best ranked matches kept per search before the stock joins and the final
+# ordering; the exact SKU match is always added on top of them
+SEARCH_CANDIDATES = 500
+
+# Ranked search with the warehouse stock and reservation joined in;
+# {conditions} holds the LIKE filters for short terms. The candidates are
+# the best ranked active matches plus the exact SKU match, which a broad
+# term could otherwise push past the candidate limit.
+SQLITE_SEARCH = """
+    WITH hits AS (
+        SELECT * FROM (
+            SELECT product_search.rowid AS id, product_search.rank AS score
+            FROM product_search JOIN product p ON p.id = product_search.rowid
+            WHERE product_search MATCH %s AND p.is_active{conditions}
+            ORDER BY product_search.rank
+            LIMIT %s
+        )
+        UNION
+        SELECT rowid, rank FROM product_search WHERE product_search MATCH %s AND sku = %s COLLATE NOCASE
+    )
+    SELECT p.id, p.name, p.sku, p.price, COALESCE(s.qty, 0), COALESCE(r.qty, 0)
+    FROM hits
+    JOIN product p ON p.id = hits.id
+    LEFT JOIN stock s ON s.product_id = p.id AND s.warehouse_id = %s
+    LEFT JOIN stock_reservation r ON r.product_id = p.id AND r.warehouse_id = %s
+    WHERE p.is_active{conditions}
+    ORDER BY p.sku = %s COLLATE NOCASE DESC, p.name LIKE %s ESCAPE '\\' DESC, hits.score
+    LIMIT %s
+"""
+POSTGRESQL_SEARCH = """
+    WITH hits AS (
+        (SELECT id FROM product WHERE is_active{conditions} ORDER BY similarity(name, %s) DESC LIMIT %s)
+        UNION
+        SELECT id FROM product WHERE is_active AND sku ILIKE %s{conditions}
+    )
+    SELECT p.id, p.name, p.sku, p.price, COALESCE(s.qty, 0), COALESCE(r.qty, 0)
+    FROM hits
+    JOIN product p ON p.id = hits.id
+    LEFT JOIN stock s ON s.product_id = p.id AND s.warehouse_id = %s
+    LEFT JOIN stock_reservation r ON r.product_id = p.id AND r.warehouse_id = %s
+    ORDER BY lower(p.sku) = %s DESC, p.name ILIKE %s DESC, similarity(p.name, %s) DESC
+    LIMIT %s
+"""
+
+
+def install_search_index(connection=None):
+    """
+    Create the product search index: an FTS5 trigram table kept in step by
+    triggers (SQLite) or pg_trgm GIN indexes (PostgreSQL)
+    """
+    connection = connection or default_connection
+    if connection.vendor not in STATEMENTS:
+        return
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for sql in STATEMENTS[connection.vendor][0]:
+                cursor.execute(sql)
+    except DatabaseError:
+        # SQLite without FTS5, or no permission to create pg_trgm:
+        # searches use the in-process index instead
+        pass
+    _backends.pop(connection.alias, None)
+
+
+def remove_search_index(connection=None):
+    """
+    Drop the product search index
+    """
+    connection = connection or default_connection
+    if connection.vendor not in STATEMENTS:
+        return
+    with connection.cursor() as cursor:
+        for sql in STATEMENTS[connection.vendor][1]:
+            cursor.execute(sql)
+    _backends.pop(connection.alias, None)
+
+
+# Search backend per database alias, detected once per process
+_backends = {}
+
+
+def search_backend(connection=None):
+    """
+    'fts5', 'trigram' or 'memory' (the in-process fallback)
+    """
+    connection = connection or default_connection
+    if connection.alias not in _backends:
+        backend = 'memory'
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search'")
+                if cursor.fetchone():
+                    backend = 'fts5'
+            elif connection.vendor == 'postgresql':
+                cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'idx_product_name_trgm'")
+                if cursor.fetchone():
+                    backend = 'trigram'
+        _backends[connection.alias] = backend
+    return _backends[connection.alias]
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    In-process trigram index over active product names and SKUs, used when
+    the database has no search index of its own. Terms of three characters
+    or more are looked up by trigram, shorter queries by name/SKU prefix.
+    """
+
+    def __init__(self, rows=()):
+        self.products = {}  # id: (name, sku, price, lowercase name, lowercase sku)
+        self.by_sku = {}
+        self.postings = defaultdict(set)
+        self.prefixes = []  # sorted (lowercase name or sku, id)
+        for row in rows:
+            self._add(*row)
+        self.prefixes.sort()
+
+    def _add(self, product_id, name, sku, price):
+        name_lower, sku_lower = name.lower(), sku.lower()
+        self.products[product_id] = (name, sku, price, name_lower, sku_lower)
+        self.by_sku[sku_lower] = product_id
+        for trigram in _trigrams(name_lower) | _trigrams(sku_lower):
+            self.postings[trigram].add(product_id)
+        self.prefixes.extend([(name_lower, product_id), (sku_lower, product_id)])
+
+    def update(self, product_id, name, sku, price, is_active=True):
+        """
+        Apply one saved product without rebuilding the index
+        """
+        self.discard(product_id)
+        if is_active:
+            self._add(product_id, name, sku, price)
+            self.prefixes.sort()
+
+    def discard(self, product_id):
+        entry = self.products.pop(product_id, None)
+        if entry is None:
+            return
+        name_lower, sku_lower = entry[3], entry[4]
+        self.by_sku.pop(sku_lower, None)
+        for trigram in _trigrams(name_lower) | _trigrams(sku_lower):
+            self.postings[trigram].discard(product_id)
+        for key in ((name_lower, product_id), (sku_lower, product_id)):
+            i = bisect_left(self.prefixes, key)
+            if i < len(self.prefixes) and self.prefixes[i] == key:
+                del self.prefixes[i]
+
+    def _candidates(self, terms):
+        long_terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+        if long_terms:
+            postings = sorted((self.postings.get(t, set()) for term in long_terms for t in _trigrams(term)), key=len)
+            candidates = set.intersection(*postings) if postings[0] else set()
+        else:
+            candidates = set()
+            for text, product_id in islice(self.prefixes, bisect_left(self.prefixes, (terms[0],)), None):
+                if not text.startswith(terms[0]) or len(candidates) >= SEARCH_CANDIDATES:
+                    break
+                candidates.add(product_id)
+        candidates = set(islice(candidates, SEARCH_CANDIDATES))
+        if terms[0] in self.by_sku:
+            candidates.add(self.by_sku[terms[0]])
+        return candidates, bool(long_terms)
+
+    def search(self, terms, limit):
+        """
+        Up to `limit` (id, name, sku, price) rows matching every term, ranked
+        like the database search: exact SKU, name prefix, then shortest name
+        """
+        candidates, by_trigram = self._candidates(terms)
+        matches = []
+        for product_id in candidates:
+            name, sku, price, name_lower, sku_lower = self.products[product_id]
+            if by_trigram:
+                matched = all(term in name_lower or term in sku_lower for term in terms)
+            else:
+                matched = all(name_lower.startswith(term) or sku_lower.startswith(term) for term in terms)
+            if matched:
+                matches.append(((sku_lower != terms[0], not name_lower.startswith(terms[0]), len(name), name_lower), product_id))
+        return [(product_id,) + self.products[product_id][:3] for _, product_id in heapq.nsmallest(limit, matches)]
+
+
+VERSION_KEY = 'product_search:version'
+_memory = {'index': None, 'version': None}
+_memory_lock = threading.Lock()
+
+
+def _memory_index():
+    version = cache.get(VERSION_KEY, 0)
+    with _memory_lock:
+        if _memory['index'] is None or _memory['version'] != version:
+            _memory['index'] = TrigramIndex(
+                Product.objects.filter(is_active=True).values_list('id', 'name', 'sku', 'price').iterator(chunk_size=5000)
+            )
+            _memory['version'] = version
+        return _memory['index']
+
+
+def _bump_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+        return 1
+
+
+def invalidate_memory_index():
+    """
+    Make every process rebuild its in-process index on its next search.
+    Call after bulk product changes, which send no model signals.
+    """
+    _bump_version()
+    _memory['index'] = None
+
+
+def refresh_product(product_id, fields=None):
+    """
+    Bring the in-process index up to date with one saved product
+    (fields = (name, sku, price, is_active)) or deleted one (fields=None).
+    This process updates its index in place; other processes see the new
+    version and rebuild theirs on their next search.
+    """
+    version = _bump_version()
+    with _memory_lock:
+        index = _memory['index']
+        if index is None:
+            return
+        if fields is None:
+            index.discard(product_id)
+        else:
+            index.update(product_id, *fields)
+        if _memory['version'] == version - 1:
+            _memory['version'] = version
+
+
+def _result(product_id, name, sku, price, stock_qty, reserved_qty):
+    return {
+        'id': product_id,
+        'name': name,
+        'sku': sku,
+        'price': float(price),
+        'stock': stock_qty,
+        'reserved': reserved_qty,
+        'available': max(stock_qty - reserved_qty, 0),
+    }
+
+
+def _with_quantities(rows, warehouse_id):
+    # Quantities for the in-process and short-query paths come from the stock cache
+    quantities = get_available_qtys([row[0] for row in rows], warehouse_id) if warehouse_id and rows else {}
+    return [_result(*row, *quantities.get(row[0], (0, 0, 0))[:2]) for row in rows]
+
+
+def search_products(query, warehouse_id=None, limit=10):
+    """
+    Active products matching every term of the query in their name or SKU,
+    best first (exact SKU, then name prefix, then relevance), each with its
+    stock, reserved and available quantity in the warehouse
+    """
+    terms = [term for term in re.split(r'\s+', query.strip().lower()) if term]
+    if not terms:
+        return []
+    long_terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    backend = search_backend()
+
+    if backend == 'memory':
+        return _with_quantities(_memory_index().search(terms, limit), warehouse_id)
+
+    if not long_terms:
+        # Nothing the trigram index can look up: prefix match, which stops at the limit
+        products = Product.objects.filter(is_active=True)
+        for term in terms:
+            products = products.filter(Q(name__istartswith=term) | Q(sku__istartswith=term))
+        rows = list(products.values_list('id', 'name', 'sku', 'price')[:limit])
+        return _with_quantities(rows, warehouse_id)
+
+    with default_connection.cursor() as cursor:
+        if backend == 'fts5':
+            match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in long_terms)
+            short_terms = [term for term in terms if len(term) < MIN_TERM_LENGTH]
+            conditions = " AND (p.name LIKE %s ESCAPE '\\' OR p.sku LIKE %s ESCAPE '\\')" * len(short_terms)
+            cursor.execute(SQLITE_SEARCH.format(conditions=conditions), [
+                match, *_like_patterns(short_terms), SEARCH_CANDIDATES, match, terms[0],
+                warehouse_id, warehouse_id,
+                *_like_patterns(short_terms),
+                terms[0], _escape_like(terms[0]) + '%', limit,
+            ])
+        else:
+            conditions = ' AND (name ILIKE %s OR sku ILIKE %s)' * len(terms)
+            cursor.execute(POSTGRESQL_SEARCH.format(conditions=conditions), [
+                *_like_patterns(terms), query, SEARCH_CANDIDATES,
+                _escape_like(terms[0]), *_like_patterns(terms),
+                warehouse_id, warehouse_id,
+                terms[0], _escape_like(terms[0]) + '%', query, limit,
+            ])
+        return [_result(*row) for row in cursor.fetchall()]
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _like_patterns(terms):
+    # Two patterns (name, SKU) per term
+    return [f'%{_escape_like(term)}%' for term in terms for _ in range(2)]
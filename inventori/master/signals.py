@@ -0,0 +1,37 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Product
+from .search import refresh_product
+from .cache import invalidate_skus
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_sku(sender, instance, update_fields=None, **kwargs):
+    # A changed SKU must drop the cached lookup of the old one as well
+    instance._previous_sku = None
+    if instance.pk and (update_fields is None or 'sku' in update_fields):
+        instance._previous_sku = Product.objects.filter(pk=instance.pk).values_list('sku', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def refresh_search_on_save(sender, instance, **kwargs):
+    fields = (instance.name, instance.sku, instance.price, instance.is_active)
+    transaction.on_commit(partial(refresh_product, instance.id, fields))
+
+
+@receiver(post_save, sender=Product)
+def invalidate_sku_on_save(sender, instance, **kwargs):
+    skus = {instance.sku, getattr(instance, '_previous_sku', None)} - {None}
+    transaction.on_commit(partial(invalidate_skus, skus))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_search_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(refresh_product, instance.id))
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_sku_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_skus, [instance.sku]))
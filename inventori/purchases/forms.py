@@ -2,6 +2,7 @@ from django import forms
 from .models import PurchaseOrder, POItem, GoodsReceipt
 from master.models import Product
 from inventory.models import Warehouse
+from inventory.sequences import validate_manual_number
 
 
 class PurchaseOrderForm(forms.ModelForm):
@@ -9,9 +10,17 @@ class PurchaseOrderForm(forms.ModelForm):
         model = PurchaseOrder
         fields = ['po_number', 'warehouse']
         widgets = {
-            'po_number': forms.TextInput(attrs={'class': 'form-control'}),
+            'po_number': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Otomatis'}),
             'warehouse': forms.Select(attrs={'class': 'form-control'}),
         }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Left empty, the number is assigned from its sequence when the document is saved
+        self.fields['po_number'].required = False
+    
+    def clean_po_number(self):
+        return validate_manual_number('PO', self.cleaned_data['po_number'])
 
 
 class POItemForm(forms.ModelForm):
@@ -48,7 +57,14 @@ class GoodsReceiptForm(forms.ModelForm):
         model = GoodsReceipt
         fields = ['grn_number', 'warehouse', 'purchase_order']
         widgets = {
-            'grn_number': forms.TextInput(attrs={'class': 'form-control'}),
+            'grn_number': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Otomatis'}),
             'warehouse': forms.Select(attrs={'class': 'form-control'}),
             'purchase_order': forms.Select(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['grn_number'].required = False
+    
+    def clean_grn_number(self):
+        return validate_manual_number('GRN', self.cleaned_data['grn_number'])
@@ -3,12 +3,14 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.db import transaction
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
 from .models import PurchaseOrder, POItem, GoodsReceipt
 from .forms import PurchaseOrderForm, POItemForm, GoodsReceiptForm
 from master.models import Product
+from master.cache import get_product_by_sku
 from inventory.models import Stock, StockMove
 from inventory.services import update_stock
+from inventory.sequences import next_number, validate_manual_number
 
 
 @login_required
@@ -30,15 +32,14 @@ def purchase_order_create(request):
     if request.method == 'POST':
         form = PurchaseOrderForm(request.POST)
         if form.is_valid():
-            po = form.save()
+            with transaction.atomic():
+                po = form.save(commit=False)
+                po.po_number = po.po_number or next_number('PO')
+                po.save()
             messages.success(request, f'Purchase Order {po.po_number} berhasil dibuat')
             return redirect('purchases:purchase_order_detail', pk=po.id)
     else:
-        # Generate new PO number
-        latest_po = PurchaseOrder.objects.order_by('-id').first()
-        next_number = 1 if not latest_po else latest_po.id + 1
-        po_number = f"PO-{next_number:06d}"
-        form = PurchaseOrderForm(initial={'po_number': po_number})
+        form = PurchaseOrderForm()
     
     return render(request, 'purchases/purchase_order_form.html', {'form': form})
 
@@ -73,7 +74,7 @@ def purchase_order_add_item(request, po_id):
             # Get product by SKU
             product_sku = request.POST.get('product_sku')
             try:
-                product = Product.objects.get(sku=product_sku, is_active=True)
+                product = get_product_by_sku(product_sku)
             except Product.DoesNotExist:
                 messages.error(request, f'Produk dengan SKU {product_sku} tidak ditemukan')
                 return redirect('purchases:purchase_order_add_item', po_id=po_id)
@@ -148,15 +149,14 @@ def goods_receipt_create(request):
     if request.method == 'POST':
         form = GoodsReceiptForm(request.POST)
         if form.is_valid():
-            grn = form.save()
+            with transaction.atomic():
+                grn = form.save(commit=False)
+                grn.grn_number = grn.grn_number or next_number('GRN')
+                grn.save()
             messages.success(request, f'Goods Receipt {grn.grn_number} berhasil dibuat')
             return redirect('purchases:goods_receipt_detail', pk=grn.id)
     else:
-        # Generate new GRN number
-        latest_grn = GoodsReceipt.objects.order_by('-id').first()
-        next_number = 1 if not latest_grn else latest_grn.id + 1
-        grn_number = f"GRN-{next_number:06d}"
-        form = GoodsReceiptForm(initial={'grn_number': grn_number})
+        form = GoodsReceiptForm()
     
     return render(request, 'purchases/goods_receipt_form.html', {'form': form})
 
@@ -183,7 +183,7 @@ def receive_purchase_order(request, po_id):
     
     if request.method == 'POST':
         # Create goods receipt
-        grn_number = request.POST.get('grn_number')
+        grn_number = request.POST.get('grn_number', '').strip()
         warehouse_id = request.POST.get('warehouse')
         
         # Validate warehouse
@@ -191,37 +191,40 @@ def receive_purchase_order(request, po_id):
             messages.error(request, 'Gudang pada GRN harus sama dengan gudang pada PO')
             return redirect('purchases:receive_purchase_order', po_id=po_id)
         
-        grn = GoodsReceipt.objects.create(
-            grn_number=grn_number,
-            purchase_order=po,
-            warehouse_id=warehouse_id
-        )
-        
-        # Update PO status
-        po.status = 'RECEIVED'
-        po.save()
+        try:
+            validate_manual_number('GRN', grn_number)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            return redirect('purchases:receive_purchase_order', po_id=po_id)
         
-        # Update stock for each item in the PO
-        for po_item in po.items.all():
-            update_stock(
-                product_id=po_item.product.id,
-                warehouse_id=po.warehouse.id,
-                qty_change=po_item.qty,
-                ref_type='GRN',
-                ref_id=grn.id
+        # The GRN, its number and the stock it brings in are saved together
+        with transaction.atomic():
+            grn = GoodsReceipt.objects.create(
+                grn_number=grn_number or next_number('GRN'),
+                purchase_order=po,
+                warehouse_id=warehouse_id
             )
+            
+            # Update PO status
+            po.status = 'RECEIVED'
+            po.save()
+            
+            # Update stock for each item in the PO, received at the PO price
+            for po_item in po.items.all():
+                update_stock(
+                    product_id=po_item.product.id,
+                    warehouse_id=po.warehouse.id,
+                    qty_change=po_item.qty,
+                    ref_type='GRN',
+                    ref_id=grn.id,
+                    unit_cost=po_item.price
+                )
         
         messages.success(request, f'Barang dari PO {po.po_number} berhasil diterima di GRN {grn.grn_number}')
         return redirect('purchases:goods_receipt_detail', pk=grn.id)
     
-    # Generate new GRN number
-    latest_grn = GoodsReceipt.objects.order_by('-id').first()
-    next_number = 1 if not latest_grn else latest_grn.id + 1
-    grn_number = f"GRN-{next_number:06d}"
-    
     context = {
         'po': po,
         'po_items': po.items.all().select_related('product'),
-        'grn_number': grn_number
     }
     return render(request, 'purchases/receive_purchase_order.html', context)
\ No newline at end of file
@@ -0,0 +1,288 @@
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from master.models import Product, Customer
+from master.cache import get_product_by_sku
+from inventory.models import Warehouse
+from inventory.cache import get_available_qty, get_available_qtys
+from inventory.services import apply_stock_changes, check_available, InsufficientStockError
+from inventory.sequences import next_number
+from .models import Sale, SaleItem
+from .services import CartError, cart_line, merge_scans, shortage_error
+
+
+def cache_cart_enabled():
+    """
+    Whether POS carts live in the cache until checkout (POS_CART_STORE='cache')
+    instead of as DRAFT Sale rows
+    """
+    return getattr(settings, 'POS_CART_STORE', 'database') == 'cache'
+
+
+# Seconds a cart change may hold the cart lock, and may wait for it
+CART_LOCK_TIMEOUT = 10
+CART_LOCK_WAIT = 3
+
+
+class CartLine:
+    """
+    One cart line, shaped like a SaleItem for the POS template and cart API
+    (its id is the product id)
+    """
+
+    def __init__(self, product_id, sku, name, price, qty):
+        self.id = self.product_id = product_id
+        self.product = Product(id=product_id, sku=sku, name=name, price=price)
+        self.price = price
+        self.qty = qty
+
+    def get_total(self):
+        return self.qty * self.price
+
+
+class CacheCart:
+    """
+    A cashier's cart held in the Django cache, keyed by user. Scans only
+    touch the cache; checkout() writes the Sale, its items and the stock
+    changes in one transaction. Carts that are never checked out expire
+    after POS_CART_TIMEOUT seconds without leaving rows behind.
+
+    Stock is not reserved while the cart is open (that would be a write
+    per scan again): adds are checked against the cached available
+    quantity and checkout checks the stock not reserved by draft sales.
+    
+    Every change holds a lock in the cache (cache.add) and rereads the cart
+    under it, so two tabs or terminals of one cashier do not overwrite each
+    other's scans.
+    """
+    id = None
+    status = 'DRAFT'
+
+    def __init__(self, user_id, data):
+        self.user_id = user_id
+        self.data = data
+
+    @staticmethod
+    def _key(user_id):
+        return f'pos_cart:{user_id}'
+
+    @classmethod
+    def load(cls, user):
+        """
+        The user's open cart, or None
+        """
+        data = cache.get(cls._key(user.id))
+        return cls(user.id, data) if data else None
+
+    @classmethod
+    def start(cls, user, warehouse, customer=None):
+        """
+        Open an empty cart for the user (replacing any open one)
+        """
+        cart = cls(user.id, {
+            'warehouse': (warehouse.id, warehouse.name),
+            'customer': (customer.id, customer.name) if customer else None,
+            'started_at': timezone.now(),
+            'lines': {},
+        })
+        cart.save()
+        return cart
+
+    def save(self):
+        cache.set(self._key(self.user_id), self.data, getattr(settings, 'POS_CART_TIMEOUT', 8 * 60 * 60))
+
+    def clear(self):
+        cache.delete(self._key(self.user_id))
+
+    @contextmanager
+    def _locked(self):
+        # Take the cart lock and reload the cart, so changes made elsewhere are kept
+        lock_key = f'{self._key(self.user_id)}:lock'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + CART_LOCK_WAIT
+        while not cache.add(lock_key, token, CART_LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise CartError('Keranjang sedang diubah di tab lain, silakan coba lagi')
+            time.sleep(0.01)
+        try:
+            data = cache.get(self._key(self.user_id))
+            if not data:
+                raise CartError('Tidak ada transaksi aktif')
+            self.data = data
+            yield
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    # Sale-like attributes used by the POS template
+    invoice_number = 'Keranjang baru'
+
+    @property
+    def warehouse_id(self):
+        return self.data['warehouse'][0]
+
+    @property
+    def warehouse(self):
+        return Warehouse(id=self.data['warehouse'][0], name=self.data['warehouse'][1])
+
+    @property
+    def customer(self):
+        customer = self.data['customer']
+        return Customer(id=customer[0], name=customer[1]) if customer else None
+
+    @property
+    def sold_at(self):
+        return self.data['started_at']
+
+    @property
+    def items(self):
+        return [
+            CartLine(product_id, sku, name, price, qty)
+            for product_id, (sku, name, price, qty) in self.data['lines'].items()
+        ]
+
+    @property
+    def total_amount(self):
+        return sum((line.get_total() for line in self.items), Decimal('0'))
+
+    def line(self, product_id):
+        sku, name, price, qty = self.data['lines'][product_id]
+        return CartLine(product_id, sku, name, price, qty)
+
+    def state(self):
+        """
+        The whole cart in the shape of sales.services.cart_state()
+        """
+        return {
+            'sale_id': None,
+            'invoice_number': self.invoice_number,
+            'items': [cart_line(line) for line in self.items],
+            'total_amount': float(self.total_amount),
+        }
+
+    def _check_available(self, product_id, name, qty):
+        available = get_available_qty(product_id, self.warehouse_id)[2]
+        if qty > available:
+            raise CartError(f'Stok {name} tidak mencukupi (tersedia {available})')
+
+    def add(self, sku, qty=1):
+        """
+        Add a product by SKU; scanning a product again adds to its line.
+        Returns the line.
+        """
+        if qty <= 0:
+            raise CartError('Jumlah harus lebih dari 0')
+        try:
+            product = get_product_by_sku(sku)
+        except Product.DoesNotExist:
+            raise CartError(f'Produk dengan SKU {sku} tidak ditemukan')
+
+        with self._locked():
+            current = self.data['lines'].get(product.id)
+            new_qty = (current[3] if current else 0) + qty
+            self._check_available(product.id, product.name, new_qty)
+            self.data['lines'][product.id] = (product.sku, product.name, product.price, new_qty)
+            self.save()
+        return self.line(product.id)
+
+    def add_batch(self, entries):
+        """
+        Add a batch of (sku, qty) scans with one product query and one stock
+        lookup; unknown SKUs are skipped. Returns (changed lines, unknown SKUs).
+        """
+        merged = merge_scans(entries)
+        products = {
+            product.sku: product
+            for product in Product.objects.filter(sku__in=merged, is_active=True).only('id', 'sku', 'name', 'price')
+        }
+        unknown = [sku for sku in merged if sku not in products]
+        with self._locked():
+            lines = self.data['lines']
+            new_qtys = {
+                product.id: (lines[product.id][3] if product.id in lines else 0) + merged[sku]
+                for sku, product in products.items()
+            }
+            available = get_available_qtys(list(new_qtys), self.warehouse_id) if new_qtys else {}
+            shortages = {
+                (product_id, self.warehouse_id): (available[product_id][2], qty)
+                for product_id, qty in new_qtys.items() if qty > available[product_id][2]
+            }
+            if shortages:
+                raise shortage_error(shortages, {product.id: product.name for product in products.values()})
+            
+            for product in products.values():
+                lines[product.id] = (product.sku, product.name, product.price, new_qtys[product.id])
+            self.save()
+        return [self.line(product_id) for product_id in new_qtys], unknown
+
+    def set_qty(self, product_id, qty):
+        """
+        Set the quantity of a line; 0 removes it. Returns the line or None.
+        """
+        if qty <= 0:
+            self.remove(product_id)
+            return None
+        with self._locked():
+            if product_id not in self.data['lines']:
+                raise CartError('Item tidak ditemukan di keranjang')
+            sku, name, price, _ = self.data['lines'][product_id]
+            self._check_available(product_id, name, qty)
+            self.data['lines'][product_id] = (sku, name, price, qty)
+            self.save()
+        return self.line(product_id)
+
+    def remove(self, product_id):
+        with self._locked():
+            if self.data['lines'].pop(product_id, None) is None:
+                raise CartError('Item tidak ditemukan di keranjang')
+            self.save()
+
+    def checkout(self, user, payment=None):
+        """
+        Materialize the cart as a PAID sale: one Sale insert, one SaleItem
+        bulk_create and one batch of stock changes. The stock must not be
+        reserved by draft sales, and the payment is checked against the
+        cart as it is under the lock. Returns the sale.
+        """
+        with self._locked():
+            if payment is not None and payment < self.total_amount:
+                raise CartError('Pembayaran tidak mencukupi')
+            sale = self._checkout(user)
+            self.clear()
+        return sale
+
+    def _checkout(self, user):
+        lines = self.items
+        if not lines:
+            raise CartError('Keranjang masih kosong')
+        try:
+            with transaction.atomic():
+                check_available(self.warehouse_id, {line.product_id: line.qty for line in lines})
+                sale = Sale.objects.create(
+                    invoice_number=next_number('INV'),
+                    customer_id=self.data['customer'][0] if self.data['customer'] else None,
+                    warehouse_id=self.warehouse_id,
+                    user=user,
+                    status='PAID',
+                    total_amount=self.total_amount
+                )
+                SaleItem.objects.bulk_create([
+                    SaleItem(sale=sale, product_id=line.product_id, qty=line.qty, price=line.price)
+                    for line in lines
+                ])
+                apply_stock_changes(
+                    [(line.product_id, self.warehouse_id, -line.qty) for line in lines],
+                    ref_type='SALE',
+                    ref_id=sale.id,
+                    strict=True
+                )
+        except InsufficientStockError as e:
+            raise shortage_error(e.shortages, {line.product_id: line.product.name for line in lines})
+        return sale
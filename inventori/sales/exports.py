@@ -0,0 +1,105 @@
+import csv
+from decimal import Decimal
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from django.conf import settings
+from django.utils import timezone
+from .models import SaleItem
+
+# Rows fetched per database round trip while exporting
+EXPORT_CHUNK_SIZE = getattr(settings, 'SALES_EXPORT_CHUNK_SIZE', 2000)
+
+SALE_HEADERS = ['No', 'Invoice', 'Tanggal', 'Customer', 'User / Kasir', 'Gudang', 'Total']
+ITEM_HEADERS = ['Invoice', 'Tanggal', 'SKU', 'Produk', 'Qty', 'Harga', 'Subtotal']
+
+
+def _date(value):
+    return timezone.localtime(value).strftime('%d/%m/%Y %H:%M')
+
+
+def iter_sale_rows(sales):
+    """
+    Stream the sales of a queryset as export rows (without the row number),
+    reading plain tuples in chunks instead of model instances
+    """
+    rows = sales.values_list(
+        'invoice_number', 'sold_at', 'customer__name', 'user__username', 'warehouse__name', 'total_amount'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for invoice_number, sold_at, customer, username, warehouse, total in rows:
+        yield [invoice_number, _date(sold_at), customer or '-', username or '-', warehouse, total]
+
+
+def iter_item_rows(sales):
+    """
+    Stream the lines of the sales of a queryset as export rows, newest sale first
+    """
+    rows = (
+        SaleItem.objects.filter(sale__in=sales.order_by().values('id'))
+        .order_by('-sale__sold_at', 'sale_id', 'id')
+        .values_list('sale__invoice_number', 'sale__sold_at', 'product__sku', 'product__name', 'qty', 'price')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for invoice_number, sold_at, sku, name, qty, price in rows:
+        yield [invoice_number, _date(sold_at), sku, name, qty, price, qty * price]
+
+
+def _bold(sheet, values):
+    cells = []
+    for value in values:
+        cell = None
+        if value is not None:
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.font = Font(bold=True)
+        cells.append(cell)
+    return cells
+
+
+def write_sales_xlsx(sales, fileobj, details=False):
+    """
+    Write the sales report workbook to fileobj with openpyxl write-only mode,
+    which keeps the rows in temporary files instead of memory. With details,
+    a second sheet lists every sale line.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Laporan Penjualan')
+    sheet.append(_bold(sheet, SALE_HEADERS))
+    total_revenue = Decimal('0')
+    for number, row in enumerate(iter_sale_rows(sales), 1):
+        total_revenue += row[-1]
+        sheet.append([number] + row[:-1] + [float(row[-1])])
+    sheet.append(_bold(sheet, [None] * 5 + ['GRAND TOTAL', float(total_revenue)]))
+
+    if details:
+        sheet = workbook.create_sheet('Detail Item')
+        sheet.append(_bold(sheet, ITEM_HEADERS))
+        for row in iter_item_rows(sales):
+            sheet.append(row[:5] + [float(row[5]), float(row[6])])
+    workbook.save(fileobj)
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def iter_sales_csv(sales, details=False):
+    """
+    Stream the sales report as CSV lines, one sale per row, or one sale line
+    per row with details. Starts with a BOM so Excel reads it as UTF-8.
+    """
+    writer = csv.writer(_Echo())
+    yield '\ufeff'
+    if details:
+        yield writer.writerow(ITEM_HEADERS)
+        for row in iter_item_rows(sales):
+            yield writer.writerow(row)
+        return
+
+    yield writer.writerow(SALE_HEADERS)
+    total_revenue = Decimal('0')
+    for number, row in enumerate(iter_sale_rows(sales), 1):
+        total_revenue += row[-1]
+        yield writer.writerow([number] + row)
+    yield writer.writerow([''] * 5 + ['GRAND TOTAL', total_revenue])
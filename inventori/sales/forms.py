@@ -40,4 +40,10 @@ class SaleItemForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Set initial values if editing
         if self.instance and self.instance.pk and self.instance.product:
-            self.fields['product_sku'].initial = self.instance.product.sku
\ No newline at end of file
+            self.fields['product_sku'].initial = self.instance.product.sku
+    
+    def clean_qty(self):
+        qty = self.cleaned_data['qty']
+        if qty <= 0:
+            raise forms.ValidationError('Jumlah harus lebih dari 0')
+        return qty
\ No newline at end of file
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from sales.models import Sale
+from sales.services import recalculate_sale_totals
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored sale totals from their lines and fix the ones that differ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', choices=[choice for choice, _ in Sale.STATUS_CHOICES], help='Only sales with this status')
+
+    def handle(self, *args, **options):
+        sales = Sale.objects.all()
+        if options['status']:
+            sales = sales.filter(status=options['status'])
+        count = recalculate_sale_totals(sales)
+        self.stdout.write(self.style.SUCCESS(f'{count} total transaksi diperbaiki dari item penjualan'))
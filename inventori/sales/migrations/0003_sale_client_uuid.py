@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0002_sale_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='client_uuid',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
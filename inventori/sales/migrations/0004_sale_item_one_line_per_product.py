@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:32
+
+from django.db import migrations, models
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    # Fold repeated lines of a product at the same price into its first line.
+    # Lines of one product at different prices stay apart, so every line
+    # still adds up to what the customer was charged.
+    SaleItem = apps.get_model('sales', 'SaleItem')
+    duplicates = list(
+        SaleItem.objects.values('sale_id', 'product_id', 'price')
+        .annotate(lines=models.Count('id'))
+        .filter(lines__gt=1)
+        .values_list('sale_id', 'product_id', 'price')
+        .order_by()
+    )
+    for sale_id, product_id, price in duplicates:
+        items = list(SaleItem.objects.filter(sale_id=sale_id, product_id=product_id, price=price).order_by('id'))
+        keep = items[0]
+        keep.qty = sum(item.qty for item in items)
+        keep.save(update_fields=['qty'])
+        SaleItem.objects.filter(id__in=[item.id for item in items[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('master', '0004_product_search'),
+        ('sales', '0003_sale_client_uuid'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='saleitem',
+            name='sale_item_sale_id_52da71_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='saleitem',
+            constraint=models.UniqueConstraint(fields=('sale', 'product', 'price'), name='uniq_sale_item_product_price'),
+        ),
+    ]
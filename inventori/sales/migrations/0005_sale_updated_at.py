@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:11
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_from_sold_at(apps, schema_editor):
+    # Existing drafts were last touched no later than they were started
+    Sale = apps.get_model('sales', 'Sale')
+    Sale.objects.update(updated_at=F('sold_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_sale_item_one_line_per_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(start_from_sold_at, migrations.RunPython.noop),
+    ]
@@ -22,6 +22,8 @@ class Sale(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='DRAFT')
     total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     sold_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # last cart change; abandoned drafts expire from here
+    client_uuid = models.UUIDField(null=True, blank=True, unique=True, editable=False)  # set by POS terminals syncing offline sales
     
     class Meta:
         db_table = 'sale'
@@ -44,8 +46,10 @@ class SaleItem(models.Model):
     
     class Meta:
         db_table = 'sale_item'
-        indexes = [
-            models.Index(fields=['sale_id', 'product_id']),
+        constraints = [
+            # One line per product; repeated scans increase its qty. The price is part
+            # of the key because older sales may hold a product at two prices.
+            models.UniqueConstraint(fields=['sale', 'product', 'price'], name='uniq_sale_item_product_price'),
         ]
     
     def __str__(self):
@@ -0,0 +1,463 @@
+import uuid
+from decimal import Decimal, InvalidOperation
+from django.db import transaction, IntegrityError
+from django.db.models import F, Case, When, Value, Sum, Subquery, OuterRef, DecimalField
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from master.models import Product, Customer
+from master.cache import get_product_by_sku
+from inventory.services import reserve_stock, reserve_stocks, release_stock, release_sale_reservations, update_stock, apply_stock_changes, InsufficientStockError
+from inventory.sequences import next_numbers
+from .models import Sale, SaleItem
+
+# Largest values a sale line and a sale total can store
+MAX_QTY = 2**31 - 1
+MAX_PRICE = Decimal('9999999999.99')
+MAX_TOTAL = Decimal('999999999999.99')
+
+
+class CartError(ValueError):
+    """
+    Raised when a cart change cannot be applied; the message is shown to the cashier
+    """
+
+
+def _locked_draft(sale_id):
+    # The sale row lock serializes cart changes, so the total is never read stale
+    try:
+        return Sale.objects.select_for_update().get(id=sale_id, status='DRAFT')
+    except Sale.DoesNotExist:
+        raise CartError('Transaksi draft tidak ditemukan')
+
+
+def _reserve(product, warehouse_id, qty):
+    try:
+        reserve_stock(product.id, warehouse_id, qty)
+    except InsufficientStockError as e:
+        available = e.shortages[(product.id, warehouse_id)][0]
+        raise CartError(f'Stok {product.name} tidak mencukupi (tersedia {available})')
+
+
+def cart_line(item):
+    """
+    JSON representation of one cart line
+    """
+    return {
+        'id': item.id,
+        'product_id': item.product_id,
+        'sku': item.product.sku,
+        'name': item.product.name,
+        'qty': item.qty,
+        'price': float(item.price),
+        'total': float(item.get_total()),
+    }
+
+
+def cart_state(sale):
+    """
+    The whole cart of a sale: its lines and total
+    """
+    items = sale.items.select_related('product').order_by('id')
+    return {
+        'sale_id': sale.id,
+        'invoice_number': sale.invoice_number,
+        'items': [cart_line(item) for item in items],
+        'total_amount': float(sale.total_amount),
+    }
+
+
+def add_to_line(sale, product, qty):
+    """
+    Add qty of a product to its line in the sale: an atomic qty increment
+    when the product is already in the sale, otherwise a new line at the
+    current price. Returns the line.
+    """
+    # Older sales may hold a product on lines at two prices; scans go to the first
+    line = SaleItem.objects.filter(id__in=SaleItem.objects.filter(sale=sale, product=product).order_by('id').values('id')[:1])
+    if not line.update(qty=F('qty') + qty):
+        try:
+            with transaction.atomic():
+                item = SaleItem.objects.create(sale=sale, product=product, qty=qty, price=product.price)
+                item.product = product
+                return item
+        except IntegrityError:
+            # Another request created the line first
+            line.update(qty=F('qty') + qty)
+    item = line.get()
+    item.product = product
+    return item
+
+
+def add_to_total(sale, amount):
+    """
+    Add amount (negative to subtract) to the stored total of a sale with an
+    atomic UPDATE ... SET total_amount = total_amount + amount, then reload
+    sale.total_amount. Safe on a stale or unlocked sale instance.
+    """
+    Sale.objects.filter(id=sale.id).update(total_amount=F('total_amount') + amount, updated_at=timezone.now())
+    sale.refresh_from_db(fields=['total_amount'])
+
+
+def recalculate_sale_totals(sales=None):
+    """
+    Rewrite the stored total of the given sales (all sales by default) from
+    their lines, SUM(qty * price) per sale, in one UPDATE. Only sales whose
+    total differs are written. Returns how many were corrected.
+    """
+    amount = DecimalField(max_digits=14, decimal_places=2)
+    line_total = Subquery(
+        SaleItem.objects.filter(sale=OuterRef('pk')).order_by().values('sale')
+        .annotate(total=Round(Sum(F('qty') * F('price'), output_field=amount), 2)).values('total'),
+        output_field=amount
+    )
+    computed = Coalesce(line_total, Value(Decimal('0')), output_field=amount)
+    wrong = (sales if sales is not None else Sale.objects.all()).annotate(computed=computed).exclude(total_amount=F('computed'))
+    return Sale.objects.filter(id__in=wrong.values('id')).update(total_amount=computed)
+
+
+def cart_add(sale_id, sku, qty=1):
+    """
+    Add a product (by SKU) to a DRAFT sale, reserving its stock.
+    Returns (sale, item).
+    """
+    if qty <= 0:
+        raise CartError('Jumlah harus lebih dari 0')
+    with transaction.atomic():
+        sale = _locked_draft(sale_id)
+        try:
+            product = get_product_by_sku(sku)
+        except Product.DoesNotExist:
+            raise CartError(f'Produk dengan SKU {sku} tidak ditemukan')
+
+        _reserve(product, sale.warehouse_id, qty)
+        item = add_to_line(sale, product, qty)
+
+        sale.total_amount += qty * item.price
+        sale.save(update_fields=['total_amount', 'updated_at'])
+    return sale, item
+
+
+def merge_scans(entries):
+    """
+    Sum a batch of (sku, qty) scans per SKU, keeping the scan order
+    """
+    merged = {}
+    for sku, qty in entries:
+        if qty <= 0:
+            raise CartError('Jumlah harus lebih dari 0')
+        merged[sku] = merged.get(sku, 0) + qty
+    return merged
+
+
+def shortage_error(shortages, names):
+    """
+    CartError naming every product of an InsufficientStockError
+    """
+    return CartError('Stok tidak mencukupi: ' + ', '.join(
+        f'{names[product_id]} (tersedia {available})'
+        for (product_id, _), (available, _) in shortages.items()
+    ))
+
+
+def cart_add_batch(sale_id, entries):
+    """
+    Add a batch of (sku, qty) scans to a DRAFT sale at once: SKUs are
+    resolved with one query, repeated SKUs and products already in the cart
+    are merged into one line, new lines are inserted with one bulk_create
+    and the stock is reserved in one pass. Unknown SKUs are skipped.
+    Returns (sale, changed items, unknown SKUs).
+    """
+    merged = merge_scans(entries)
+    with transaction.atomic():
+        sale = _locked_draft(sale_id)
+        products = {
+            product.sku: product
+            for product in Product.objects.filter(sku__in=merged, is_active=True).only('id', 'sku', 'name', 'price')
+        }
+        unknown = [sku for sku in merged if sku not in products]
+        quantities = {products[sku].id: qty for sku, qty in merged.items() if sku in products}
+        if not quantities:
+            return sale, [], unknown
+        
+        try:
+            reserve_stocks(sale.warehouse_id, quantities)
+        except InsufficientStockError as e:
+            raise shortage_error(e.shortages, {product.id: product.name for product in products.values()})
+        
+        # Products already in the cart get one atomic increment per line in a single UPDATE
+        # Newest first, so a product on two lines (older sales) maps to its first line
+        existing = {
+            item.product_id: item
+            for item in SaleItem.objects.filter(sale=sale, product_id__in=quantities).order_by('-id')
+        }
+        if existing:
+            SaleItem.objects.filter(id__in=[item.id for item in existing.values()]).update(qty=F('qty') + Case(
+                *[When(id=item.id, then=Value(quantities[item.product_id])) for item in existing.values()]
+            ))
+        to_create = []
+        for product in products.values():
+            qty = quantities[product.id]
+            if product.id in existing:
+                item = existing[product.id]
+                item.product = product
+                item.qty += qty
+            else:
+                item = SaleItem(sale=sale, product=product, qty=qty, price=product.price)
+                to_create.append(item)
+            sale.total_amount += qty * item.price
+        SaleItem.objects.bulk_create(to_create)
+        sale.save(update_fields=['total_amount', 'updated_at'])
+    return sale, list(existing.values()) + to_create, unknown
+
+
+def cart_update(sale_id, item_id, qty):
+    """
+    Set the quantity of a cart line, reserving or releasing the difference.
+    A quantity of 0 removes the line. Returns (sale, item or None).
+    """
+    if qty <= 0:
+        return cart_remove(sale_id, item_id), None
+    with transaction.atomic():
+        sale = _locked_draft(sale_id)
+        try:
+            item = SaleItem.objects.select_related('product').get(id=item_id, sale=sale)
+        except SaleItem.DoesNotExist:
+            raise CartError('Item tidak ditemukan di keranjang')
+
+        delta = qty - item.qty
+        if delta > 0:
+            _reserve(item.product, sale.warehouse_id, delta)
+        elif delta < 0:
+            release_stock([(item.product_id, sale.warehouse_id, -delta)])
+
+        item.qty = qty
+        item.save(update_fields=['qty'])
+        sale.total_amount += delta * item.price
+        sale.save(update_fields=['total_amount', 'updated_at'])
+    return sale, item
+
+
+def cart_remove(sale_id, item_id, missing_ok=False):
+    """
+    Remove a cart line and release its reservation. Returns the sale.
+    With missing_ok, a line that is already gone (e.g. a second submit of
+    the same form) leaves the sale unchanged instead of raising CartError.
+    """
+    with transaction.atomic():
+        sale = _locked_draft(sale_id)
+        try:
+            item = SaleItem.objects.select_for_update().get(id=item_id, sale=sale)
+        except SaleItem.DoesNotExist:
+            if missing_ok:
+                return sale
+            raise CartError('Item tidak ditemukan di keranjang')
+
+        release_stock([(item.product_id, sale.warehouse_id, item.qty)])
+        sale.total_amount -= item.get_total()
+        sale.save(update_fields=['total_amount', 'updated_at'])
+        item.delete()
+    return sale
+
+
+def complete_sale(sale_id, payment=None):
+    """
+    Mark a draft sale PAID and take its lines out of stock. The sale row is
+    locked and must still be a draft, so a resubmitted form cannot take the
+    stock out twice; the payment is checked against the locked total.
+    """
+    with transaction.atomic():
+        sale = _locked_draft(sale_id)
+        if payment is not None and payment < sale.total_amount:
+            raise CartError('Pembayaran tidak mencukupi')
+        # The reserved stock now leaves through update_stock
+        release_sale_reservations(sale)
+        sale.status = 'PAID'
+        sale.save(update_fields=['status'])
+        for item in sale.items.all():
+            update_stock(item.product_id, sale.warehouse_id, -item.qty, 'SALE', sale.id)
+    return sale
+
+
+def cancel_sale(sale_id):
+    """
+    Delete a draft sale and release its reservations; a sale already
+    completed is left alone
+    """
+    with transaction.atomic():
+        sale = _locked_draft(sale_id)
+        release_sale_reservations(sale)
+        sale.delete()
+    return sale
+
+
+def _parse_offline_sale(entry):
+    """
+    Validate the shape of one queued sale:
+    {"client_uuid", "items": [{"sku", "qty", "price"?}], "payment", "customer_id"?, "sold_at"?}
+    """
+    try:
+        sold_at = parse_datetime(entry['sold_at']) if entry.get('sold_at') else None
+        if sold_at is not None and timezone.is_naive(sold_at):
+            sold_at = timezone.make_aware(sold_at)
+        parsed = {
+            'client_uuid': uuid.UUID(str(entry['client_uuid'])),
+            'customer_id': int(entry['customer_id']) if entry.get('customer_id') else None,
+            'payment': Decimal(str(entry['payment'])),
+            'sold_at': sold_at,
+            'items': [
+                (
+                    str(line['sku']).strip(),
+                    int(line.get('qty', 1)),
+                    Decimal(str(line['price'])) if line.get('price') is not None else None,
+                )
+                for line in entry['items']
+            ],
+        }
+    except (KeyError, TypeError, ValueError, AttributeError, InvalidOperation):
+        raise CartError('Format data tidak valid')
+    if not parsed['items']:
+        raise CartError('Transaksi tanpa item')
+    if any(qty <= 0 for _, qty, _ in parsed['items']):
+        raise CartError('Jumlah harus lebih dari 0')
+    if any(qty > MAX_QTY for _, qty, _ in parsed['items']):
+        raise CartError('Jumlah terlalu besar')
+    prices = [price for _, _, price in parsed['items'] if price is not None]
+    # NaN and Infinity parse as Decimals but fail every comparison and save
+    if not all(amount.is_finite() for amount in prices + [parsed['payment']]):
+        raise CartError('Harga dan pembayaran harus berupa angka')
+    if any(price < 0 for price in prices):
+        raise CartError('Harga tidak boleh negatif')
+    if any(price > MAX_PRICE for price in prices):
+        raise CartError('Harga terlalu besar')
+    if parsed['payment'] < 0:
+        raise CartError('Pembayaran tidak boleh negatif')
+    return parsed
+
+
+def sync_offline_sales(entries, warehouse, user=None):
+    """
+    Record completed sales that a POS terminal queued while offline.
+    
+    Every sale carries a client UUID; one already stored is reported as a
+    duplicate instead of being written again, so a terminal can safely resend
+    a batch whose response it never received. SKUs and customers are
+    resolved with one query each, then all new sales are written with one
+    bulk_create per table and a single batch of stock changes (not strict:
+    the goods have already left the shop).
+    Returns one {"client_uuid", "status", "invoice_number" | "error"} dict per
+    entry, where status is 'created', 'duplicate' or 'rejected'.
+    """
+    results = []
+    pending = []
+    for entry in entries:
+        try:
+            sale = _parse_offline_sale(entry)
+        except CartError as e:
+            client_uuid = entry.get('client_uuid') if isinstance(entry, dict) else None
+            results.append({'client_uuid': client_uuid, 'status': 'rejected', 'error': str(e)})
+            continue
+        results.append({'client_uuid': str(sale['client_uuid'])})
+        pending.append((results[-1], sale))
+    
+    uuids = {sale['client_uuid'] for _, sale in pending}
+    stored = dict(Sale.objects.filter(client_uuid__in=uuids).values_list('client_uuid', 'invoice_number'))
+    products = {
+        sku: (product_id, price)
+        for sku, product_id, price in Product.objects.filter(
+            sku__in={line[0] for _, sale in pending for line in sale['items']}, is_active=True
+        ).values_list('sku', 'id', 'price')
+    }
+    customer_ids = {sale['customer_id'] for _, sale in pending if sale['customer_id']}
+    if customer_ids:
+        customer_ids = set(Customer.objects.filter(id__in=customer_ids).values_list('id', flat=True))
+    
+    to_create = []
+    first_of = {}
+    for result, sale in pending:
+        client_uuid = sale['client_uuid']
+        if client_uuid in stored or client_uuid in first_of:
+            result['status'] = 'duplicate'
+            continue
+        unknown = [sku for sku, _, _ in sale['items'] if sku not in products]
+        if unknown:
+            result.update(status='rejected', error=f'SKU tidak ditemukan: {", ".join(unknown)}')
+            continue
+        if sale['customer_id'] and sale['customer_id'] not in customer_ids:
+            result.update(status='rejected', error='Customer tidak ditemukan')
+            continue
+        # The terminal's price is what the customer paid; the catalogue price is the fallback.
+        # Repeated scans of a product are merged into its one line.
+        merged = {}
+        for sku, qty, price in sale['items']:
+            product_id, catalogue_price = products[sku]
+            price = catalogue_price if price is None else price
+            if merged.setdefault(product_id, [0, price])[1] != price:
+                result.update(status='rejected', error=f'Harga {sku} berbeda antar baris')
+                break
+            merged[product_id][0] += qty
+        if 'error' in result:
+            continue
+        lines = [(product_id, qty, price) for product_id, (qty, price) in merged.items()]
+        total = sum(qty * price for _, qty, price in lines)
+        if total > MAX_TOTAL:
+            result.update(status='rejected', error='Total transaksi terlalu besar')
+            continue
+        if sale['payment'] < total:
+            result.update(status='rejected', error='Pembayaran tidak mencukupi')
+            continue
+        result['status'] = 'created'
+        first_of[client_uuid] = result
+        to_create.append((result, sale, lines, total))
+    
+    if to_create:
+        try:
+            with transaction.atomic():
+                numbers = next_numbers('INV', len(to_create))
+                sales = Sale.objects.bulk_create([
+                    Sale(
+                        invoice_number=number,
+                        client_uuid=sale['client_uuid'],
+                        customer_id=sale['customer_id'],
+                        warehouse=warehouse,
+                        user=user,
+                        status='PAID',
+                        total_amount=total
+                    )
+                    for number, (_, sale, _, total) in zip(numbers, to_create)
+                ])
+                # sold_at is auto_now_add, so the terminal's own timestamps are written afterwards
+                backdated = []
+                for created, (_, sale, _, _) in zip(sales, to_create):
+                    if sale['sold_at']:
+                        created.sold_at = sale['sold_at']
+                        backdated.append(created)
+                Sale.objects.bulk_update(backdated, ['sold_at'], batch_size=500)
+                
+                SaleItem.objects.bulk_create([
+                    SaleItem(sale=created, product_id=product_id, qty=qty, price=price)
+                    for created, (_, _, lines, _) in zip(sales, to_create)
+                    for product_id, qty, price in lines
+                ], batch_size=500)
+                apply_stock_changes(
+                    [
+                        (product_id, warehouse.id, -qty, '', None, created.id)
+                        for created, (_, _, lines, _) in zip(sales, to_create)
+                        for product_id, qty, _ in lines
+                    ],
+                    ref_type='SALE'
+                )
+        except IntegrityError:
+            # A concurrent resend of the same batch stored some of these sales
+            # first; running again reports them as duplicates
+            if Sale.objects.filter(client_uuid__in=first_of.keys()).exists():
+                return sync_offline_sales(entries, warehouse, user)
+            raise
+        for created, (result, _, _, _) in zip(sales, to_create):
+            result['invoice_number'] = created.invoice_number
+    
+    stored.update((client_uuid, result['invoice_number']) for client_uuid, result in first_of.items())
+    for result, sale in pending:
+        if result['status'] == 'duplicate':
+            result['invoice_number'] = stored[sale['client_uuid']]
+    return results
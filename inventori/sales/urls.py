@@ -14,6 +14,21 @@ urlpatterns = [
     path('pos/<int:sale_id>/cancel/', views.pos_cancel_sale, name='pos_cancel'),
     path('pos/remove-item/<int:item_id>/', views.remove_sale_item, name='remove_sale_item'),
     
+    # JSON cart API used by the unified POS page (without sale_id: the cache cart)
+    path('pos/cart/', views.pos_cart, name='pos_cart'),
+    path('pos/cart/add/', views.pos_cart_add, name='pos_cart_add'),
+    path('pos/cart/add-batch/', views.pos_cart_add_batch, name='pos_cart_add_batch'),
+    path('pos/cart/items/<int:item_id>/', views.pos_cart_update, name='pos_cart_update'),
+    path('pos/cart/items/<int:item_id>/remove/', views.pos_cart_remove, name='pos_cart_remove'),
+    path('pos/<int:sale_id>/cart/', views.pos_cart, name='pos_cart'),
+    path('pos/<int:sale_id>/cart/add/', views.pos_cart_add, name='pos_cart_add'),
+    path('pos/<int:sale_id>/cart/add-batch/', views.pos_cart_add_batch, name='pos_cart_add_batch'),
+    path('pos/<int:sale_id>/cart/items/<int:item_id>/', views.pos_cart_update, name='pos_cart_update'),
+    path('pos/<int:sale_id>/cart/items/<int:item_id>/remove/', views.pos_cart_remove, name='pos_cart_remove'),
+    
+    # Batch sync of sales completed offline by POS terminals
+    path('pos/sync/', views.pos_sync, name='pos_sync'),
+    
     # AJAX endpoint for searching products
     path('ajax/search-product/', views.search_product_ajax, name='search_product_ajax'),
     
@@ -1,37 +1,46 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404, StreamingHttpResponse, FileResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.db import transaction
 from django.db.models import Q
+from django.urls import reverse
 from django.core.exceptions import PermissionDenied
 from .models import Sale, SaleItem
 from .forms import POSForm, SaleItemForm
+from .services import CartError, complete_sale, cancel_sale, cart_add, cart_add_batch, cart_update, cart_remove, cart_line, cart_state, sync_offline_sales
+from .cart import CacheCart, cache_cart_enabled
+from .exports import write_sales_xlsx, iter_sales_csv
 from master.models import Product
+from master.search import search_products
+from master.cache import get_product_by_sku
 from inventory.models import Stock, StockMove, Warehouse
-from inventory.services import update_stock
+from inventory.cache import get_available_qty
+from inventory.sequences import next_number
+import json
+import tempfile
 import uuid
 from datetime import datetime
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+
+
+def _payment(request):
+    # The amount paid as a Decimal, or None when the field is not a number
+    try:
+        payment = Decimal(request.POST.get('total_payment', '0'))
+    except InvalidOperation:
+        return None
+    return payment if payment.is_finite() else None
 
 
 def generate_unique_invoice_number():
     """
-    Generate a unique invoice number that doesn't conflict with existing ones
+    Next invoice number from the INV sequence; call inside the transaction
+    that saves the sale
     """
-    # Try timestamp-based approach first
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    invoice_number = f"INV-{timestamp}"
-    
-    # Check if this invoice number already exists
-    counter = 1
-    original_invoice_number = invoice_number
-    while Sale.objects.filter(invoice_number=invoice_number).exists():
-        invoice_number = f"{original_invoice_number}-{counter:03d}"
-        counter += 1
-    
-    return invoice_number
+    return next_number('INV')
 
 
 @login_required
@@ -62,6 +71,9 @@ def pos_unified(request, sale_id=None):
     if request.user.role not in ['cashier', 'manager', 'admin']:
         raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
     
+    if not sale_id and cache_cart_enabled():
+        return _pos_cache_cart(request)
+    
     if sale_id:
         # Continue existing sale
         sale = get_object_or_404(Sale, id=sale_id, status='DRAFT')
@@ -95,15 +107,13 @@ def pos_unified(request, sale_id=None):
                     messages.warning(request, f'Anda sudah memiliki transaksi draft untuk customer ini: {existing_draft.invoice_number}. Silakan lanjutkan transaksi tersebut.')
                     return redirect('sales:pos_unified', sale_id=existing_draft.id)
                 
-                # Generate unique invoice number
-                invoice_number = generate_unique_invoice_number()
-                
-                sale = form.save(commit=False)
-                sale.status = 'DRAFT'
-                sale.invoice_number = invoice_number
-                sale.warehouse = warehouse
-                sale.user = request.user
-                sale.save()
+                with transaction.atomic():
+                    sale = form.save(commit=False)
+                    sale.status = 'DRAFT'
+                    sale.invoice_number = generate_unique_invoice_number()
+                    sale.warehouse = warehouse
+                    sale.user = request.user
+                    sale.save()
                 messages.success(request, f'Transaksi dimulai dengan invoice: {sale.invoice_number}')
                 return redirect('sales:pos_unified', sale_id=sale.id)
                 
@@ -113,28 +123,21 @@ def pos_unified(request, sale_id=None):
                 messages.error(request, 'Tidak ada transaksi aktif')
                 return redirect('sales:pos_unified')
                 
-            product_sku = request.POST.get('product_sku')
-            qty = int(request.POST.get('qty', 1))
+            product_sku = request.POST.get('product_sku', '').strip()
+            try:
+                qty = int(request.POST.get('qty', 1))
+            except ValueError:
+                qty = 0
             
+            # Lock the draft, reserve the stock, add to the product's line and
+            # update the total in one transaction
             try:
-                product = Product.objects.get(sku=product_sku, is_active=True)
-            except Product.DoesNotExist:
-                messages.error(request, f'Produk dengan SKU {product_sku} tidak ditemukan')
+                sale, item = cart_add(sale.id, product_sku, qty)
+            except CartError as e:
+                messages.error(request, str(e))
                 return redirect('sales:pos_unified', sale_id=sale.id)
             
-            # Create sale item
-            item = SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                qty=qty,
-                price=product.price
-            )
-            
-            # Update total amount
-            sale.total_amount += item.get_total()
-            sale.save()
-            
-            messages.success(request, f'{item.qty} {product.name} ditambahkan ke keranjang')
+            messages.success(request, f'{qty} {item.product.name} ditambahkan ke keranjang')
             return redirect('sales:pos_unified', sale_id=sale.id)
             
         elif action == 'remove_item':
@@ -143,23 +146,29 @@ def pos_unified(request, sale_id=None):
                 messages.error(request, 'Tidak ada transaksi aktif')
                 return redirect('sales:pos_unified')
                 
-            item_id = request.POST.get('item_id')
-            item = get_object_or_404(SaleItem, id=item_id, sale=sale)
-            
-            # Update total amount
-            sale.total_amount -= item.get_total()
-            sale.save()
+            item_id = request.POST.get('item_id', '')
+            item = SaleItem.objects.filter(id=item_id, sale=sale).select_related('product').first() if item_id.isdigit() else None
+            if item is None:
+                # Already removed, e.g. by a second submit
+                return redirect('sales:pos_unified', sale_id=sale.id)
             
-            item.delete()
+            try:
+                cart_remove(sale.id, item.id, missing_ok=True)
+            except CartError as e:
+                messages.error(request, str(e))
+                return redirect('sales:pos_unified', sale_id=sale.id)
             messages.success(request, f'Item {item.product.name} dihapus dari keranjang')
             return redirect('sales:pos_unified', sale_id=sale.id)
             
         elif action == 'cancel_sale':
             # Cancel and delete sale
             if sale:
-                invoice_number = sale.invoice_number
-                sale.delete()
-                messages.success(request, f'Transaksi {invoice_number} dibatalkan')
+                try:
+                    cancel_sale(sale.id)
+                except CartError as e:
+                    messages.error(request, str(e))
+                    return redirect('sales:pos')
+                messages.success(request, f'Transaksi {sale.invoice_number} dibatalkan')
             return redirect('sales:pos')
             
         elif action == 'complete_sale':
@@ -168,20 +177,17 @@ def pos_unified(request, sale_id=None):
                 messages.error(request, 'Tidak ada transaksi aktif')
                 return redirect('sales:pos_unified')
                 
-            total_payment = Decimal(request.POST.get('total_payment', '0'))
-            
-            if total_payment < sale.total_amount:
-                messages.error(request, 'Pembayaran tidak mencukupi')
+            total_payment = _payment(request)
+            if total_payment is None:
+                messages.error(request, 'Jumlah pembayaran tidak valid')
                 return redirect('sales:pos_unified', sale_id=sale.id)
             
-            # Complete the sale
-            with transaction.atomic():
-                sale.status = 'PAID'
-                sale.save()
-                
-                # Update stock for each item
-                for item in sale.items.all():
-                    update_stock(item.product.id, sale.warehouse.id, -item.qty, 'SALE', sale.id)
+            # Complete the sale; a second submit finds it no longer a draft
+            try:
+                sale = complete_sale(sale.id, total_payment)
+            except CartError as e:
+                messages.error(request, str(e))
+                return redirect('sales:pos_unified', sale_id=sale.id)
             
             messages.success(request, f'Transaksi {sale.invoice_number} berhasil diselesaikan')
             return redirect('sales:pos_receipt', sale_id=sale.id)
@@ -189,7 +195,7 @@ def pos_unified(request, sale_id=None):
     # Get current items in the sale
     if sale:
         sale_items = SaleItem.objects.filter(sale=sale).select_related('product')
-        total_amount = sum(item.get_total() for item in sale_items)
+        total_amount = sale.total_amount
     else:
         sale_items = []
         total_amount = Decimal('0')
@@ -200,6 +206,95 @@ def pos_unified(request, sale_id=None):
         'total_amount': total_amount,
         'form': form,
         'draft_sales': Sale.objects.filter(status='DRAFT').exclude(id=sale.id if sale else None).order_by('-id') if sale else Sale.objects.filter(status='DRAFT').order_by('-id'),
+        'cart_urls': _cart_urls(sale.id) if sale else None,
+    }
+    return render(request, 'sales/pos_unified.html', context)
+
+
+def _cart_urls(sale_id=None):
+    # JSON cart endpoints for the page; item URLs carry 0 as the item id placeholder
+    args = [sale_id] if sale_id else []
+    return {
+        'add': reverse('sales:pos_cart_add', args=args),
+        'add_batch': reverse('sales:pos_cart_add_batch', args=args),
+        'update': reverse('sales:pos_cart_update', args=args + [0]),
+        'remove': reverse('sales:pos_cart_remove', args=args + [0]),
+    }
+
+
+def _pos_cache_cart(request):
+    """
+    Unified POS with the cart held in the cache (POS_CART_STORE='cache'):
+    nothing is written to the database until the sale is completed
+    """
+    cart = CacheCart.load(request.user)
+    form = POSForm()
+    
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        
+        if action == 'create_sale':
+            form = POSForm(request.POST)
+            if form.is_valid():
+                warehouse = Warehouse.objects.first()
+                if not warehouse:
+                    messages.error(request, 'Tidak ada gudang terdaftar di sistem. Silakan buat gudang terlebih dahulu.')
+                    return redirect('sales:pos_unified')
+                
+                CacheCart.start(request.user, warehouse, form.cleaned_data.get('customer'))
+                messages.success(request, 'Transaksi baru dimulai')
+                return redirect('sales:pos_unified')
+        
+        elif not cart:
+            messages.error(request, 'Tidak ada transaksi aktif')
+            return redirect('sales:pos_unified')
+        
+        elif action == 'add_item':
+            try:
+                line = cart.add(request.POST.get('product_sku', '').strip(), _posted_qty(request, 1))
+            except CartError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, f'{line.qty} {line.product.name} di keranjang')
+            return redirect('sales:pos_unified')
+        
+        elif action == 'remove_item':
+            try:
+                cart.remove(int(request.POST.get('item_id', 0)))
+            except (CartError, ValueError):
+                messages.error(request, 'Item tidak ditemukan di keranjang')
+            else:
+                messages.success(request, 'Item dihapus dari keranjang')
+            return redirect('sales:pos_unified')
+        
+        elif action == 'cancel_sale':
+            cart.clear()
+            messages.success(request, 'Transaksi dibatalkan')
+            return redirect('sales:pos')
+        
+        elif action == 'complete_sale':
+            total_payment = _payment(request)
+            if total_payment is None:
+                messages.error(request, 'Jumlah pembayaran tidak valid')
+                return redirect('sales:pos_unified')
+            
+            try:
+                sale = cart.checkout(request.user, total_payment)
+            except CartError as e:
+                messages.error(request, str(e))
+                return redirect('sales:pos_unified')
+            
+            messages.success(request, f'Transaksi {sale.invoice_number} berhasil diselesaikan')
+            return redirect('sales:pos_receipt', sale_id=sale.id)
+    
+    sale_items = cart.items if cart else []
+    context = {
+        'sale': cart,
+        'sale_items': sale_items,
+        'total_amount': sum((item.get_total() for item in sale_items), Decimal('0')),
+        'form': form,
+        'draft_sales': [],
+        'cart_urls': _cart_urls() if cart else None,
     }
     return render(request, 'sales/pos_unified.html', context)
 
@@ -219,7 +314,7 @@ def pos_receipt(request, sale_id):
     context = {
         'sale': sale,
         'sale_items': sale_items,
-        'total_amount': sum(item.get_total() for item in sale_items),
+        'total_amount': sale.total_amount,
     }
     return render(request, 'sales/pos_receipt.html', context)
 
@@ -240,7 +335,11 @@ def pos_cancel_sale(request, sale_id):
         messages.error(request, f'Penjualan dengan status {sale.get_status_display()} tidak dapat dibatalkan')
         return redirect('sales:pos_add_item', sale_id=sale.id)
     
-    sale.delete()
+    try:
+        cancel_sale(sale.id)
+    except CartError as e:
+        messages.error(request, str(e))
+        return redirect('sales:sale_detail', pk=sale.id)
     messages.success(request, f'Penjualan dibatalkan dan dihapus')
     return redirect('sales:pos')
 
@@ -261,40 +360,33 @@ def pos_add_item(request, sale_id):
         
         if action == 'cancel':
             # Delete the sale and all related items
-            sale.delete()
+            try:
+                cancel_sale(sale.id)
+            except CartError as e:
+                messages.error(request, str(e))
+                return redirect('sales:sale_detail', pk=sale.id)
             messages.success(request, f'Penjualan dibatalkan dan dihapus')
             return redirect('sales:pos')
         
         form = SaleItemForm(request.POST)
         if form.is_valid():
-            item = form.save(commit=False)
-            
-            # Get product by SKU
-            product_sku = request.POST.get('product_sku')
+            # Add to the product's line (one line per product) on the locked draft,
+            # reserving the stock and updating the total in the same transaction
+            qty = form.cleaned_data['qty']
             try:
-                product = Product.objects.get(sku=product_sku, is_active=True)
-            except Product.DoesNotExist:
-                messages.error(request, f'Produk dengan SKU {product_sku} tidak ditemukan')
+                sale, item = cart_add(sale_id, form.cleaned_data['product_sku'].strip(), qty)
+            except CartError as e:
+                messages.error(request, str(e))
                 return redirect('sales:pos_add_item', sale_id=sale_id)
             
-            # Set the product and price
-            item.product = product
-            item.price = product.price
-            item.sale = sale
-            item.save()
-            
-            # Update total amount
-            sale.total_amount += item.get_total()
-            sale.save()
-            
-            messages.success(request, f'{item.qty} {product.name} ditambahkan ke keranjang')
+            messages.success(request, f'{qty} {item.product.name} ditambahkan ke keranjang')
             return redirect('sales:pos_add_item', sale_id=sale_id)
     else:
         form = SaleItemForm()
     
     # Get current items in the sale
     sale_items = SaleItem.objects.filter(sale=sale).select_related('product')
-    total_amount = sum(item.get_total() for item in sale_items)
+    total_amount = sale.total_amount
     
     context = {
         'sale': sale,
@@ -321,25 +413,26 @@ def pos_complete_sale(request, sale_id):
         
         if action == 'cancel':
             # Delete the sale and all related items
-            sale.delete()
+            try:
+                cancel_sale(sale.id)
+            except CartError as e:
+                messages.error(request, str(e))
+                return redirect('sales:sale_detail', pk=sale.id)
             messages.success(request, f'Penjualan dibatalkan dan dihapus')
             return redirect('sales:pos')
         else:
-            with transaction.atomic():
-                # Change status to PAID
-                sale.status = 'PAID'
-                sale.save()
-                
-                # For each item in the sale, update stock and create stock moves
-                for item in sale.items.all():
-                    # Update stock
-                    update_stock(item.product.id, sale.warehouse.id, -item.qty, 'SALE', sale.id)
-                
+            # Change status to PAID and take the items out of stock, once
+            try:
+                sale = complete_sale(sale.id)
+            except CartError as e:
+                messages.error(request, str(e))
+                return redirect('sales:sale_detail', pk=sale.id)
+            
             messages.success(request, f'Penjualan {sale.invoice_number} berhasil diselesaikan')
             return redirect('sales:sale_detail', pk=sale.id)
     
     sale_items = SaleItem.objects.filter(sale=sale).select_related('product')
-    total_amount = sum(item.get_total() for item in sale_items)
+    total_amount = sale.total_amount
     
     context = {
         'sale': sale,
@@ -358,18 +451,197 @@ def remove_sale_item(request, item_id):
     if request.user.role not in ['cashier', 'manager', 'admin']:
         raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
         
-    item = get_object_or_404(SaleItem, id=item_id)
-    sale_id = item.sale.id
+    item = SaleItem.objects.filter(id=item_id).select_related('product').first()
+    if item is None:
+        # Already removed, e.g. by a second submit
+        return redirect('sales:pos')
+    
+    # Release the reservation and update the total on the locked draft
+    try:
+        cart_remove(item.sale_id, item.id)
+    except CartError as e:
+        messages.error(request, str(e))
+        return redirect('sales:pos_add_item', sale_id=item.sale_id)
     
-    # Update the total amount of the sale
-    sale = item.sale
-    sale.total_amount -= item.get_total()
-    sale.save()
+    messages.success(request, f'Item {item.product.name} dihapus dari keranjang')
+    return redirect('sales:pos_add_item', sale_id=item.sale_id)
+
+
+def _cart_response(sale, **changes):
+    # Only the changed line and the new total go back to the page
+    return JsonResponse({'success': True, 'total_amount': float(sale.total_amount), **changes})
+
+
+def _cart_error(error):
+    return JsonResponse({'success': False, 'error': str(error)}, status=400)
+
+
+def _cache_cart(request):
+    cart = CacheCart.load(request.user)
+    if cart is None:
+        raise CartError('Tidak ada transaksi aktif')
+    return cart
+
+
+def _posted_qty(request, default=None):
+    try:
+        return int(request.POST.get('qty', default))
+    except (TypeError, ValueError):
+        raise CartError('Jumlah tidak valid')
+
+
+@login_required
+def pos_cart(request, sale_id=None):
+    """
+    JSON cart of a DRAFT sale: lines and total
+    """
+    # Check if user has permission to access POS
+    if request.user.role not in ['cashier', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
     
-    item.delete()
+    if sale_id is None:
+        cart = CacheCart.load(request.user)
+        if cart is None:
+            raise Http404('Tidak ada transaksi aktif')
+        return JsonResponse({'success': True, **cart.state()})
     
-    messages.success(request, f'Item {item.product.name} dihapus dari keranjang')
-    return redirect('sales:pos_add_item', sale_id=sale_id)
+    sale = get_object_or_404(Sale, id=sale_id, status='DRAFT')
+    return JsonResponse({'success': True, **cart_state(sale)})
+
+
+@login_required
+@require_POST
+def pos_cart_add(request, sale_id=None):
+    """
+    JSON: add a product by SKU (sku, qty) to the cart
+    """
+    # Check if user has permission to access POS
+    if request.user.role not in ['cashier', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+    
+    try:
+        if sale_id is None:
+            sale = _cache_cart(request)
+            item = sale.add(request.POST.get('sku', '').strip(), _posted_qty(request, 1))
+        else:
+            sale, item = cart_add(sale_id, request.POST.get('sku', '').strip(), _posted_qty(request, 1))
+    except CartError as e:
+        return _cart_error(e)
+    return _cart_response(sale, item=cart_line(item))
+
+
+# Largest number of scans accepted in one batch add
+CART_BATCH_MAX_SCANS = 200
+
+
+@login_required
+@require_POST
+def pos_cart_add_batch(request, sale_id=None):
+    """
+    JSON: add a batch of queued scans to the cart in one request:
+    {"items": [{"sku": "...", "qty": 1}, ...]}
+    """
+    # Check if user has permission to access POS
+    if request.user.role not in ['cashier', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+    
+    try:
+        payload = json.loads(request.body)
+        entries = [(str(entry['sku']).strip(), int(entry.get('qty', 1))) for entry in payload['items']]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return _cart_error('Format data tidak valid')
+    if len(entries) > CART_BATCH_MAX_SCANS:
+        return _cart_error(f'Maksimal {CART_BATCH_MAX_SCANS} scan per permintaan')
+    
+    try:
+        if sale_id is None:
+            sale = _cache_cart(request)
+            items, unknown = sale.add_batch(entries)
+        else:
+            sale, items, unknown = cart_add_batch(sale_id, entries)
+    except CartError as e:
+        return _cart_error(e)
+    return _cart_response(sale, items=[cart_line(item) for item in items], unknown=unknown)
+
+
+@login_required
+@require_POST
+def pos_cart_update(request, item_id, sale_id=None):
+    """
+    JSON: set the quantity of a cart line (qty; 0 removes it)
+    """
+    # Check if user has permission to access POS
+    if request.user.role not in ['cashier', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+    
+    try:
+        if sale_id is None:
+            sale = _cache_cart(request)
+            item = sale.set_qty(item_id, _posted_qty(request))
+        else:
+            sale, item = cart_update(sale_id, item_id, _posted_qty(request))
+    except CartError as e:
+        return _cart_error(e)
+    if item is None:
+        return _cart_response(sale, removed_item_id=item_id)
+    return _cart_response(sale, item=cart_line(item))
+
+
+@login_required
+@require_POST
+def pos_cart_remove(request, item_id, sale_id=None):
+    """
+    JSON: remove a line from the cart
+    """
+    # Check if user has permission to access POS
+    if request.user.role not in ['cashier', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+    
+    try:
+        if sale_id is None:
+            sale = _cache_cart(request)
+            sale.remove(item_id)
+        else:
+            sale = cart_remove(sale_id, item_id)
+    except CartError as e:
+        return _cart_error(e)
+    return _cart_response(sale, removed_item_id=item_id)
+
+
+# Largest number of queued sales accepted in one sync request
+POS_SYNC_MAX_SALES = 500
+
+
+@login_required
+@require_POST
+def pos_sync(request):
+    """
+    JSON endpoint for POS terminals flushing sales completed while offline:
+    {"warehouse_id": 1, "sales": [{"client_uuid": "...", "payment": 50000,
+    "items": [{"sku": "...", "qty": 1, "price": 25000}], ...}, ...]}
+    Resending a sale with the same client_uuid is safe.
+    """
+    # Check if user has permission to access POS
+    if request.user.role not in ['cashier', 'manager', 'admin']:
+        raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
+    
+    try:
+        payload = json.loads(request.body)
+        entries = payload['sales']
+        warehouse_id = payload.get('warehouse_id')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Format data tidak valid'}, status=400)
+    if not isinstance(entries, list):
+        return JsonResponse({'success': False, 'error': 'Format data tidak valid'}, status=400)
+    if len(entries) > POS_SYNC_MAX_SALES:
+        return JsonResponse({'success': False, 'error': f'Maksimal {POS_SYNC_MAX_SALES} transaksi per sinkronisasi'}, status=400)
+    
+    warehouse = Warehouse.objects.filter(id=warehouse_id).first() if warehouse_id else Warehouse.objects.first()
+    if not warehouse:
+        return JsonResponse({'success': False, 'error': 'Gudang tidak ditemukan'}, status=400)
+    
+    results = sync_offline_sales(entries, warehouse, request.user)
+    return JsonResponse({'success': True, 'results': results})
 
 
 @login_required
@@ -384,54 +656,29 @@ def search_product_ajax(request):
         warehouse_id = request.GET.get('warehouse_id', '')
         search_by = request.GET.get('search_by', '')
 
-        # Mode 1: Search suggestions (by name or SKU)
+        # Mode 1: Search suggestions (by name or SKU), ranked by the product search index
         if search_query and search_by == 'name':
-            products = Product.objects.filter(
-                Q(name__icontains=search_query) | Q(sku__icontains=search_query),
-                is_active=True
-            )[:10]  # Limit to 10 results
-            
-            results = []
-            for product in products:
-                # Get stock for this product
-                stock_qty = 0
-                if warehouse_id:
-                    try:
-                        wh_id = int(warehouse_id)
-                        stock = Stock.objects.filter(product=product, warehouse_id=wh_id).first()
-                        stock_qty = stock.qty if stock else 0
-                    except (ValueError, TypeError):
-                        pass
-                
-                results.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'sku': product.sku,
-                    'price': float(product.price),
-                    'stock': stock_qty
-                })
+            try:
+                warehouse_id = int(warehouse_id) if warehouse_id else None
+            except (ValueError, TypeError):
+                warehouse_id = None
             
             return JsonResponse({
                 'success': True,
-                'products': results
+                'products': search_products(search_query, warehouse_id, limit=10)
             })
             
         # Mode 2: Exact SKU lookup (when user selects or scans)
         if sku:
             try:
-                product = Product.objects.get(sku=sku, is_active=True)
-                # Get the available stock
-                stock_qty = 0
+                product = get_product_by_sku(sku)
+                # Get the stock, what open drafts hold and what is left to sell
+                stock_qty = reserved_qty = available_qty = 0
                 if warehouse_id:
                     try:
-                        warehouse_id = int(warehouse_id)
-                        stock = Stock.objects.filter(
-                            product=product,
-                            warehouse_id=warehouse_id
-                        ).first()
-                        stock_qty = stock.qty if stock else 0
+                        stock_qty, reserved_qty, available_qty = get_available_qty(product.id, int(warehouse_id))
                     except (ValueError, TypeError):
-                        stock_qty = 0
+                        pass
                 
                 return JsonResponse({
                     'success': True,
@@ -439,6 +686,8 @@ def search_product_ajax(request):
                     'name': product.name,
                     'price': float(product.price),
                     'stock': stock_qty,
+                    'reserved': reserved_qty,
+                    'available': available_qty,
                     'sku': product.sku
                 })
             except Product.DoesNotExist:
@@ -496,15 +745,14 @@ def sale_list(request):
 
 
 from django.contrib.auth import get_user_model
-import openpyxl
-from django.http import HttpResponse
 
 User = get_user_model()
 
 @login_required
 def export_sales_excel(request):
     """
-    Export sales report to Excel with filtering
+    Export sales report to Excel (or CSV with format=csv) with filtering;
+    detail=1 adds the sale lines
     """
     if request.user.role not in ['manager', 'admin']:
         raise PermissionDenied("Anda tidak memiliki akses ke fitur ini.")
@@ -513,7 +761,7 @@ def export_sales_excel(request):
     end_date_param = request.GET.get('end_date')
     user_id = request.GET.get('user_id')
     
-    sales = Sale.objects.filter(status='PAID').select_related('customer', 'user', 'warehouse').order_by('-sold_at')
+    sales = Sale.objects.filter(status='PAID').order_by('-sold_at')
     
     if start_date_param:
         try:
@@ -532,44 +780,25 @@ def export_sales_excel(request):
     if user_id:
         sales = sales.filter(user_id=user_id)
         
-    # Create Excel workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Laporan Penjualan"
-    
-    # Header
-    headers = ['No', 'Invoice', 'Tanggal', 'Customer', 'User / Kasir', 'Gudang', 'Total']
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num)
-        cell.value = header
-        cell.font = openpyxl.styles.Font(bold=True)
-    
-    # Data
-    total_revenue = 0
-    for row_num, sale in enumerate(sales, 2):
-        ws.cell(row=row_num, column=1).value = row_num - 1
-        ws.cell(row=row_num, column=2).value = sale.invoice_number
-        ws.cell(row=row_num, column=3).value = sale.sold_at.strftime('%d/%m/%Y %H:%M')
-        ws.cell(row=row_num, column=4).value = sale.customer.name if sale.customer else "-"
-        ws.cell(row=row_num, column=5).value = sale.user.username if sale.user else "-"
-        ws.cell(row=row_num, column=6).value = sale.warehouse.name
-        ws.cell(row=row_num, column=7).value = float(sale.total_amount)
-        total_revenue += sale.total_amount
-        
-    # Footer (Total)
-    last_row = len(sales) + 2
-    ws.cell(row=last_row, column=6).value = "GRAND TOTAL"
-    ws.cell(row=last_row, column=6).font = openpyxl.styles.Font(bold=True)
-    ws.cell(row=last_row, column=7).value = float(total_revenue)
-    ws.cell(row=last_row, column=7).font = openpyxl.styles.Font(bold=True)
-    
-    # Response
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    filename = f"Laporan_Penjualan_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    wb.save(response)
-    return response
+    details = request.GET.get('detail') == '1'
+    filename = f"Laporan_Penjualan_{datetime.now().strftime('%Y%m%d_%H%M')}"
+    
+    if request.GET.get('format') == 'csv':
+        response = StreamingHttpResponse(iter_sales_csv(sales, details), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        return response
+    
+    # An XLSX file is a zip archive that is only complete once every row is
+    # written, so it is built in a temporary file and then streamed from disk
+    workbook_file = tempfile.TemporaryFile()
+    write_sales_xlsx(sales, workbook_file, details)
+    workbook_file.seek(0)
+    return FileResponse(
+        workbook_file,
+        as_attachment=True,
+        filename=f'{filename}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
 
 @login_required
 def sale_report(request):
@@ -584,7 +813,7 @@ def sale_report(request):
     end_date_param = request.GET.get('end_date')
     user_id = request.GET.get('user_id')
     
-    sales = Sale.objects.filter(status='PAID').select_related('customer', 'user', 'warehouse').order_by('-sold_at')
+    sales = Sale.objects.filter(status='PAID').order_by('-sold_at')
     
     if start_date_param:
         try:
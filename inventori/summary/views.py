@@ -5,6 +5,7 @@ from django.http import JsonResponse
 from django.core.exceptions import PermissionDenied
 from sales.models import Sale, SaleItem
 from inventory.models import Stock, ReorderPolicy
+from inventory.valuation import inventory_value as get_inventory_value
 from purchases.models import PurchaseOrder
 from mining.models import AssociationRule
 from master.models import Product
@@ -106,9 +107,7 @@ def dashboard(request):
     sales_month_change = _calculate_percentage_change(sales_month, sales_previous_month)
     
     # Inventory value
-    inventory_value = Stock.objects.select_related('product').aggregate(
-        total=Sum(F('qty') * F('product__price'))
-    )['total'] or 0
+    inventory_value = get_inventory_value()
     total_products = Product.objects.count()
     
     # Low stock items